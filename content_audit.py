@@ -0,0 +1,269 @@
+# content_audit.py
+# Офлайн-аудит текстов курса: длина, разметка и вес каждого исходящего сообщения на всех языках.
+#
+#   python content_audit.py                                 # все языки: проблемы + вес прогона курса
+#   python content_audit.py --lang en --steps               # один язык и таблица по шагам
+#   python content_audit.py --budget-kb 3000 --budget-calls 150   # код выхода 1, если прогон тяжелее
+#
+# Тексты не выдираются из кода регулярками: курс проходится через flow_check (фейковый Bot API), и
+# проверяется ровно то, что ушло бы в Telegram, — с parse_mode, подставленным именем и переводом.
+# Лимиты Telegram считаются после разбора разметки и в UTF-16: подпись — 1024, сообщение — 4096.
+# Ошибка разметки в проде — это 400 от Bot API, а у картинок ещё и запасная отправка текстом:
+# лишний вызов и сообщение без картинки.
+#
+# Вес прогона — один стажёр проходит курс по первой кнопке каждого шага. «Запросы» — байты от бота
+# к Bot API (с загрузками файлов), «стажёру» — текст и медиа, которые скачает клиент Telegram.
+import argparse
+import asyncio
+import itertools
+import re
+import sys
+from collections import defaultdict
+from html.parser import HTMLParser
+
+import flow_check
+
+CAPTION_LIMIT = 1024
+TEXT_LIMIT = 4096
+NEAR_LIMIT = 0.9  # доля лимита, после которой предупреждаем
+MEDIA_FIELDS = ("photo", "video", "document", "animation")
+RUN_LIMIT = 300  # апдейтов в линейном прогоне; больше — кнопки зациклились
+
+# теги, которые понимает Bot API в parse_mode=HTML
+HTML_TAGS = {"b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "span", "tg-spoiler", "a", "tg-emoji",
+             "code", "pre", "blockquote"}
+HTML_BAD_AMP = re.compile(r"&(?!(?:lt|gt|amp|quot|#\d+|#x[0-9a-fA-F]+);)")
+HTML_BAD_LT = re.compile(r"<(?![a-zA-Z/])")
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\(([^)]*)\)")
+
+
+def utf16_len(text: str) -> int:
+    """Telegram меряет длину в UTF-16: эмодзи вне BMP — два символа."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class HTMLCheck(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack, self.errors, self.text = [], [], []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in HTML_TAGS:
+            self.errors.append(f"тег <{tag}> Telegram не поддерживает")
+            return
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in HTML_TAGS:
+            return  # уже отмечен в handle_starttag
+        if not self.stack or self.stack[-1] != tag:
+            self.errors.append(f"</{tag}> не закрывает открытый тег ({self.stack[-1] if self.stack else 'нет'})")
+            if tag in self.stack:
+                del self.stack[len(self.stack) - 1 - self.stack[::-1].index(tag):]
+            return
+        self.stack.pop()
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+
+def parse_html(source: str) -> tuple:
+    """(видимый текст, ошибки) для parse_mode=HTML."""
+    parser = HTMLCheck()
+    parser.feed(source)
+    parser.close()
+    errors = parser.errors + [f"тег <{tag}> не закрыт" for tag in parser.stack]
+    if HTML_BAD_AMP.search(source):
+        errors.append("неэкранированный & (нужно &amp;)")
+    if HTML_BAD_LT.search(source):
+        errors.append("неэкранированный < (нужно &lt;)")
+    return "".join(parser.text), errors
+
+
+def parse_markdown(source: str) -> tuple:
+    """(видимый текст, ошибки) для устаревшего parse_mode=Markdown: *жирный*, _курсив_, `код`, [текст](url)."""
+    text, errors, i = [], [], 0
+    while i < len(source):
+        char = source[i]
+        if char == "\\" and source[i + 1:i + 2] in ("_", "*", "`", "["):
+            text.append(source[i + 1])
+            i += 2
+        elif char == "[":
+            link = MARKDOWN_LINK.match(source, i)
+            if not link:
+                errors.append(f"[ без ](url) на позиции {i} — экранируй \\[")
+                text.append(char)
+                i += 1
+                continue
+            text.append(link.group(1))
+            i = link.end()
+        elif char in "*_`":
+            marker = "```" if source.startswith("```", i) else char
+            end = source.find(marker, i + len(marker))
+            if end < 0:
+                errors.append(f"{marker} на позиции {i} не закрыт — экранируй \\{char}")
+                text.append(source[i:])
+                break
+            text.append(source[i + len(marker):end])
+            i = end + len(marker)
+        else:
+            text.append(char)
+            i += 1
+    return "".join(text), errors
+
+
+def check_message(method: str, fields: dict) -> tuple:
+    """(что проверяли, видимая длина, лимит, ошибки) для одного исходящего вызова; None — текста нет."""
+    if method == "sendMessage":
+        source, limit = fields.get("text", ""), TEXT_LIMIT
+    elif "caption" in fields:
+        source, limit = fields["caption"], CAPTION_LIMIT
+    else:
+        return None
+    parse_mode = (fields.get("parse_mode") or "").lower()
+    if parse_mode == "html":
+        visible, errors = parse_html(source)
+    elif parse_mode == "markdown":
+        visible, errors = parse_markdown(source)
+    elif parse_mode:
+        visible, errors = source, [f"parse_mode={parse_mode} аудитом не проверяется"]
+    else:
+        visible, errors = source, []
+    length = utf16_len(visible)
+    if length > limit:
+        errors.append(f"{length} символов — больше лимита {limit}")
+    return source, length, limit, errors
+
+
+class CourseAudit(flow_check.FlowCheck):
+    def __init__(self, tb, api):
+        super().__init__(tb, api)
+        self.messages = {}  # (язык, метод, текст) -> (шаг, длина, лимит, ошибки)
+        self.users = itertools.count(5000)
+        self.step = None
+
+    async def send(self, key: str, update: dict) -> list:
+        calls = await super().send(key, update)
+        for method, fields, _, _ in calls:
+            checked = check_message(method, fields)
+            if checked:
+                source, length, limit, errors = checked
+                self.messages.setdefault((self.language, method, source), (key, length, limit, errors))
+        return calls
+
+    def media_bytes(self, fields: dict, files: dict) -> int:
+        """Сколько медиа скачает стажёр: у загрузки имя файла в запросе, у повторной — в file_id фейкового API."""
+        total = 0
+        for field in MEDIA_FIELDS:
+            name = files.get(field) or (fields.get(field) or "").partition(":")[2]
+            if name:
+                path = self.tb.media_path(name, self.tb.TENANTS[0])
+                total += path.stat().st_size if path.exists() else 0
+        return total
+
+    async def linear_run(self) -> dict:
+        """Один стажёр от /start до конца по первой кнопке; вес и вызовы по шагам."""
+        tb, user_id = self.tb, next(self.users)
+        steps = defaultdict(lambda: {"calls": 0, "request": 0, "uploads": 0, "trainee": 0})
+
+        async def step(key, update):
+            calls = await self.send(key, update)
+            stats = steps[key]
+            for method, fields, files, size in calls:
+                stats["calls"] += 1
+                stats["request"] += size
+                stats["uploads"] += len(files)
+                stats["trainee"] += self.media_bytes(fields, files) + len(
+                    (fields.get("text") or fields.get("caption") or "").encode())
+            keyboards = [flow_check.buttons(fields) for _, fields, _, _ in calls]
+            return next((data for data in reversed(keyboards) if data), None)
+
+        keyboard = await step("/start", self.message(user_id, "/start"))
+        for _ in range(RUN_LIMIT):
+            state = await self.state(user_id)
+            if state in tb.STATE_PROMPTS and state != tb.Form.waiting_for_onlyfans.state:
+                text = flow_check.NAME_ANSWER if state == tb.Form.waiting_for_name.state else flow_check.TEXT_ANSWER
+                keyboard = await step(f"text:{state}", self.message(user_id, text)) or keyboard
+                continue
+            if not keyboard:
+                break
+            name, _ = tb.decode_callback(keyboard[0])
+            keyboard = await step(name, self.callback(user_id, keyboard[0]))
+        else:
+            self.problems.append(f"линейный прогон ({self.language}) не закончился за {RUN_LIMIT} апдейтов")
+        return steps
+
+
+def totals(steps: dict) -> dict:
+    return {metric: sum(stats[metric] for stats in steps.values()) for metric in ("calls", "request", "uploads", "trainee")}
+
+
+def kb(size: int) -> str:
+    return f"{size / 1024:,.1f} КБ"
+
+
+async def audit(tb, api, languages: list) -> tuple:
+    check = CourseAudit(tb, api)
+    check.install()
+    runs = []
+    for number, language in enumerate(languages):
+        check.language = language
+        if number == 0:
+            runs.append((language, "первый стажёр, с загрузкой медиа", await check.linear_run()))
+        runs.append((language, "следующие, медиа по file_id", await check.linear_run()))
+        # обход всех веток — чтобы проверить и тексты, не попавшие в линейный прогон
+        await check.walk(next(check.users), pick_last=False)
+        await check.walk(next(check.users), pick_last=True)
+    await asyncio.sleep(0.1)
+    tb.AnswerScreener.shutdown()
+    await (await tb.TENANTS[0].bot.get_session()).close()
+    return check, runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Аудит длины, разметки и веса сообщений курса")
+    parser.add_argument("--lang", action="append", help="язык (можно несколько); по умолчанию — все каталоги")
+    parser.add_argument("--steps", action="store_true", help="таблица веса по шагам (прогон по file_id)")
+    parser.add_argument("--budget-kb", type=float, help="максимум КБ стажёру за прогон курса")
+    parser.add_argument("--budget-calls", type=int, help="максимум вызовов Bot API за прогон курса")
+    args = parser.parse_args()
+
+    tb = flow_check.load_bot()
+    languages = args.lang or [tb.SOURCE_LOCALE, *sorted(set(tb.CATALOGS) - {tb.SOURCE_LOCALE})]
+    check, runs = asyncio.run(audit(tb, flow_check.FakeBotAPI(), languages))
+
+    failed = bool(check.errors)
+    for message in check.errors:
+        print(f"❌ ошибка в логе: {message}")
+    for (language, method, source), (step, length, limit, errors) in sorted(check.messages.items(),
+                                                                             key=lambda item: item[1][0]):
+        preview = source[:60].replace("\n", " ")
+        for error in errors:
+            failed = True
+            print(f"❌ [{language}] {step} {method}: {error} — «{preview}…»")
+        if not errors and length > limit * NEAR_LIMIT:
+            print(f"⚠️  [{language}] {step} {method}: {length}/{limit} символов — почти лимит — «{preview}…»")
+    print(f"Проверено сообщений: {len(check.messages)} ({', '.join(languages)})")
+
+    for language, title, steps in runs:
+        total = totals(steps)
+        print(f"Прогон курса [{language}, {title}]: шагов {len(steps)}, вызовов API {total['calls']}, "
+              f"загрузок {total['uploads']}, запросы {kb(total['request'])}, стажёру {kb(total['trainee'])}")
+        if args.budget_calls is not None and total["calls"] > args.budget_calls:
+            failed = True
+            print(f"❌ вызовов {total['calls']} > бюджета {args.budget_calls}")
+        if args.budget_kb is not None and total["trainee"] > args.budget_kb * 1024:
+            failed = True
+            print(f"❌ {kb(total['trainee'])} стажёру > бюджета {args.budget_kb:,.0f} КБ")
+
+    if args.steps:
+        language, title, steps = runs[1]
+        print(f"\nПо шагам [{language}, {title}]:")
+        print(f"{'шаг':<40} {'вызовов':>8} {'запросы':>12} {'стажёру':>12}")
+        for key, stats in sorted(steps.items(), key=lambda item: item[1]["trainee"], reverse=True):
+            print(f"{key[:40]:<40} {stats['calls']:>8} {kb(stats['request']):>12} {kb(stats['trainee']):>12}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+# flow_check.py
+# Сквозная проверка курса перед деплоем: от /start до последнего вопроса квиза — без Telegram и без токена.
+#
+#   python flow_check.py              # пройти все кнопки и состояния, сверить с бюджетами flow_budgets.json
+#   python flow_check.py --verbose    # + таблица по шагам
+#   python flow_check.py --record     # записать текущие показатели как новые бюджеты
+#
+# Бот работает как в проде (CourseBot, middleware, FSM, кеш медиа), но Bot API — локальный aiohttp-сервер
+# в отдельном потоке: отвечает правдоподобными объектами и записывает каждый вызов вместе с загрузками.
+# Стажёры-боты обходят граф кнопок в глубину (один берёт первую кнопку, другой — последнюю, так покрываются
+# обе ветки развилок), на вопросы отвечают текстом. Паузы курса (pause) не ждутся: латентность шага —
+# чистая работа хендлера. Апдейты вебхука (второй тенант, остановка посреди апдейта) идут через настоящее
+# aiohttp-приложение бота. Запуск — во временной папке, results/ прода не трогаем. Код выхода 1 — есть проблемы.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from aiohttp import ClientError, web
+from aiohttp.test_utils import TestClient, TestServer
+
+REPO = Path(__file__).resolve().parent
+BUDGETS_FILE = REPO / "flow_budgets.json"
+
+MAX_UPDATES = 500  # на одного стажёра; больше — значит, кнопки зациклились
+LATENCY_HEADROOM = 3  # --record: бюджет латентности = max(LATENCY_FLOOR_MS, наблюдаемая × запас)
+LATENCY_FLOOR_MS = 50
+NAME_ANSWER = "Аня"
+TEXT_ANSWER = "Записываю балансы в таблицу смены и сверяю их с администратором перед началом и после конца."
+
+sandbox: tempfile.TemporaryDirectory | None = None
+
+
+def load_bot():
+    """Импортирует бота в песочнице: свой рабочий каталог, фиктивный токен, без задержек между сообщениями."""
+    global sandbox
+    sandbox = tempfile.TemporaryDirectory(prefix="flow_check_")  # удалится при выходе вместе с results/
+    workdir = Path(sandbox.name)
+    for name in ("images", "locales"):
+        (workdir / name).symlink_to(REPO / name, target_is_directory=True)
+    os.chdir(workdir)
+    # два тенанта, как в tenants.example.json: курс проходит первый, второй нужен проверке маршрутизации вебхука
+    (workdir / "tenants.json").write_text(json.dumps([
+        {"name": "agency_a", "token_env": "BOT_TOKEN", "owner_chat_id": 1},
+        {"name": "agency_b", "token_env": "AGENCY_B_TOKEN", "owner_chat_id": 1},
+    ]), encoding="utf-8")
+    os.environ.update(
+        BOT_TOKEN="123456:FLOW-CHECK", AGENCY_B_TOKEN="654321:FLOW-CHECK", WEBHOOK_URL="http://127.0.0.1",
+        OWNER_CHAT_ID="1", TENANTS_FILE=str(workdir / "tenants.json"), DEBOUNCE_WINDOW="0", LOG_LEVEL="WARNING",
+    )
+    sys.path.insert(0, str(REPO))
+    import telegram_bot
+
+    return telegram_bot
+
+
+class FakeBotAPI:
+    """Bot API на 127.0.0.1 в своём потоке и своём loop: не мешает мерить задачи бота."""
+
+    def __init__(self):
+        self.calls = []  # (method, поля, {поле: имя загруженного файла}, байт в запросе)
+        self.tokens = []  # токен бота — по вызову на каждый элемент calls
+        self.ids = itertools.count(1)
+        self.ready = threading.Event()
+        self.delay = 0.0  # с; задержка ответа — чтобы застать апдейт в обработке
+
+    def start(self) -> str:
+        threading.Thread(target=self._serve, name="fake-bot-api", daemon=True).start()
+        self.ready.wait()
+        return f"http://127.0.0.1:{self.port}"
+
+    def _serve(self):
+        loop = asyncio.new_event_loop()
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.ready.set()
+        loop.run_forever()
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        form = await request.post()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        fields = {key: value for key, value in form.items() if not isinstance(value, web.FileField)}
+        files = {key: value.filename for key, value in form.items() if isinstance(value, web.FileField)}
+        self.calls.append((method, fields, files, request.content_length or 0))
+        self.tokens.append(request.match_info["token"])
+        return web.json_response({"ok": True, "result": self.result(method, fields, files)})
+
+    def result(self, method: str, fields: dict, files: dict):
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Flow check", "username": "flow_check_bot"}
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if not method.startswith(("send", "copy", "edit")):
+            return True
+        message = {"message_id": next(self.ids), "date": int(time.time()),
+                   "chat": {"id": int(fields["chat_id"]), "type": "private"}}
+        for field in ("photo", "video", "document", "animation"):
+            if field in files or field in fields:
+                # в file_id — имя файла: по нему content_audit считает вес медиа и для повторных отправок
+                file_id = fields.get(field) or f"{field}:{files[field]}"
+                media = {"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1, "duration": 1}
+                message[field] = [media] if field == "photo" else media
+        return message
+
+
+def buttons(fields: dict) -> list:
+    """callback_data кнопок отправленного сообщения, в порядке клавиатуры."""
+    markup = json.loads(fields.get("reply_markup") or "{}")
+    return [button["callback_data"] for row in markup.get("inline_keyboard", []) for button in row
+            if "callback_data" in button]
+
+
+class FlowCheck:
+    def __init__(self, tb, api: FakeBotAPI):
+        self.tb = tb
+        self.api = api
+        self.ids = itertools.count(1)
+        self.steps = defaultdict(lambda: {"runs": 0, "calls": 0, "uploads": 0, "ms": 0.0})  # максимумы по шагу
+        self.pressed = set()
+        self.states = set()
+        self.problems = []
+        self.errors = []
+        self.paused = 0.0
+        self.language = "ru"  # language_code синтетических стажёров
+
+    # --- синтетические апдейты ---
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Flow", "language_code": self.language}
+
+    def message(self, user_id: int, text: str) -> dict:
+        message = {"message_id": next(self.ids), "date": int(time.time()), "text": text,
+                   "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id)}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self.ids), "message": message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {"update_id": next(self.ids), "callback_query": {
+            "id": str(next(self.ids)), "from": self._user(user_id), "chat_instance": "flow", "data": data,
+            "message": {"message_id": next(self.ids), "date": int(time.time()), "text": "…",
+                        "chat": {"id": user_id, "type": "private"}}}}
+
+    async def send(self, key: str, update: dict) -> list:
+        """Прогоняет апдейт через Dispatcher, ждёт фоновые задачи хендлера; возвращает вызовы Bot API."""
+        tb = self.tb
+        tb.use_tenant(tb.TENANTS[0])
+        before, background = len(self.api.calls), asyncio.all_tasks()
+        started = time.perf_counter()
+        # своя задача на апдейт, как у вебхука: aiogram кеширует состояние FSM в contextvar
+        handling = asyncio.create_task(tb.dp.updates_handler.notify(tb.types.Update(**update)))
+        await handling
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        spawned = asyncio.all_tasks() - background - {asyncio.current_task(), handling}
+        if spawned:
+            await asyncio.wait(spawned, timeout=30)  # answerCallbackQuery, скрининг ответов
+        calls = self.api.calls[before:]
+        step = self.steps[key]
+        step["runs"] += 1
+        step["calls"] = max(step["calls"], len(calls))
+        step["uploads"] = max(step["uploads"], sum(len(files) for _, _, files, _ in calls))
+        step["ms"] = max(step["ms"], elapsed_ms)
+        return calls
+
+    async def state(self, user_id: int) -> str | None:
+        return await self.tb.dp.storage.get_state(chat=user_id, user=user_id)
+
+    # --- сценарии ---
+    async def walk(self, user_id: int, pick_last: bool, limit: int | None = None):
+        """Обход в глубину: сначала кнопки последнего сообщения; в состоянии ожидания — текстовый ответ.
+
+        Кнопки старых сообщений тоже нажимаются — так стажёр возвращается к пропущенным веткам. Если такая
+        кнопка привязана к состоянию, которое уже прошло (соседняя «❌ Нет» после «✅ Да»), хендлера у неё
+        нет — это не ошибка, шаг засчитается другому стажёру.
+        """
+        tb = self.tb
+        stack, pressed, keyboards = [], set(), itertools.count(1)
+        latest = 0
+
+        def offer(calls):
+            nonlocal latest
+            for _, fields, _, _ in calls:
+                data = buttons(fields)
+                if data:
+                    latest = next(keyboards)
+                    stack.extend((item, latest) for item in (data if pick_last else reversed(data)))
+
+        offer(await self.send("/start", self.message(user_id, "/start")))
+        for _ in range(limit or MAX_UPDATES):
+            state = await self.state(user_id)
+            if state:
+                self.states.add(state)
+            if state in tb.STATE_PROMPTS and state != tb.Form.waiting_for_onlyfans.state:
+                text = NAME_ANSWER if state == tb.Form.waiting_for_name.state else TEXT_ANSWER
+                calls = await self.send(f"text:{state}", self.message(user_id, text))
+                if not calls:
+                    self.problems.append(f"ответ в состоянии {state} остался без реакции")
+                offer(calls)
+                continue
+            while stack:
+                data, keyboard = stack.pop()
+                step, _ = tb.decode_callback(data)
+                if step not in pressed and step not in ("resume", "restart"):
+                    break
+            else:
+                return
+            pressed.add(step)
+            calls = await self.send(step, self.callback(user_id, data))
+            if not calls and keyboard != latest:
+                continue  # ветка закрыта состоянием — см. docstring
+            self.pressed.add(step)
+            self.check_callback(step, calls)
+            offer(calls)
+        if limit is None:
+            self.problems.append(f"стажёр {user_id}: больше {MAX_UPDATES} апдейтов — кнопки зациклились?")
+
+    def check_callback(self, step: str, calls: list):
+        methods = [method for method, _, _, _ in calls]
+        if "answerCallbackQuery" not in methods:
+            self.problems.append(f"{step}: callback без answerCallbackQuery — у стажёра будут «часики»")
+        if not any(method != "answerCallbackQuery" for method in methods):
+            self.problems.append(f"{step}: кнопка ничего не отправила — мёртвое ребро графа")
+
+    async def resume(self, user_id: int):
+        """Вернувшийся посреди курса: /start предлагает продолжить, обе кнопки работают."""
+        tb = self.tb
+        await self.walk(user_id, pick_last=False, limit=6)
+        calls = await self.send("/start (возврат)", self.message(user_id, "/start"))
+        offered = [tb.decode_callback(data)[0] for _, fields, _, _ in calls for data in buttons(fields)]
+        if offered != ["resume", "restart"]:
+            self.problems.append(f"/start посреди курса предложил {offered}, а не продолжить/заново")
+            return
+        for step in offered:
+            self.pressed.add(step)
+            self.check_callback(step, await self.send(step, self.callback(user_id, tb.cb(step))))
+
+    async def stale_button(self, user_id: int):
+        """Подделанная или устаревшая кнопка уводит в «Продолжить» с подсказкой, а не в ошибку."""
+        calls = await self.send("устаревшая кнопка", self.callback(user_id, "~AAAAAAAAAAAA"))
+        self.check_callback("устаревшая кнопка", calls)
+
+    async def double_tap(self, user_id: int):
+        """Повтор кнопки, пока её медленный шаг ещё идёт: на повтор отвечаем сразу, шаг не запускается дважды."""
+        tb = self.tb
+        tb.use_tenant(tb.TENANTS[0])
+        data = tb.cb("objection_expensive")  # ≈9 с пауз в проде
+        paused, release, no_pause = asyncio.Event(), asyncio.Event(), tb.pause
+
+        async def slow_pause(seconds: float):  # шаг стоит на первой паузе, пока его не отпустят
+            paused.set()
+            await release.wait()
+
+        tb.pause = slow_pause
+        # через Dispatcher.process_update, как вебхук: очередь чата и проверка повторов — там
+        first = asyncio.create_task(tb.dp.process_update(tb.types.Update(**self.callback(user_id, data))))
+        try:
+            await asyncio.wait_for(paused.wait(), 5)
+            repeat = self.callback(user_id, data)
+            before = len(self.api.calls)
+            try:
+                await asyncio.wait_for(tb.dp.process_update(tb.types.Update(**repeat)), 2)
+            except asyncio.TimeoutError:
+                self.problems.append("повтор кнопки ждёт, пока закончится медленный шаг, — у стажёра «часики»")
+                return
+            calls = self.api.calls[before:]
+            answered = [fields["callback_query_id"] for method, fields, _, _ in calls if method == "answerCallbackQuery"]
+            if answered != [repeat["callback_query"]["id"]] or len(calls) != 1:
+                self.problems.append(f"повтор кнопки во время шага: {[method for method, _, _, _ in calls]}, "
+                                     "а не один answerCallbackQuery")
+        finally:
+            release.set()
+            tb.pause = no_pause
+            await first
+
+    async def reminder(self, user_id: int):
+        """Несколько шагов подряд (одно окно напоминания) — один таймер и одно напоминание, без дублей."""
+        tb = self.tb
+        tenant = tb.TENANTS[0]
+        queue = tenant.reminders
+        await self.walk(user_id, pick_last=True, limit=5)
+        timers = [timer for timer in queue.timers() if queue.unpack(timer)[2] == user_id]
+        if len(timers) != 1:
+            self.problems.append(f"напоминания: {len(timers)} таймеров на стажёра после нескольких шагов, а не 1")
+            return
+        due = queue.unpack(timers[0])[0]
+        before = len(self.api.calls)
+        limiter = tb.RateLimiter(1000, burst=100)
+        await tb.fire_reminders(tenant, limiter, due)
+        await tb.fire_reminders(tenant, limiter, due)  # повторный проход в ту же минуту ничего не шлёт
+        sent = [fields for method, fields, _, _ in self.api.calls[before:]
+                if method == "sendMessage" and fields["chat_id"] == str(user_id)]
+        if len(sent) != 1:
+            self.problems.append(f"напоминания: стажёру ушло {len(sent)} напоминаний, а не 1")
+
+    async def owner_command(self):
+        """Команда владельца посреди опроса выполняется, а не уходит ответом на вопрос."""
+        tb = self.tb
+        owner, quiz_state = tb.TENANTS[0].owner_chat_id, tb.QuizStates.q3.state
+        await tb.dp.storage.set_state(chat=owner, user=owner, state=quiz_state)
+        await self.send("/slow (владелец посреди опроса)", self.message(owner, "/slow"))
+        if await self.state(owner) != quiz_state:
+            self.problems.append("команда владельца посреди опроса ушла ответом на вопрос")
+
+    async def webhook(self, user_id: int):
+        """Апдейт через aiohttp-приложение бота: webhook_guard, secret token, лимиты и тенант по пути."""
+        tb = self.tb
+        first, second = tb.TENANTS[:2]
+        update = self.message(user_id, "/start")
+        expected = [
+            # (что проверяем, тенант в пути, secret, заголовки/тело запроса, ожидаемый статус)
+            ("неизвестный тенант", "nobody", second.webhook_secret, {"json": update}, 404),
+            ("secret другого тенанта", second.name, first.webhook_secret, {"json": update}, 401),
+            ("тело больше лимита", second.name, second.webhook_secret,
+             {"data": b" " * (tb.WEBHOOK_MAX_BODY + 1), "headers": {"Content-Type": "application/json"}}, 413),
+            ("не JSON", second.name, second.webhook_secret, {"data": b"update"}, 415),
+            ("битый JSON", second.name, second.webhook_secret,
+             {"data": b"{", "headers": {"Content-Type": "application/json"}}, 400),
+            ("апдейт", second.name, second.webhook_secret, {"json": update}, 200),
+        ]
+        before = len(self.api.calls)
+        async with TestClient(TestServer(tb.make_web_app())) as client:
+            for what, name, secret, request, status in expected:
+                headers = {"X-Telegram-Bot-Api-Secret-Token": secret, **request.pop("headers", {})}
+                response = await client.post(tb.WEBHOOK_PATH.format(tenant=name), headers=headers, **request)
+                if response.status != status:
+                    self.problems.append(f"вебхук, {what}: ответ {response.status}, а не {status}")
+        tokens = {token for token in self.api.tokens[before:]}
+        if tokens != {second.token}:
+            self.problems.append(f"вебхук {second.name}: ответ ушёл от ботов {sorted(tokens)}, а не от своего")
+        if str(user_id) in first.storage.data or str(user_id) not in second.storage.data:
+            self.problems.append(f"вебхук {second.name}: состояние стажёра записано не в хранилище тенанта")
+
+    async def drain(self, user_id: int):
+        """Остановка посреди апдейта: прерванный хендлер отвечает Telegram 503, а не обрывом соединения."""
+        tb = self.tb
+        tenant = tb.TENANTS[0]
+        path = tb.WEBHOOK_PATH.format(tenant=tenant.name)
+        headers = {"X-Telegram-Bot-Api-Secret-Token": tenant.webhook_secret}
+        drain_timeout, tb.DRAIN_TIMEOUT, self.api.delay = tb.DRAIN_TIMEOUT, 0.1, 1.0
+        try:
+            async with TestClient(TestServer(tb.make_web_app())) as client:
+                request = asyncio.create_task(client.post(path, json=self.message(user_id, "/start"), headers=headers))
+                while not tb.inflight_updates:
+                    await asyncio.sleep(0.01)
+                await tb.drain_updates()
+                try:
+                    response = await request
+                except ClientError as e:
+                    self.problems.append(f"прерванный при остановке апдейт оборвал соединение: {e!r}")
+                else:
+                    if response.status != 503:
+                        self.problems.append(f"прерванный при остановке апдейт ответил {response.status}, а не 503")
+                response = await client.post(path, json=self.message(user_id, "/start"), headers=headers)
+                if response.status != 503:
+                    self.problems.append(f"апдейт во время остановки принят ({response.status}), а не отклонён 503")
+        finally:
+            tb.draining, tb.DRAIN_TIMEOUT, self.api.delay = False, drain_timeout, 0.0
+
+    def install(self):
+        """Направляет бота на фейковый Bot API, отключает паузы курса и собирает ошибки из лога."""
+        from aiogram import Bot, Dispatcher
+        from aiogram.bot.api import TelegramAPIServer
+
+        tb, check = self.tb, self
+        server = TelegramAPIServer.from_base(self.api.start())
+        for tenant in tb.TENANTS:
+            tenant.bot.server = server
+        Bot.set_current(tb.TENANTS[0].bot)
+        Dispatcher.set_current(tb.dp)
+
+        async def no_pause(seconds: float):
+            check.paused += seconds
+            await asyncio.sleep(0)
+
+        tb.pause = no_pause
+
+        class ErrorLog(tb.logging.Handler):
+            def emit(self, record):
+                check.errors.append(record.getMessage())
+
+        tb.logging.getLogger().addHandler(ErrorLog(level=tb.logging.ERROR))
+
+    def coverage(self):
+        tb = self.tb
+        missed = [step for step in tb.CALLBACK_STEPS if step not in self.pressed]
+        if missed:
+            self.problems.append(f"не достигнуты шаги: {', '.join(missed)}")
+        missed = [state for state in tb.STATE_PROMPTS if state not in self.states]
+        if missed:
+            self.problems.append(f"не достигнуты состояния: {', '.join(missed)}")
+
+    def check_budgets(self, budgets: dict):
+        for key, step in self.steps.items():
+            budget = budgets.get(key)
+            if budget is None:
+                self.problems.append(f"{key}: нет бюджета — запусти с --record и закоммить flow_budgets.json")
+                continue
+            for metric in ("calls", "uploads", "ms"):
+                if step[metric] > budget[metric]:
+                    self.problems.append(f"{key}: {metric} {step[metric]:.0f} > бюджета {budget[metric]}")
+
+    def record(self) -> dict:
+        return {key: {"calls": step["calls"], "uploads": step["uploads"],
+                      "ms": max(LATENCY_FLOOR_MS, round(step["ms"] * LATENCY_HEADROOM))}
+                for key, step in sorted(self.steps.items())}
+
+
+async def run(tb, api: FakeBotAPI) -> FlowCheck:
+    check = FlowCheck(tb, api)
+    check.install()
+    tenant = tb.TENANTS[0]
+
+    tb.audit_assets(tenant)
+    await check.walk(1001, pick_last=False)
+    await check.walk(1002, pick_last=True)
+    await check.resume(1003)
+    await check.stale_button(1004)
+    await check.reminder(2 ** 40 + 1005)  # id за пределами 35 бит: у Telegram до 52 значащих бит
+    await check.double_tap(1008)
+    await check.owner_command()
+    await check.webhook(1007)
+    await check.drain(1006)
+    await asyncio.sleep(0.1)  # ErrorLog пишут через очередь логов
+    tb.AnswerScreener.shutdown()
+    await (await tenant.bot.get_session()).close()
+    check.coverage()
+    check.problems += [f"ошибка в логе: {message}" for message in check.errors]
+    for problem in tenant.asset_problems:
+        print(f"⚠️  медиа: {problem}")
+    return check
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозная проверка курса и бюджетов шагов")
+    parser.add_argument("--record", action="store_true", help="записать текущие показатели как бюджеты")
+    parser.add_argument("--verbose", action="store_true", help="таблица по шагам")
+    parser.add_argument("--budgets", type=Path, default=BUDGETS_FILE)
+    args = parser.parse_args()
+
+    tb = load_bot()
+    api = FakeBotAPI()
+    check = asyncio.run(run(tb, api))
+
+    if args.record:
+        args.budgets.write_text(json.dumps(check.record(), ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Бюджеты {len(check.steps)} шагов записаны в {args.budgets}")
+    elif args.budgets.exists():
+        check.check_budgets(json.loads(args.budgets.read_text(encoding="utf-8")))
+    else:
+        check.problems.append(f"нет {args.budgets.name} — запусти с --record")
+
+    if args.verbose:
+        print(f"{'шаг':<45} {'раз':>4} {'вызовов':>8} {'загрузок':>9} {'мс':>8}")
+        for key, step in sorted(check.steps.items()):
+            print(f"{key[:45]:<45} {step['runs']:>4} {step['calls']:>8} {step['uploads']:>9} {step['ms']:>8.1f}")
+    print(f"Апдейтов: {sum(step['runs'] for step in check.steps.values())}, вызовов Bot API: {len(api.calls)}, "
+          f"шагов: {len(check.pressed)}/{len(tb.CALLBACK_STEPS)}, состояний: {len(check.states)}, "
+          f"пропущено пауз курса: {check.paused:.0f} с")
+    for problem in check.problems:
+        print(f"❌ {problem}")
+    if check.problems:
+        sys.exit(1)
+    print("✅ Курс проходится целиком, бюджеты соблюдены")
+
+
+if __name__ == "__main__":
+    main()
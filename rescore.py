@@ -0,0 +1,331 @@
+# rescore.py
+# Пакетная переоценка всего архива ответов (results/answers.jsonl) — гонять после каждого изменения правил.
+#
+#   python rescore.py                          # архив -> results/rescored.jsonl
+#   python rescore.py --since 2026-01-01 --workers 4 --chunk 5000
+#   python rescore.py --benchmark 50000        # пропускная способность на синтетических ответах
+#
+# Ответы читаются потоком чанками по --chunk записей. Токенизация — в пуле процессов, признаки
+# (длина, разнообразие, сходство n-грамм с архивом, покрытие ключевых слов курса) — матрицами NumPy.
+# Результаты дописываются в выходной файл после каждого чанка.
+# Почти-дубликаты ищутся в своём чанке и в равномерной выборке уже обработанных ответов — не больше
+# --archive-limit на вопрос (reservoir sampling): память и время на ответ не растут с размером архива.
+import argparse
+import ast
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+import screening
+
+ANSWERS_FILE = Path("results") / "answers.jsonl"
+OUTPUT_FILE = Path("results") / "rescored.jsonl"
+COURSE_FILE = Path(__file__).with_name("telegram_bot.py")
+
+DIM = 1024  # размер хешированного словаря
+STEM_LEN = 5  # грубый стемминг для русского: первые 5 букв
+KEYWORDS_PER_QUESTION = 25
+KEYWORDS_LOCALE = "ru"  # ключевые слова берутся из русского текста курса — off_topic только для русских ответов
+SIMILARITY_THRESHOLD = 0.8  # косинус по словным биграммам
+ARCHIVE_LIMIT = 4096  # векторов на вопрос в выборке для поиска дубликатов: 8 МБ float16
+
+# какие уроки курса (функции telegram_bot.py) проверяет вопрос
+QUESTION_SOURCES = {
+    "question_1": ("of_next_1", "of_next_2", "how_to_earn_info"),
+    "question_2": ("show_diff_intro", "diff_mailings_info"),
+    "question_3": ("how_to_earn_info", "diff_mailings_info"),
+    "quiz_q1": ("objection_expensive", "objection_deceive"),
+    "quiz_q2": ("objection_money", "objection_expensive"),
+    "quiz_q3": ("objection_money", "objection_next2"),
+    "quiz_q4": ("objection_money", "objection_trust"),
+    "quiz_q5": ("mailing_done",),
+    "quiz_q6": ("objection_deceive", "objection_trust"),
+    "quiz_q7": ("objection_expensive", "objection_next1"),
+}
+
+
+def stem(token: str) -> str:
+    return token[:STEM_LEN]
+
+
+def bucket(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8")) % DIM
+
+
+# --- Ключевые слова курса ---
+def course_sections(path: Path = COURSE_FILE) -> dict:
+    """Тексты уроков по функциям-хендлерам — через ast, без импорта бота и без токена."""
+    sections = {}
+    for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            sections[node.name] = " ".join(
+                n.value for n in ast.walk(node)
+                if isinstance(n, ast.Constant) and isinstance(n.value, str) and len(n.value) > 20
+            )
+    return sections
+
+
+def question_keywords(sections: dict) -> dict:
+    """TF-IDF по урокам: самые характерные основы слов для каждого вопроса."""
+    names = [name for name, text in sections.items() if text]
+    docs = [[stem(t) for t in screening.tokenize(sections[name]) if len(t) >= 4] for name in names]
+    vocab = {term: i for i, term in enumerate(sorted({t for doc in docs for t in doc}))}
+    tf = np.zeros((len(docs), len(vocab)), np.float32)
+    for row, doc in enumerate(docs):
+        np.add.at(tf, (row, [vocab[t] for t in doc]), 1)
+    idf = np.log(len(docs) / np.count_nonzero(tf, axis=0))
+    tfidf = tf * idf
+    terms = np.array(sorted(vocab, key=vocab.get))
+    row_of = {name: i for i, name in enumerate(names)}
+
+    keywords = {}
+    for question, sources in QUESTION_SOURCES.items():
+        rows = [row_of[name] for name in sources if name in row_of]
+        if not rows:
+            continue
+        weights = tfidf[rows].sum(axis=0)
+        keywords[question] = terms[np.argsort(weights)[::-1][:KEYWORDS_PER_QUESTION]].tolist()
+    return keywords
+
+
+def keyword_vectors(keywords: dict) -> dict:
+    vectors = {}
+    for question, terms in keywords.items():
+        vector = np.zeros(DIM, np.float32)
+        vector[[bucket(t) for t in terms]] = 1
+        vectors[question] = vector
+    return vectors
+
+
+# --- Чтение архива ---
+def iter_records(path: Path, since: date | None = None):
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if since and datetime.fromisoformat(record["ts"]).date() < since:
+                    continue
+            except (ValueError, KeyError):
+                continue
+            if record.get("question") in QUESTION_SOURCES:
+                yield record
+
+
+def iter_chunks(records, size: int):
+    while chunk := list(itertools.islice(records, size)):
+        yield chunk
+
+
+# --- Воркер: токенизация и хешированные матрицы ---
+def featurize(chunk: list) -> dict:
+    n = len(chunk)
+    stem_rows, stem_cols, bigram_rows, bigram_cols = [], [], [], []
+    generated = np.zeros(n, np.float32)
+    flags = []
+    for i, record in enumerate(chunk):
+        text = record.get("answer", "")
+        tokens = screening.tokenize(text)
+        stem_rows.extend([i] * len(tokens))
+        stem_cols.extend(bucket(stem(t)) for t in tokens)
+        bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])] or tokens
+        bigram_rows.extend([i] * len(bigrams))
+        bigram_cols.extend(bucket(b) for b in bigrams)
+        generated[i], generated_flags = screening.generated_score(screening.features(text))
+        flags.append(generated_flags)
+
+    stems = np.zeros((n, DIM), np.float32)
+    bigrams = np.zeros((n, DIM), np.float32)
+    np.add.at(stems, (stem_rows, stem_cols), 1)
+    np.add.at(bigrams, (bigram_rows, bigram_cols), 1)
+    return {
+        "meta": [{k: r.get(k) for k in ("ts", "user_id", "question", "locale")} for r in chunk],
+        "stems": stems,
+        "bigrams": bigrams,
+        "generated": generated,
+        "flags": flags,
+    }
+
+
+# --- Главный процесс: векторные признаки и сходство с архивом ---
+class Reservoir:
+    """Равномерная выборка не больше limit векторов из всех добавленных (Algorithm R)."""
+
+    def __init__(self, limit: int, rng: np.random.Generator):
+        self.limit = limit
+        self.rng = rng
+        self.vectors = np.zeros((0, DIM), np.float16)
+        self.users = np.zeros(0, np.int64)
+        self.seen = 0
+
+    def add(self, vectors: np.ndarray, users: np.ndarray):
+        positions = np.arange(self.seen, self.seen + len(vectors))
+        self.seen += len(vectors)
+        fill = positions < self.limit  # пока выборка не полна — берём всех подряд
+        self.vectors = np.concatenate([self.vectors, vectors[fill].astype(np.float16)])
+        self.users = np.concatenate([self.users, users[fill]])
+        rest = np.flatnonzero(~fill)
+        # k-й ответ попадает в выборку с вероятностью limit/k и вытесняет случайный
+        slots = self.rng.integers(0, positions[rest] + 1)
+        keep = slots < self.limit
+        self.vectors[slots[keep]] = vectors[rest[keep]]
+        self.users[slots[keep]] = users[rest[keep]]
+
+
+class Rescorer:
+    def __init__(self, keyword_vecs: dict, archive_limit: int = ARCHIVE_LIMIT):
+        self.keyword_vecs = keyword_vecs
+        self.archive_limit = archive_limit
+        self.rng = np.random.default_rng(0)  # фиксированное зерно — результаты повторяемы
+        self.archive = {}  # вопрос -> Reservoir нормированных биграмм
+
+    def _max_similarity(self, question: str, vectors: np.ndarray, users: np.ndarray):
+        """Максимальный косинус с выборкой ранее обработанных ответов других стажёров и внутри чанка."""
+        best = np.zeros(len(vectors), np.float32)
+        best_user = np.full(len(vectors), -1, np.int64)
+        archive = self.archive.setdefault(question, Reservoir(self.archive_limit, self.rng))
+        for block, block_users in ((archive.vectors, archive.users), (vectors, users)):
+            if not len(block):
+                continue
+            sims = vectors @ block.T.astype(np.float32)
+            sims[users[:, None] == block_users[None, :]] = 0  # свои же ответы не считаем
+            idx = sims.argmax(axis=1)
+            top = sims[np.arange(len(vectors)), idx]
+            better = top > best
+            best[better] = top[better]
+            best_user[better] = block_users[idx[better]]
+        archive.add(vectors, users)
+        return best, best_user
+
+    def score(self, feats: dict) -> list:
+        stems, bigrams, meta = feats["stems"], feats["bigrams"], feats["meta"]
+        words = stems.sum(axis=1)
+        unique_ratio = np.divide(np.count_nonzero(stems, axis=1), words,
+                                 out=np.zeros_like(words), where=words > 0)
+        norms = np.linalg.norm(bigrams, axis=1, keepdims=True)
+        unit = np.divide(bigrams, norms, out=np.zeros_like(bigrams), where=norms > 0)
+        present = (stems > 0).astype(np.float32)
+        questions = np.array([m["question"] for m in meta])
+        users = np.array([m["user_id"] or 0 for m in meta], np.int64)
+
+        coverage = np.zeros(len(meta), np.float32)
+        similarity = np.zeros(len(meta), np.float32)
+        similar_to = np.full(len(meta), -1, np.int64)
+        for question in np.unique(questions):
+            rows = np.flatnonzero(questions == question)
+            vec = self.keyword_vecs.get(question)
+            if vec is not None and vec.any():
+                coverage[rows] = present[rows] @ vec / vec.sum()
+            similarity[rows], similar_to[rows] = self._max_similarity(question, unit[rows], users[rows])
+
+        effort = np.minimum(1.0, words / 25)
+        effort = np.where((words >= 8) & (unique_ratio < 0.4), effort * 0.5, effort)
+
+        out = []
+        for i, m in enumerate(meta):
+            flags = list(feats["flags"][i])
+            if words[i] < 4:
+                flags.append("too_short")
+            if similarity[i] >= SIMILARITY_THRESHOLD:
+                flags.append("near_duplicate")
+            if coverage[i] == 0 and words[i] >= 4 and m["locale"] in (None, KEYWORDS_LOCALE):  # до locale — русские
+                flags.append("off_topic")
+            out.append({
+                **m,
+                "words": int(words[i]),
+                "unique_ratio": round(float(unique_ratio[i]), 3),
+                "coverage": round(float(coverage[i]), 3),
+                "similarity": round(float(similarity[i]), 3),
+                "similar_to": int(similar_to[i]) if similar_to[i] >= 0 else None,
+                "effort": round(float(effort[i]), 3),
+                "generated": round(float(feats["generated"][i]), 3),
+                "flags": flags,
+            })
+        return out
+
+
+def rescore(input_path: Path, output_path: Path, workers: int, chunk: int, since: date | None = None,
+            archive_limit: int = ARCHIVE_LIMIT) -> int:
+    rescorer = Rescorer(keyword_vectors(question_keywords(course_sections())), archive_limit)
+    chunks = iter_chunks(iter_records(input_path, since), chunk)
+    total = 0
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("w", encoding="utf-8") as out:
+        def write(feats):
+            nonlocal total
+            for row in rescorer.score(feats):
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                total += 1
+            out.flush()  # результат виден по мере обработки
+
+        if workers <= 1:
+            for c in chunks:
+                write(featurize(c))
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                # окнами по 2 чанка на воркер — в памяти не больше окна, а не весь архив
+                while window := list(itertools.islice(chunks, workers * 2)):
+                    for feats in pool.map(featurize, window):
+                        write(feats)
+    return total
+
+
+# --- Бенчмарк ---
+def synthetic_answers(path: Path, count: int):
+    """Ответы из перемешанных предложений курса — похожи на реальные по длине и словарю."""
+    rng = random.Random(1)
+    sentences = [s for text in course_sections().values() for s in text.split(". ") if len(s) > 30]
+    questions = list(QUESTION_SOURCES)
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(count):
+            record = {
+                "ts": "2026-01-01T00:00:00+00:00",
+                "user_id": rng.randrange(1, count // 5 + 2),
+                "question": rng.choice(questions),
+                "answer": ". ".join(rng.sample(sentences, rng.randint(1, 4))),
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def benchmark(count: int, chunk: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        source, target = Path(tmp) / "answers.jsonl", Path(tmp) / "rescored.jsonl"
+        synthetic_answers(source, count)
+        for workers in sorted({1, os.cpu_count() or 1}):
+            started = time.perf_counter()
+            total = rescore(source, target, workers, chunk)
+            elapsed = time.perf_counter() - started
+            print(f"workers={workers:<3} answers={total:<8} {elapsed:7.2f} s  {total / elapsed:10.0f} answers/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная переоценка архива ответов стажёров")
+    parser.add_argument("--input", type=Path, default=ANSWERS_FILE)
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=2000)
+    parser.add_argument("--since", type=date.fromisoformat)
+    parser.add_argument("--archive-limit", type=int, default=ARCHIVE_LIMIT,
+                        help="ответов на вопрос в выборке для поиска почти-дубликатов")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="замер на N синтетических ответах")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.chunk)
+        return
+    started = time.perf_counter()
+    total = rescore(args.input, args.output, args.workers, args.chunk, args.since, args.archive_limit)
+    elapsed = time.perf_counter() - started
+    print(f"{total} ответов за {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f}/с) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# screening.py
+# Офлайн-скрининг ответов стажёров (только CPU, без внешних сервисов):
+#   - эвристики усилия: длина, разнообразие слов, копипаст вопроса;
+#   - сигнатуры MinHash + LSH-индекс для поиска почти-дубликатов между стажёрами;
+#   - стилометрические признаки «сгенерированного» текста.
+# analyze() — чистая функция, её можно гонять в ProcessPoolExecutor.
+import random
+import re
+import statistics
+import zlib
+
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(20251019)  # фиксированное зерно — сигнатуры совместимы между перезапусками
+_PERMS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"[^.!?…]+[.!?…]*")
+_EMOJI_RE = re.compile("[\U0001F300-\U0001FAFF☀-➿]")
+_LIST_LINE_RE = re.compile(r"^\s*(?:\d+[.)]|[-•*—])\s+", re.MULTILINE)
+_REPEAT_RE = re.compile(r"(.)\1{4,}")
+
+# канцелярские связки, типичные для ответов нейросетей
+GENERATED_MARKERS = (
+    "важно отметить", "следует отметить", "стоит отметить", "таким образом", "в заключение",
+    "кроме того", "во-первых", "во-вторых", "в-третьих", "в целом", "подводя итог",
+    "необходимо учитывать", "является ключевым", "играет важную роль", "данный подход",
+    "как языковая модель", "as an ai", "in conclusion", "furthermore", "moreover",
+)
+
+
+def normalize(text: str) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def tokenize(text: str) -> list:
+    return _WORD_RE.findall(normalize(text))
+
+
+def shingles(tokens: list, size: int = 3) -> set:
+    """Словные n-граммы; для коротких ответов — отдельные слова."""
+    if len(tokens) < size:
+        return set(tokens)
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash(items: set) -> list:
+    if not items:
+        return [_MERSENNE] * NUM_PERM
+    hashes = [zlib.crc32(item.encode("utf-8")) for item in items]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS]
+
+
+def similarity(sig_a: list, sig_b: list) -> float:
+    """Оценка коэффициента Жаккара по доле совпавших позиций сигнатур."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+class LSHIndex:
+    """Banded LSH поверх MinHash: кандидаты — ответы, совпавшие хотя бы в одной полосе."""
+
+    def __init__(self):
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+        self.signatures = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @staticmethod
+    def _bands(signature: list):
+        for band in range(LSH_BANDS):
+            yield band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+
+    def add(self, key, signature: list):
+        """Добавляет или заменяет сигнатуру key; корзины прежней сигнатуры очищаются."""
+        previous = self.signatures.get(key)
+        if previous is not None:
+            for band, chunk in self._bands(previous):
+                keys = self.buckets[band].get(chunk)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.buckets[band][chunk]
+        self.signatures[key] = signature
+        for band, chunk in self._bands(signature):
+            self.buckets[band].setdefault(chunk, set()).add(key)
+
+    def query(self, signature: list, exclude=None):
+        """Самый похожий ранее добавленный ответ: (similarity, key) или (0.0, None)."""
+        candidates = set()
+        for band, chunk in self._bands(signature):
+            candidates.update(self.buckets[band].get(chunk, ()))
+        candidates.discard(exclude)
+        best, best_key = 0.0, None
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score > best:
+                best, best_key = score, key
+        return best, best_key
+
+
+def features(text: str, question_text: str = "") -> dict:
+    tokens = tokenize(text)
+    sentences = [s.strip() for s in _SENTENCE_RE.findall(text or "") if s.strip()]
+    sentence_lengths = [len(_WORD_RE.findall(s)) for s in sentences]
+    question_tokens = set(tokenize(question_text))
+    return {
+        "chars": len(text or ""),
+        "words": len(tokens),
+        "unique_ratio": len(set(tokens)) / len(tokens) if tokens else 0.0,
+        "sentences": len(sentences),
+        "sentence_cv": (statistics.pstdev(sentence_lengths) / statistics.mean(sentence_lengths)
+                        if len(sentence_lengths) >= 3 and statistics.mean(sentence_lengths) else None),
+        "question_overlap": (sum(1 for t in tokens if t in question_tokens) / len(tokens)
+                             if tokens and question_tokens else 0.0),
+        "emoji": len(_EMOJI_RE.findall(text or "")),
+        "list_lines": len(_LIST_LINE_RE.findall(text or "")),
+        "markers": sum(normalize(text).count(marker) for marker in GENERATED_MARKERS),
+        "long_dashes": (text or "").count("—"),
+        "guillemets": (text or "").count("«"),
+        "repeats": bool(_REPEAT_RE.search(text or "")),
+    }
+
+
+def effort_score(f: dict) -> tuple:
+    """0 — отписка, 1 — развёрнутый ответ своими словами."""
+    flags = []
+    score = min(1.0, f["words"] / 25)
+    if f["words"] < 4:
+        flags.append("too_short")
+    if f["words"] >= 8 and f["unique_ratio"] < 0.4:
+        score *= 0.5
+        flags.append("repetitive")
+    if f["question_overlap"] > 0.6:
+        score *= 0.4
+        flags.append("copies_question")
+    if f["repeats"]:
+        score *= 0.7
+        flags.append("char_spam")
+    return round(score, 3), flags
+
+
+def generated_score(f: dict) -> tuple:
+    """Сумма стилометрических сигналов; ни один сам по себе не доказательство."""
+    flags = []
+    score = 0.0
+    if f["markers"]:
+        score += min(0.4, 0.2 * f["markers"])
+        flags.append("formal_connectors")
+    if f["list_lines"] >= 2:
+        score += 0.2
+        flags.append("list_layout")
+    if f["sentence_cv"] is not None and f["sentence_cv"] < 0.3:
+        score += 0.15
+        flags.append("uniform_sentences")
+    if f["long_dashes"] + f["guillemets"] >= 2:
+        score += 0.15  # с телефона обычно печатают "-" и "", а не — и «»
+        flags.append("typographic_punctuation")
+    if f["words"] >= 60 and not f["emoji"]:
+        score += 0.1
+        flags.append("long_without_emoji")
+    return round(min(score, 1.0), 3), flags
+
+
+def analyze(text: str, question_text: str = "") -> dict:
+    f = features(text, question_text)
+    effort, effort_flags = effort_score(f)
+    generated, generated_flags = generated_score(f)
+    return {
+        "effort": effort,
+        "generated": generated,
+        "flags": effort_flags + generated_flags,
+        "features": f,
+        "signature": minhash(shingles(tokenize(text))),
+    }
@@ -1,41 +1,255 @@
 # telegram_bot.py
+import atexit
+import base64
+import bisect
+import copy
+import hashlib
+import hmac
+import io
+import json
 import logging
+import multiprocessing
 import os
+import queue
+import random
+import re
+import signal
+import string
 import asyncio
+import contextlib
+import functools
+import sys
+import threading
+import time
+import traceback
+from array import array
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from urllib.parse import urljoin
 
+# screening (≈7 мс) и выгрузка — csv/zipfile/xml.sax/tempfile (≈13 мс) — импортируются при первом использовании
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.files import JSONStorage
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.storage import BaseStorage
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY, WebhookRequestHandler
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputFile, ParseMode
-from aiogram.utils.exceptions import InvalidQueryID, PhotoDimensions, TelegramAPIError
+from aiogram.utils.exceptions import (
+    BotBlocked, CantInitiateConversation, ChatNotFound, InvalidQueryID, NetworkError, PhotoDimensions,
+    RestartingTelegram, RetryAfter, TelegramAPIError, UserDeactivated,
+)
+import aiohttp
+from aiohttp import web
 from dotenv import load_dotenv
-from aiogram.utils.executor import start_webhook
+from aiogram.utils.executor import Executor
+
+# отсчёт холодного старта (--profile-startup, «первый апдейт через N с»): до этой строки процесс почти не ждёт
+# ввода-вывода, так что его CPU-время — это запуск интерпретатора и импорты
+STARTUP_T0 = time.perf_counter() - time.process_time()
+STARTUP_MARKS = [("imports", time.perf_counter())]
+
+def startup_mark(phase: str):
+    STARTUP_MARKS.append((phase, time.perf_counter()))
 
 # --- Load env ---
 load_dotenv()
 API_TOKEN = os.getenv("BOT_TOKEN")
 BASE_URL = os.getenv("WEBHOOK_URL")  # full public URL e.g. https://your-app.onrender.com
 PORT = int(os.getenv("PORT", "10000"))
+OWNER_CHAT_ID = int(os.getenv("OWNER_CHAT_ID", "0"))  # владелец — доступ к админ-командам
+TENANTS_FILE = Path(os.getenv("TENANTS_FILE", "tenants.json"))  # несколько ботов в одном процессе
 
-if not API_TOKEN:
+if not API_TOKEN and not TENANTS_FILE.exists():
     raise RuntimeError("BOT_TOKEN not set in .env")
 if not BASE_URL:
     raise RuntimeError("WEBHOOK_URL not set in .env")
 
-WEBHOOK_PATH = f"/webhook/{API_TOKEN}"
-WEBHOOK_URL = urljoin(BASE_URL, WEBHOOK_PATH)
+WEBHOOK_PATH = "/webhook/{tenant}"  # маршрут aiohttp: тенант — по имени в пути, токен в URL не светим
+ALLOWED_UPDATES = ["message", "callback_query"]  # других хендлеров нет — остальное Telegram не присылает
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", str(256 * 1024)))  # апдейт Telegram — единицы КБ
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))  # с; сколько при остановке ждём начатые апдейты
+SCREENING_WORKERS = int(os.getenv("SCREENING_WORKERS", "1"))
+
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "5"))  # с; столько FSM-данных теряет падение
 
 # --- Logging ---
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# LOG_FORMAT=json — структурированные логи; LOG_SAMPLE=callback=0.1,api_call=0.05 — доля записей по event.
+# Запись в stderr идёт из отдельного потока (QueueListener), хендлеры только кладут запись в очередь.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE = {
+    event: float(rate)
+    for event, _, rate in (item.partition("=") for item in os.getenv("LOG_SAMPLE", "").split(",") if item)
+}
+
+update_id_var: ContextVar[int | None] = ContextVar("update_id", default=None)  # correlation id апдейта
+
+class CorrelationFilter(logging.Filter):
+    """Проставляет update_id текущего апдейта в каждую запись."""
+
+    def filter(self, record):
+        record.update_id = update_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей с extra={"event": ...} из LOG_SAMPLE."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("event", "update_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        update_id = getattr(record, "update_id", None)
+        return line if update_id is None else f"{line} [update={update_id}]"
+
+class LogQueueHandler(QueueHandler):
+    """Кладёт запись в очередь; traceback остаётся отдельным полем, форматирование — в потоке листенера."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging() -> QueueListener:
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(TextFormatter("%(levelname)s:%(name)s:%(message)s"))
 
-# --- Init bot & dispatcher ---
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
+    queue_handler = LogQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE))
+    queue_handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    listener = QueueListener(queue_handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # дописываем очередь при выходе
+    return listener
+
+log_listener = setup_logging()
+logger = logging.getLogger(__name__)
+startup_mark("env + logging")
+
+# --- Пул скрининга ответов ---
+# Воркеры форкаются первым делом в on_startup: до него в процессе есть только поток логов, и его на время
+# fork останавливаем. Fork при живых потоках asyncio.to_thread, сторожа loop или QueueListener унёс бы
+# в воркер блокировки, захваченные чужими потоками. spawn и forkserver не подходят по другой причине:
+# воркер заново выполнил бы этот модуль как __mp_main__ — боты, хранилища, поток логов в каждом процессе.
+# Импорт модуля процессов не создаёт: CLI-флаги, flow_check и --profile-startup пул не трогают.
+screening_pool: ProcessPoolExecutor | None = None
+
+def start_screening_pool() -> ProcessPoolExecutor:
+    """Пул скрининга; без on_startup (flow_check) создаётся на первом ответе."""
+    global screening_pool
+    if screening_pool is None:
+        log_listener.stop()  # дописывает очередь и останавливает поток — fork из однопоточного процесса
+        try:
+            screening_pool = ProcessPoolExecutor(max_workers=SCREENING_WORKERS,
+                                                 mp_context=multiprocessing.get_context("fork"))
+            screening_pool.submit(int).result()  # с fork-контекстом все воркеры стартуют на первой задаче
+        finally:
+            log_listener.start()
+    return screening_pool
+
+# --- Tracing ---
+# TRACE_FILE=results/trace.json включает трассировку: спан на апдейт + дочерние спаны на вызовы
+# Bot API, операции со storage и паузы. Формат — Chrome trace events (chrome://tracing, ui.perfetto.dev).
+# TRACE_SAMPLE — доля апдейтов, которые трассируем.
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "1.0"))
+
+class Trace:
+    """События одного апдейта; в файл уходят целиком после его обработки."""
+
+    def __init__(self, update_id: int):
+        self.tid = update_id
+        self.events = []
+        self.root: Span | None = None
+
+    def add(self, name: str, cat: str, ts: int, dur: int, args: dict):
+        self.events.append({"name": name, "cat": cat, "ph": "X", "ts": ts, "dur": dur,
+                            "pid": os.getpid(), "tid": self.tid, "args": args})
+
+trace_var: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+class Span:
+    __slots__ = ("trace", "name", "cat", "args", "ts", "started")
+
+    def __init__(self, trace: Trace, name: str, cat: str, args: dict):
+        self.trace, self.name, self.cat, self.args = trace, name, cat, args
+
+    def __enter__(self):
+        self.ts = time.time_ns() // 1000
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        dur = int((time.perf_counter() - self.started) * 1_000_000)
+        self.trace.add(self.name, self.cat, self.ts, dur, self.args)
+
+_NO_SPAN = contextlib.nullcontext()
+
+def span(name: str, cat: str = "app", **args):
+    """Дочерний спан текущего апдейта; без активной трассировки — пустой контекст."""
+    trace = trace_var.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, cat, args)
+
+_trace_lock = threading.Lock()
+
+def _write_trace(events: list):
+    with _trace_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+        if f.tell() == 0:
+            f.write("[\n")  # JSON Array Format: закрывающая скобка необязательна
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + ",\n")
+
+async def pause(seconds: float):
+    """asyncio.sleep между сообщениями курса — отдельным спаном в трассировке."""
+    with span("sleep", "sleep", seconds=seconds):
+        await asyncio.sleep(seconds)
 
 # --- Directories ---
 IMAGES_DIR = Path("images")
@@ -43,9 +257,607 @@ RESULTS_DIR = Path("results")
 IMAGES_DIR.mkdir(exist_ok=True)
 RESULTS_DIR.mkdir(exist_ok=True)
 
-# --- States ---
-from aiogram.dispatcher.filters.state import State, StatesGroup
+# --- Resilience: ретраи и circuit breaker для Bot API ---
+API_RETRIES = int(os.getenv("API_RETRIES", "3"))  # повторы после первой попытки
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "0.5"))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "8"))
+RETRY_AFTER_MAX = float(os.getenv("RETRY_AFTER_MAX", "30"))  # дольше флуд-контроль не ждём
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "1.0"))
+
+NON_ESSENTIAL_METHODS = {"answerCallbackQuery", "sendChatAction"}
+# дублировать можно только идемпотентные запросы — повторный sendMessage дал бы двойное сообщение
+HEDGED_METHODS = {"getMe", "getWebhookInfo", "getFile", "getChat"}
+# повтор этих запросов после таймаута безопасен; остальные (send*, copyMessage) повторяем, только если
+# запрос до Telegram точно не дошёл — иначе стажёр получит сообщение дважды
+IDEMPOTENT_METHODS = HEDGED_METHODS | NON_ESSENTIAL_METHODS | {"setWebhook", "deleteWebhook"}
+
+essential_var: ContextVar[bool] = ContextVar("essential", default=True)
+
+@contextlib.contextmanager
+def nonessential():
+    """Отправки внутри блока можно пропустить, пока Bot API деградирован."""
+    token = essential_var.set(False)
+    try:
+        yield
+    finally:
+        essential_var.reset(token)
+
+class CircuitOpen(TelegramAPIError):
+    """Bot API недоступен — второстепенная отправка пропущена."""
 
+class CircuitBreaker:
+    """closed → BREAKER_THRESHOLD сбоев подряд → open → cooldown → half-open.
+
+    В half-open ровно один запрос уходит пробным: ответ замыкает breaker, сбой размыкает снова на cooldown.
+    Пока breaker не замкнут, второстепенные отправки пропускаются, остальные идут одной попыткой без повторов.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False  # пробный запрос half-open уже в полёте
+        self.last_success: float | None = None  # time.time() последнего ответа Bot API, для /readyz
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def try_probe(self) -> bool:
+        """True — этот запрос пробный (half-open); вызывающий обязан вызвать end_probe()."""
+        if self.state != "half_open":
+            return False
+        self.probing = True
+        return True
+
+    def end_probe(self):
+        self.probing = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.warning("✅ Bot API снова отвечает — circuit breaker замкнут")
+        self.failures = 0
+        self.opened_at = None
+        self.last_success = time.time()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning("⚡ Bot API деградировал (%s сбоев подряд) — второстепенные отправки отключены на %s с",
+                               self.failures, self.cooldown)
+            self.opened_at = time.monotonic()  # и проба не удалась — снова ждём cooldown
+
+FILE_TOO_LARGE = "File too large"  # 413: aiogram поднимает NetworkError, но повтор не поможет
+
+def is_transient(error: Exception) -> bool:
+    """Сетевые ошибки и 5xx — сбой по дороге или у Telegram; 4xx (и 413) — ошибка запроса, повтор не поможет."""
+    if isinstance(error, NetworkError):
+        return not str(error).startswith(FILE_TOO_LARGE)
+    if isinstance(error, (RestartingTelegram, asyncio.TimeoutError)):
+        return True
+    # 5xx aiogram поднимает голым TelegramAPIError, неизвестные 4xx — с суффиксом "[4xx]"
+    return type(error) is TelegramAPIError and not re.search(r"\[4\d\d\]$", str(error))
+
+def not_delivered(error: Exception) -> bool:
+    """Запрос точно не выполнен: соединение не установилось или Telegram ответил, что перезапускается.
+
+    Таймаут, обрыв после отправки и прочие 5xx этого не доказывают — сообщение могло уже уйти.
+    aiogram заворачивает ошибку aiohttp в NetworkError без from, но исходная остаётся в __context__.
+    """
+    if isinstance(error, RestartingTelegram):
+        return True
+    return isinstance(error, NetworkError) and isinstance(error.__context__, aiohttp.ClientConnectorError)
+
+def _rewind_files(files: dict | None):
+    for f in (files or {}).values():
+        fileobj = f.file if isinstance(f, InputFile) else f[1] if isinstance(f, tuple) else f
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+
+# --- Init bot & dispatcher ---
+class CourseBot(Bot):
+    """Bot с единой точкой входа для всех запросов к Bot API."""
+
+    _shared_session = None  # один пул HTTP-соединений на все боты процесса
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+    async def get_new_session(self):
+        if CourseBot._shared_session is None or CourseBot._shared_session.closed:
+            CourseBot._shared_session = await super().get_new_session()
+        return CourseBot._shared_session
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span(f"api.{method}", "api", files=sorted(files) if files else None):
+                result = await self._resilient_request(method, data, files, **kwargs)
+            if files:
+                media_cache.remember(self.id, files, result)
+            return result
+        finally:
+            logger.debug("api %s %.1f ms", method, (time.perf_counter() - started) * 1000,
+                         extra={"event": "api_call"})
+
+    async def _resilient_request(self, method, data, files, **kwargs):
+        breaker = self.breaker
+        probe = breaker.try_probe()
+        try:
+            degraded = breaker.is_open
+            if degraded and not probe and (method in NON_ESSENTIAL_METHODS or not essential_var.get()):
+                raise CircuitOpen(f"{method} пропущен: Bot API деградировал")
+
+            call = functools.partial(super().request, method, data, files, **kwargs)
+            retries = 0 if degraded else API_RETRIES  # пока breaker не замкнут — одна попытка, без лавины повторов
+            attempt = 0
+            while True:
+                try:
+                    result = await (self._hedged(call) if method in HEDGED_METHODS else call())
+                except RetryAfter as e:
+                    if attempt >= retries or e.timeout > RETRY_AFTER_MAX:
+                        raise
+                    logger.warning("Флуд-контроль на %s — ждём %s с", method, e.timeout, extra={"event": "retry"})
+                    await pause(e.timeout)
+                except Exception as e:
+                    if not is_transient(e):
+                        breaker.record_success()  # API ответил осмысленной ошибкой — он жив
+                        raise
+                    breaker.record_failure()
+                    if attempt >= retries or not (method in IDEMPOTENT_METHODS or not_delivered(e)):
+                        raise
+                    delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))  # full jitter
+                    logger.warning("%s: %s — повтор через %.2f с", method, e, delay, extra={"event": "retry"})
+                    await pause(delay)
+                else:
+                    breaker.record_success()
+                    return result
+                attempt += 1
+                _rewind_files(files)
+        finally:
+            if probe:
+                breaker.end_probe()
+
+    @staticmethod
+    async def _hedged(call):
+        """Если ответа нет за HEDGE_DELAY — шлём дубль и берём первый успешный."""
+        tasks = {asyncio.ensure_future(call())}
+        done, _ = await asyncio.wait(tasks, timeout=HEDGE_DELAY)
+        if not done:
+            tasks.add(asyncio.ensure_future(call()))
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+# задачи апдейтов, которые сейчас обрабатываются: при остановке ждём их, а не обрываем на полуслове
+inflight_updates: set = set()
+draining = False  # идёт остановка: новые апдейты не берём, Telegram доставит их следующему процессу
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """update_id в contextvar — им помечаются все логи и вызовы API в рамках апдейта."""
+
+    first_update = True
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        update_id_var.set(update.update_id)
+        task = asyncio.current_task()
+        inflight_updates.add(task)
+        task.add_done_callback(inflight_updates.discard)
+        if UpdateContextMiddleware.first_update:
+            UpdateContextMiddleware.first_update = False
+            logger.info("⏱️ Первый апдейт через %.2f с после старта процесса", time.perf_counter() - STARTUP_T0,
+                        extra={"event": "startup"})
+
+class CourseStorage(JSONStorage):
+    """JSONStorage, у которого каждая операция видна в трассировке, а данные сбрасываются на диск по ходу работы.
+
+    Сам JSONStorage пишет файл только в close(): падение, OOM или SIGKILL теряли бы всё с момента старта.
+    Здесь изменения помечают хранилище грязным, и раз в STORAGE_FLUSH_INTERVAL оно целиком пишется
+    во временный файл с os.replace — на диске всегда целый JSON не старше интервала.
+    """
+
+    def __init__(self, path: Path):
+        self.dirty_since: float | None = None  # monotonic первой несохранённой правки
+        self.flushed_at: float | None = None  # time.time() последней удачной записи
+        self.flush_error: str | None = None  # чем упала последняя запись; для /readyz
+        super().__init__(path)
+
+    @property
+    def dirty(self) -> bool:
+        return self.dirty_since is not None
+
+    @dirty.setter
+    def dirty(self, value: bool):
+        if not value:
+            self.dirty_since = None
+        elif self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+
+    def write(self, path: Path):
+        _write_text(path, json.dumps(self.data, ensure_ascii=False))  # и в close(): атомарно, без indent
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        since, self.dirty = self.dirty_since, False
+        # сериализуем в loop — хендлеры не поменяют данные посреди dumps; пишем в потоке
+        text = json.dumps(self.data, ensure_ascii=False)
+        try:
+            await asyncio.to_thread(_write_text, self.path, text)
+        except OSError as e:
+            self.dirty_since = since  # повторим на следующем проходе; несохранённое — с той же первой правки
+            self.flush_error = str(e)
+            logger.exception("Не удалось сохранить FSM-хранилище %s", self.path)
+        else:
+            self.flushed_at, self.flush_error = time.time(), None
+
+    async def flush_periodically(self):
+        try:
+            while True:
+                await asyncio.sleep(STORAGE_FLUSH_INTERVAL)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def get_state(self, **kwargs):
+        with span("storage.get_state", "storage"):
+            return await super().get_state(**kwargs)
+
+    async def set_state(self, **kwargs):
+        with span("storage.set_state", "storage"):
+            self.dirty = True
+            return await super().set_state(**kwargs)
+
+    async def get_data(self, **kwargs):
+        with span("storage.get_data", "storage"):
+            return await super().get_data(**kwargs)
+
+    async def set_data(self, **kwargs):
+        with span("storage.set_data", "storage"):
+            self.dirty = True
+            return await super().set_data(**kwargs)
+
+    async def update_data(self, **kwargs):
+        with span("storage.update_data", "storage"):
+            self.dirty = True
+            return await super().update_data(**kwargs)
+
+    async def get_bucket(self, **kwargs):
+        with span("storage.get_bucket", "storage"):
+            return await super().get_bucket(**kwargs)
+
+    async def set_bucket(self, **kwargs):
+        with span("storage.set_bucket", "storage"):
+            self.dirty = True
+            return await super().set_bucket(**kwargs)
+
+    async def update_bucket(self, **kwargs):
+        with span("storage.update_bucket", "storage"):
+            self.dirty = True
+            return await super().update_bucket(**kwargs)
+
+def _write_text(path: Path, text: str):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)  # атомарно: файл не окажется обрезанным при падении посреди записи
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает корневой спан на апдейт и пишет трассу в TRACE_FILE после обработки."""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if random.random() >= TRACE_SAMPLE:
+            return
+        trace = Trace(update.update_id)
+        trace.root = Span(trace, "update", "update", {"update_id": update.update_id}).__enter__()
+        trace_var.set(trace)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._annotate(data, message.from_user.id, "message")
+
+    async def on_process_callback_query(self, cq: types.CallbackQuery, data: dict):
+        self._annotate(data, cq.from_user.id, cq.data)
+
+    @staticmethod
+    def _annotate(data: dict, user_id: int, what: str):
+        # process_* вызывается после выбора хендлера — подписываем корневой спан его именем
+        trace = trace_var.get()
+        if trace is not None:
+            trace.root.name = f"{current_handler.get().__name__} ({what})"
+            trace.root.args["user_id"] = user_id
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        trace = trace_var.get()
+        if trace is None:
+            return
+        trace_var.set(None)
+        trace.root.__exit__(None, None, None)
+        trace.events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": trace.tid,
+                             "args": {"name": f"update {trace.tid} · user {trace.root.args.get('user_id', '?')}"}})
+        await asyncio.to_thread(_write_trace, trace.events)
+
+# --- Тенанты: несколько ботов-онбордингов в одном процессе ---
+# Все тенанты делят event loop, Dispatcher с хендлерами, пул HTTP-соединений и кеш медиа;
+# у каждого свой токен, владелец, картинки курса, FSM и файлы результатов.
+class Tenant:
+    def __init__(self, name: str, token: str, owner_chat_id: int = 0,
+                 images_dir: Path | None = None, results_dir: Path = RESULTS_DIR, locales_dir: Path | None = None):
+        self.name = name
+        self.token = token
+        self.owner_chat_id = owner_chat_id
+        self.images_dir = images_dir  # свои картинки курса; чего там нет — берётся из IMAGES_DIR
+        self.locales_dir = locales_dir  # свои тексты курса поверх общих (см. t())
+        results_dir.mkdir(parents=True, exist_ok=True)
+        self.answers_file = results_dir / "answers.jsonl"  # по строке JSON на каждый ответ стажёра
+        self.screening_file = results_dir / "screening.jsonl"
+        self.broadcast_file = results_dir / "broadcast.json"  # чекпоинт рассылки
+        self.experiments_file = results_dir / "experiments.json"  # счётчики A/B-экспериментов
+        self.reminders_file = results_dir / "reminders.v2.bin"  # очередь напоминаний; v2 — id стажёра отдельным словом
+        self.bot = CourseBot(token=token)
+        self.storage = CourseStorage(results_dir / "fsm_storage.json")  # состояния и чекпоинты переживают рестарт
+        self.webhook_url = urljoin(BASE_URL, WEBHOOK_PATH.format(tenant=name))
+        # secret_token для setWebhook: Telegram присылает его в X-Telegram-Bot-Api-Secret-Token.
+        # Выводим из токена — стабилен между рестартами и не хранится отдельно
+        self.webhook_secret = hmac.new(token.encode(), b"webhook-secret", hashlib.sha256).hexdigest()
+        self.broadcast: "Broadcast | None" = None
+        self.reminders_task: asyncio.Task | None = None
+        self.storage_task: asyncio.Task | None = None
+        self.asset_problems: list = []  # результат audit_assets на старте
+
+    @functools.cached_property
+    def screener(self) -> "AnswerScreener":
+        return AnswerScreener(self.screening_file)
+
+    @functools.cached_property
+    def callback_hmac(self):
+        # ключ подписи callback_data выводим из токена: кнопки одного бота не подходят другому;
+        # подготовленный HMAC копируем на каждую кнопку вместо повторной инициализации ключа
+        return hmac.new(hashlib.sha256(b"callback-data:" + self.token.encode()).digest(), digestmod=hashlib.sha256)
+
+    @functools.cached_property
+    def reminders(self) -> "ReminderQueue":
+        return ReminderQueue(self.reminders_file)
+
+    @functools.cached_property
+    def catalogs(self) -> dict:
+        return load_catalogs(self.locales_dir) if self.locales_dir else {}
+
+def load_tenants() -> list:
+    """TENANTS_FILE — список {"name", "token_env", "owner_chat_id", "images_dir", "locales_dir"}; без него — один бот из .env.
+
+    Шаги курса (хендлеры, кнопки, квизы) у всех тенантов общие; своё у тенанта — тексты и картинки.
+    """
+    if not TENANTS_FILE.exists():
+        return [Tenant("default", API_TOKEN, OWNER_CHAT_ID)]
+    tenants = []
+    for cfg in json.loads(TENANTS_FILE.read_text(encoding="utf-8")):
+        token = os.getenv(cfg["token_env"])
+        if not token:
+            raise RuntimeError(f"{cfg['token_env']} not set in .env (tenant {cfg['name']})")
+        images_dir = Path(cfg["images_dir"]) if cfg.get("images_dir") else None
+        locales_dir = Path(cfg["locales_dir"]) if cfg.get("locales_dir") else None
+        tenants.append(Tenant(cfg["name"], token, int(cfg.get("owner_chat_id", 0)), images_dir,
+                              RESULTS_DIR / cfg["name"], locales_dir))
+    return tenants
+
+TENANTS = load_tenants()
+TENANTS_BY_NAME = {tenant.name: tenant for tenant in TENANTS}
+tenant_var: ContextVar[Tenant | None] = ContextVar("tenant", default=None)
+
+def current_tenant() -> Tenant:
+    return tenant_var.get() or TENANTS[0]
+
+def use_tenant(tenant: Tenant):
+    """Всё, что выполняется дальше в этом контексте (и запущенные из него задачи), работает от имени тенанта."""
+    tenant_var.set(tenant)
+    Bot.set_current(tenant.bot)
+
+class CurrentBot:
+    """`bot` в хендлерах — бот тенанта, чей апдейт сейчас обрабатывается."""
+
+    def __getattr__(self, name):
+        return getattr(current_tenant().bot, name)
+
+class TenantStorage(BaseStorage):
+    """FSM-хранилище текущего тенанта: одинаковые chat/user у разных ботов не пересекаются."""
+
+    @staticmethod
+    def _storage() -> CourseStorage:
+        return current_tenant().storage
+
+    async def close(self):
+        for tenant in TENANTS:
+            await tenant.storage.close()
+
+    async def wait_closed(self):
+        for tenant in TENANTS:
+            await tenant.storage.wait_closed()
+
+    async def get_state(self, **kwargs):
+        return await self._storage().get_state(**kwargs)
+
+    async def get_data(self, **kwargs):
+        return await self._storage().get_data(**kwargs)
+
+    async def set_state(self, **kwargs):
+        return await self._storage().set_state(**kwargs)
+
+    async def set_data(self, **kwargs):
+        return await self._storage().set_data(**kwargs)
+
+    async def update_data(self, **kwargs):
+        return await self._storage().update_data(**kwargs)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, **kwargs):
+        return await self._storage().get_bucket(**kwargs)
+
+    async def set_bucket(self, **kwargs):
+        return await self._storage().set_bucket(**kwargs)
+
+    async def update_bucket(self, **kwargs):
+        return await self._storage().update_bucket(**kwargs)
+
+@web.middleware
+async def webhook_guard(request: web.Request, handler):
+    """Дешёвый отсев до разбора JSON: чужой секрет, не тот метод, тип или размер тела."""
+    if "tenant" not in request.match_info:
+        return await handler(request)  # не вебхук
+    tenant = TENANTS_BY_NAME.get(request.match_info["tenant"])
+    if tenant is None:
+        return web.Response(status=404)
+    if request.method != "POST":
+        return web.Response(status=405)
+    if not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), tenant.webhook_secret):
+        logger.debug("Вебхук %s: неверный secret token от %s", tenant.name, request.remote, extra={"event": "webhook"})
+        return web.Response(status=401)
+    if request.content_length is None or request.content_length > WEBHOOK_MAX_BODY:
+        return web.Response(status=413)
+    if request.content_type != "application/json":
+        return web.Response(status=415)
+    if draining:
+        return web.Response(status=503)  # не 2xx — Telegram повторит апдейт, его примет новый процесс
+    request["tenant"] = tenant
+    return await handler(request)
+
+class TenantWebhookHandler(WebhookRequestHandler):
+    """Один маршрут на все боты; тенанта уже проверил и определил webhook_guard."""
+
+    def get_dispatcher(self):
+        dispatcher = super().get_dispatcher()
+        use_tenant(self.request["tenant"])
+        return dispatcher
+
+    async def parse_update(self, bot):
+        try:
+            return await super().parse_update(bot)
+        except (ValueError, TypeError):
+            raise web.HTTPBadRequest() from None  # битый JSON или не объект апдейта
+
+    async def process_update(self, update):
+        try:
+            return await super().process_update(update)
+        except asyncio.CancelledError:
+            if draining:
+                # хендлер не уложился в DRAIN_TIMEOUT: без 2xx Telegram пришлёт апдейт заново после рестарта
+                raise web.HTTPServiceUnavailable() from None
+            raise
+
+# --- Очередь апдейтов по чатам ---
+# Апдейты одного чата обрабатываются строго по очереди: кнопка, нажатая, пока objection_expensive ещё
+# выдерживает паузы, ждёт его окончания — сообщения не перемешиваются, а запись FSM (update_data,
+# потом state.proxy) не гоняется с соседним хендлером. Разные чаты идут параллельно.
+MAILBOX_WARN_DEPTH = int(os.getenv("MAILBOX_WARN_DEPTH", "5"))  # столько апдейтов чата в очереди — уже флуд
+
+class Mailbox:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # FIFO: апдейты выполняются в порядке прихода
+        self.depth = 0  # выполняется + ждут
+
+class Mailboxes:
+    """Ящик живёт, пока в нём есть апдейты: память — по числу активных сейчас чатов, а не всех стажёров."""
+
+    def __init__(self):
+        self.boxes: dict[tuple, Mailbox] = {}
+        self.max_depth = 0
+        self.waited = 0  # апдейтов, ждавших своей очереди
+        self.wait_total = 0.0  # с
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: tuple):
+        box = self.boxes.get(key)
+        if box is None:
+            box = self.boxes[key] = Mailbox()
+        box.depth += 1
+        if box.depth > self.max_depth:
+            self.max_depth = box.depth
+        if box.depth == MAILBOX_WARN_DEPTH:
+            logger.warning("📬 В очереди чата %s уже %s апдейтов", key[1], box.depth, extra={"event": "mailbox"})
+        try:
+            if box.lock.locked():
+                started = time.monotonic()
+                await box.lock.acquire()
+                self.waited += 1
+                self.wait_total += time.monotonic() - started
+            else:
+                await box.lock.acquire()
+            try:
+                yield
+            finally:
+                box.lock.release()
+        finally:
+            box.depth -= 1
+            if box.depth == 0:
+                del self.boxes[key]  # ящик пуст — убираем сразу, GC по таймеру не нужен
+
+    def metrics(self) -> dict:
+        depths = [box.depth for box in self.boxes.values()]
+        return {"active": len(depths), "queued": sum(depths) - len(depths), "depth_now": max(depths, default=0),
+                "depth_max": self.max_depth, "waited": self.waited,
+                "wait_avg_ms": round(self.wait_total / self.waited * 1000, 1) if self.waited else 0.0}
+
+mailboxes = Mailboxes()
+
+def update_chat_id(update: types.Update) -> int | None:
+    event = update.message or update.edited_message or update.callback_query or update.my_chat_member
+    if event is None:
+        return None
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    return chat.id if chat else event.from_user.id
+
+class CourseDispatcher(Dispatcher):
+    """Dispatcher, у которого у каждого чата свой последовательный ящик."""
+
+    async def process_update(self, update: types.Update):
+        chat_id = update_chat_id(update)
+        if chat_id is None:
+            return await super().process_update(update)
+        # повтор нажатия отвечаем до очереди чата: иначе он ждал бы, пока идёт медленный шаг, и держал ящик
+        key = debounce.claim(update.callback_query) if update.callback_query else None
+        if key is False:
+            await safe_answer(update.callback_query)
+            return None
+        try:
+            async with mailboxes.slot((current_tenant().name, chat_id)):
+                return await super().process_update(update)
+        finally:
+            if key:
+                debounce.release(key)
+
+bot = CurrentBot()
+storage = TenantStorage()
+dp = CourseDispatcher(TENANTS[0].bot, storage=storage)
+startup_mark("bots + storage")
+dp.middleware.setup(UpdateContextMiddleware())
+if TRACE_FILE:
+    dp.middleware.setup(TracingMiddleware())
+
+# --- States ---
 class Form(StatesGroup):
     waiting_for_name = State()
     waiting_for_onlyfans = State()
@@ -56,22 +868,340 @@ class Form(StatesGroup):
     waiting_for_balance_answer = State()
 
 
+# --- Локализация ---
+# Исходные тексты курса — русские строки прямо в коде, они же ключи каталогов locales/<язык>.json.
+# Каталоги компилируются один раз при старте: статичный текст — готовая строка, шаблон с {name} —
+# заранее разобранные куски, так что на запрос нет ни парсинга, ни f-строк.
+LOCALES_DIR = Path("locales")
+SOURCE_LOCALE = "ru"
+DEFAULT_LOCALE = os.getenv("DEFAULT_LOCALE", SOURCE_LOCALE)  # для языков, которых нет в каталогах
+
+locale_var: ContextVar[str] = ContextVar("locale", default=DEFAULT_LOCALE)
+
+_CONVERSIONS = {None: lambda value: value, "s": str, "r": repr, "a": ascii}
+
+def compile_template(template: str):
+    parts = [(literal, field, spec, _CONVERSIONS[conversion])
+             for literal, field, spec, conversion in string.Formatter().parse(template)]
+    if all(field is None for _, field, _, _ in parts):
+        static = "".join(literal for literal, _, _, _ in parts)
+        return lambda **kwargs: static
+    def render(**kwargs):
+        return "".join(literal + (format(convert(kwargs[field]), spec) if field is not None else "")
+                       for literal, field, spec, convert in parts)
+    return render
+
+_compile_source = functools.lru_cache(maxsize=None)(compile_template)
+
+def template_fields(template: str) -> set:
+    return {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+
+def load_catalogs(directory: Path = LOCALES_DIR) -> dict:
+    """Каталоги языков; перевод с другим набором {полей}, чем у исходного текста, — ошибка старта, а не KeyError
+    посреди курса."""
+    catalogs, errors = {}, []
+    for path in sorted(directory.glob("*.json")):
+        catalog = catalogs[path.stem] = {}
+        for msgid, text in json.loads(path.read_text(encoding="utf-8")).items():
+            if not text:
+                continue
+            try:
+                catalog[msgid] = compile_template(text)
+                if template_fields(text) != template_fields(msgid):
+                    errors.append(f"{path}: {msgid[:50]!r} — поля {sorted(template_fields(text))}, "
+                                  f"в исходном тексте {sorted(template_fields(msgid))}")
+            except ValueError as e:  # непарная скобка
+                errors.append(f"{path}: {msgid[:50]!r} — {e}")
+            except KeyError as e:
+                errors.append(f"{path}: {msgid[:50]!r} — неизвестное преобразование !{e.args[0]}")
+    if errors:
+        raise ValueError("Переводы не совпадают с исходными текстами по подстановкам:\n" + "\n".join(errors))
+    return catalogs
+
+CATALOGS = load_catalogs()
+
+def detect_locale(language_code: str | None) -> str:
+    lang = (language_code or "").split("-")[0].lower()
+    return lang if lang in CATALOGS or lang == SOURCE_LOCALE else DEFAULT_LOCALE
+
+def t(msgid: str, **kwargs) -> str:
+    """Текст на языке текущего пользователя: сначала из каталога тенанта (его ru.json правит и исходный русский),
+    потом из общего; нет перевода — исходный русский."""
+    locale = locale_var.get()
+    render = (current_tenant().catalogs.get(locale, {}).get(msgid) or CATALOGS.get(locale, {}).get(msgid)
+              or _compile_source(msgid))
+    return render(**kwargs)
+
+def N_(msgid: str) -> str:
+    """Помечает строку-константу для каталогов; переводится при отправке через t()."""
+    return msgid
+
+class LocaleMiddleware(BaseMiddleware):
+    """Язык берём из language_code клиента Telegram — на каждый апдейт."""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        event = update.message or update.edited_message or update.callback_query
+        user = event.from_user if event else None
+        locale_var.set(detect_locale(user.language_code if user else None))
+
+dp.middleware.setup(LocaleMiddleware())
+
+# --- Callback-данные: компактный подписанный формат ---
+# callback_data = "~" + base64url(varint id шага, varint версия шага, varint-аргументы…, 6 байт HMAC).
+# Хендлеры по-прежнему фильтруют по имени шага (c.data == "rules"): middleware декодирует данные до фильтров,
+# аргументы кладёт в data["callback_args"]. Кнопки старых деплоев и подделки уводят на текущий шаг курса.
+CALLBACK_PREFIX = "~"
+CALLBACK_MAC_SIZE = 6
+CALLBACK_MAX_LEN = 64  # лимит Bot API на callback_data
+
+# id шага — индекс в кортеже: только дописываем в конец, иначе старые кнопки поедут на чужие шаги
+CALLBACK_STEPS = (
+    "resume", "restart", "agree_conditions", "onlyfans_yes", "onlyfans_no", "of_next_1", "of_next_2",
+    "how_to_earn", "find_clients", "find_clients_done", "diff_mailings", "mailing_done", "start_questions",
+    "soft_tools", "teamwork_info_final", "after_teamwork_question", "objection_expensive", "objection_trust",
+    "objection_deceive", "objection_money", "objection_love", "objection_next1", "objection_next2", "rules",
+    "rules_agency", "rules_next", "checklist", "start_quiz",
+)
+CALLBACK_IDS = {step: step_id for step_id, step in enumerate(CALLBACK_STEPS)}
+# поменялся смысл шага — поднимаем версию, и его старые кнопки считаются устаревшими
+STEP_VERSIONS = {}
+
+STALE_CALLBACK_NOTICE = N_("Эта кнопка устарела — продолжаем с того места, где ты остановился(-ась).")
+
+callback_notice: ContextVar[str | None] = ContextVar("callback_notice", default=None)
+
+class StaleCallback(Exception):
+    pass
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, value = value & 0x7F, value >> 7
+        if not value:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+def _read_varints(payload: bytes) -> list:
+    values, value, shift = [], 0, 0
+    for byte in payload:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value, shift = 0, 0
+    if shift:
+        raise StaleCallback("обрезанный varint")
+    return values
+
+def _callback_mac(payload: bytes) -> bytes:
+    mac = current_tenant().callback_hmac.copy()
+    mac.update(payload)
+    return mac.digest()[:CALLBACK_MAC_SIZE]
+
+def cb(step: str, *args: int) -> str:
+    """callback_data для кнопки шага; args — неотрицательные целые (когорта, номер варианта…)."""
+    payload = b"".join(_varint(v) for v in (CALLBACK_IDS[step], STEP_VERSIONS.get(step, 1), *args))
+    data = CALLBACK_PREFIX + base64.urlsafe_b64encode(payload + _callback_mac(payload)).rstrip(b"=").decode()
+    if len(data) > CALLBACK_MAX_LEN:
+        raise ValueError(f"callback_data шага {step} длиннее {CALLBACK_MAX_LEN} байт")
+    return data
+
+def decode_callback(data: str | None) -> tuple:
+    """(шаг, args) или StaleCallback — для устаревших, чужих и повреждённых кнопок."""
+    if not data or not data.startswith(CALLBACK_PREFIX):
+        raise StaleCallback("формат до кодека")
+    try:
+        raw = base64.urlsafe_b64decode(data[1:] + "=" * (-len(data[1:]) % 4))
+    except ValueError:
+        raise StaleCallback("не base64") from None
+    payload, mac = raw[:-CALLBACK_MAC_SIZE], raw[-CALLBACK_MAC_SIZE:]
+    if not payload or not hmac.compare_digest(mac, _callback_mac(payload)):
+        raise StaleCallback("неверная подпись")
+    values = _read_varints(payload)
+    if len(values) < 2 or values[0] >= len(CALLBACK_STEPS):
+        raise StaleCallback("неизвестный шаг")
+    step = CALLBACK_STEPS[values[0]]
+    if values[1] != STEP_VERSIONS.get(step, 1):
+        raise StaleCallback(f"версия {values[1]} шага {step}")
+    return step, tuple(values[2:])
+
+class CallbackCodecMiddleware(BaseMiddleware):
+    """Декодирует callback_data до фильтров; негодную кнопку превращает в «Продолжить» с подсказкой."""
+
+    async def on_pre_process_callback_query(self, cq: types.CallbackQuery, data: dict):
+        try:
+            cq.data, data["callback_args"] = decode_callback(cq.data)
+        except StaleCallback as e:
+            logger.info("Устаревшая кнопка от %s (%s) — возвращаем на текущий шаг", cq.from_user.id, e,
+                        extra={"event": "callback"})
+            callback_notice.set(t(STALE_CALLBACK_NOTICE))
+            cq.data, data["callback_args"] = "resume", ()
+
+dp.middleware.setup(CallbackCodecMiddleware())
+
+# --- Двойные нажатия ---
+# Повторное нажатие той же кнопки, пока её хендлер ещё работает или только что закончил, не запускает шаг
+# заново (повторные загрузки, паузы и сообщения) — Telegram сразу получает ответ на callback.
+# Проверка — в CourseDispatcher.process_update, до очереди чата и middleware; ключ — сырые callback_data:
+# повтор той же кнопки даёт те же байты, декодировать их ради этого не нужно.
+DEBOUNCE_WINDOW = float(os.getenv("DEBOUNCE_WINDOW", "1.5"))  # сек после завершения хендлера
+DEBOUNCE_INFLIGHT_TTL = 120.0  # страховка, если post_process не дошёл: ключ отпустит сам
+DEBOUNCE_MAX_KEYS = int(os.getenv("DEBOUNCE_MAX_KEYS", "10000"))
+
+class Debounce:
+    """Схлопывает повторные нажатия по ключу (тенант, чат, кнопка); память ограничена LRU на DEBOUNCE_MAX_KEYS."""
+
+    def __init__(self):
+        self.busy_until = OrderedDict()  # ключ -> monotonic-время, до которого повтор игнорируем
+
+    def claim(self, cq: types.CallbackQuery) -> tuple | bool:
+        """Ключ нажатия — или False, если это повтор."""
+        key = (current_tenant().name, cq.from_user.id, cq.data)
+        now = time.monotonic()
+        if self.busy_until.get(key, 0.0) > now:
+            logger.debug("Повторное нажатие %s от %s — пропускаем", cq.data, cq.from_user.id,
+                         extra={"event": "callback"})
+            return False
+        self.busy_until[key] = now + DEBOUNCE_INFLIGHT_TTL
+        self.busy_until.move_to_end(key)
+        while len(self.busy_until) > DEBOUNCE_MAX_KEYS:
+            self.busy_until.popitem(last=False)
+        return key
+
+    def release(self, key: tuple):
+        """Хендлер закончил: повторы ещё DEBOUNCE_WINDOW секунд игнорируем."""
+        if key in self.busy_until:
+            self.busy_until[key] = time.monotonic() + DEBOUNCE_WINDOW
+
+debounce = Debounce()
+
 # --- Helpers ---
-def input_file_safe(path):
-    if not path:
-        return None
-    p = Path(path)
-    if p.exists():
-        return InputFile(str(p))
-    return None
+class MediaCache:
+    """file_id — свой у каждого бота (между ботами он не переносится). Байты в памяти не держим:
+    файл читается с диска, только пока у бота нет его file_id, — это одна загрузка на бота за деплой."""
+
+    def __init__(self):
+        self.file_ids: dict[tuple, str] = {}  # (bot_id, поле, путь) -> file_id
+        self.upload_locks: dict[tuple, asyncio.Lock] = {}
+
+    def get(self, path: Path, field: str):
+        file_id = self.file_ids.get((current_tenant().bot.id, field, path))
+        if file_id:
+            return file_id  # повторная отправка без загрузки файла
+        f = InputFile(path)  # дескриптор закрывает InputFile.__del__; при ретрае файл перематывается
+        f.media_key = (field, path)
+        return f
+
+    def upload_lock(self, path: Path, field: str):
+        """Пока у бота нет file_id файла, загрузки идут по одной: остальные дождутся file_id первой."""
+        key = (current_tenant().bot.id, field, path)
+        if key in self.file_ids:
+            return contextlib.nullcontext()
+        return self.upload_locks.setdefault(key, asyncio.Lock())
+
+    def remember(self, bot_id: int, files: dict, result: dict):
+        for field, f in files.items():
+            key = getattr(f, "media_key", None)
+            if key is None or not isinstance(result, dict) or field not in result:
+                continue
+            uploaded = result[field]
+            uploaded = uploaded[-1] if isinstance(uploaded, list) else uploaded  # у фото — список размеров
+            self.file_ids[(bot_id, *key)] = uploaded["file_id"]
+
+media_cache = MediaCache()
+
+def media_path(name: str, tenant: Tenant | None = None) -> Path:
+    """Картинка курса: сначала из папки тенанта, иначе общая из IMAGES_DIR."""
+    images_dir = (tenant or current_tenant()).images_dir
+    if images_dir and (images_dir / name).exists():
+        return images_dir / name
+    return IMAGES_DIR / name
+
+def media_file(path: Path, field: str = "photo"):
+    """Вместо open(path, "rb"): file_id, если этот бот файл уже загружал, иначе файл с диска."""
+    return media_cache.get(Path(path), field)
+
+# --- Видео курса ---
+# Исходник готовится офлайн: python telegram_bot.py --prepare-video исходник.mp4 — ffmpeg пережимает его
+# под Telegram и кладёт рядом превью (<имя>.thumb.jpg) и метаданные (<имя>.json). На старте видео проверяются;
+# загружается файл потоком с диска один раз на бота за деплой, дальше уходит file_id.
+COURSE_VIDEOS = ("onlymonster_intro.mp4",)
+VIDEO_MAX_BYTES = 50 * 1024 * 1024  # лимит Bot API на загрузку файла ботом
+VIDEO_TARGET_BYTES = int(os.getenv("VIDEO_TARGET_MB", "20")) * 1024 * 1024  # цель для --prepare-video
+
+video_meta: dict[Path, dict] = {}  # видео, прошедшие проверку на старте -> duration/width/height/thumb
+
+def check_videos(tenant: Tenant) -> list:
+    """Проверяет видео курса и читает их метаданные; возвращает список проблем для /readyz."""
+    problems = []
+    for name in COURSE_VIDEOS:
+        path = media_path(name, tenant)
+        if not path.exists():
+            logger.warning("🎬 Видео %s не найдено (%s) — шаг курса пройдёт без него", path, tenant.name)
+            problems.append(f"missing {path}")
+            continue
+        if path.stat().st_size > VIDEO_MAX_BYTES:
+            logger.warning("🎬 Видео %s больше 50 МБ — Bot API его не примет, подготовь: --prepare-video", path)
+            problems.append(f"too large {path}")
+            continue
+        meta_path = path.with_suffix(".json")
+        if meta_path.exists():
+            video_meta[path] = json.loads(meta_path.read_text(encoding="utf-8"))
+        else:
+            logger.warning("🎬 У видео %s нет метаданных — уйдёт без превью и длительности (--prepare-video)", path)
+            video_meta[path] = {}
+    return problems
+
+# все картинки, на которые ссылаются шаги курса (media_path(...) в хендлерах)
+COURSE_IMAGES = (
+    "welcome.jpg", "onlyfans_intro.jpg", "of_people.jpg", "find_clients.jpg", "vip.jpg", "online.jpg",
+    "mass.jpg", "onlymonster_image.jpg", "teamwork_image.jpg", "objections_intro.jpg", "fines.png",
+    "reasons.png", "checklist.jpg", "content.jpg",
+)
+
+def audit_assets(tenant: Tenant):
+    """Аудит медиа на старте: чего не хватает, видно в логе и в /readyz, а не когда стажёр дойдёт до шага."""
+    problems = [f"missing {path}" for path in (media_path(name, tenant) for name in COURSE_IMAGES)
+                if not path.exists()]
+    for problem in problems:
+        logger.warning("🖼 Картинка курса: %s (%s) — шаг уйдёт без неё", problem, tenant.name)
+    tenant.asset_problems = problems + check_videos(tenant)
+    if tenant.catalogs:  # тексты тенанта читаем на старте, а не на первом апдейте
+        logger.info("🌐 Тексты %s: %s", tenant.name,
+                    ", ".join(f"{locale} ({len(messages)})" for locale, messages in tenant.catalogs.items()))
+
+async def send_course_video(chat_id: int, name: str):
+    path = media_path(name)
+    meta = video_meta.get(path)
+    if meta is None:
+        return  # не прошло проверку на старте — об этом уже предупредили в логе
+    try:
+        async with media_cache.upload_lock(path, "video"):
+            video = media_cache.get(path, "video")
+            thumb = path.with_name(meta["thumb"]) if meta.get("thumb") and isinstance(video, InputFile) else None
+            with nonessential():
+                await bot.send_video(
+                    chat_id, video=video, thumb=InputFile(thumb) if thumb else None,
+                    duration=meta.get("duration"), width=meta.get("width"), height=meta.get("height"),
+                    supports_streaming=True,
+                )
+    except CircuitOpen:
+        pass
+    except TelegramAPIError:
+        logger.exception("Не удалось отправить видео %s", path)
 
 async def safe_answer(cq: types.CallbackQuery):
     """Ответ на callback_query, игнорируем 'Query is too old' ошибки."""
     try:
-        # cache_time даёт клиенту знать, что он может не отправлять опять тот же callback
-        await cq.answer(cache_time=1)
+        # cache_time даёт клиенту знать, что он может не отправлять опять тот же callback;
+        # text — подсказка от CallbackCodecMiddleware, если нажата устаревшая кнопка
+        await cq.answer(text=callback_notice.get(), cache_time=1)
     except InvalidQueryID:
         logger.debug("CallbackQuery too old / already answered - ignoring.")
+    except CircuitOpen:
+        logger.debug("Bot API деградировал — ответ на callback пропущен.")  # штатный сброс нагрузки, не ошибка
     except Exception:
         logger.exception("Unexpected error in cq.answer()")
 
@@ -81,16 +1211,21 @@ async def send_photo_with_fallback(chat_id: int, photo_path, caption: str = None
     Пытаемся отправить photo, при ошибке размеров — отправляем документ.
     Если файла нет — отправляем текстовое сообщение.
     """
-    f = input_file_safe(photo_path)
-    if not f:
+    if not photo_path or not Path(photo_path).exists():
         await bot.send_message(chat_id, caption or "", reply_markup=reply_markup, parse_mode=parse_mode)
         return
+    f = media_file(photo_path)
     try:
-        await bot.send_photo(chat_id, photo=f, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+        # картинка второстепенна: при деградации Bot API уходит только текст
+        with nonessential():
+            await bot.send_photo(chat_id, photo=f, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+    except CircuitOpen:
+        await bot.send_message(chat_id, caption or "", reply_markup=reply_markup, parse_mode=parse_mode)
     except PhotoDimensions:
         logger.warning("Photo invalid dimensions — sending as document instead: %s", photo_path)
         try:
-            await bot.send_document(chat_id, document=f, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+            await bot.send_document(chat_id, document=media_file(photo_path, "document"), caption=caption,
+                                    reply_markup=reply_markup, parse_mode=parse_mode)
         except Exception:
             logger.exception("Failed to send document fallback, sending text.")
             await bot.send_message(chat_id, caption or "", reply_markup=reply_markup, parse_mode=parse_mode)
@@ -98,12 +1233,219 @@ async def send_photo_with_fallback(chat_id: int, photo_path, caption: str = None
         logger.exception("Telegram API error while sending photo")
         await bot.send_message(chat_id, caption or "", reply_markup=reply_markup, parse_mode=parse_mode)
 
+_jsonl_lock = threading.Lock()
+
+def _append_jsonl(path: Path, record: dict):
+    line = json.dumps(record, ensure_ascii=False)
+    with _jsonl_lock, path.open("a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+async def save_answer(user: types.User, question: str, answer: str | None):
+    """Дописываем ответ стажёра в answers.jsonl тенанта (state.finish() данные FSM стирает)."""
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "user_id": user.id,
+        "username": user.username or "",
+        "full_name": user.full_name,
+        "question": question,
+        "answer": (answer or "").strip(),
+        "locale": locale_var.get(),
+    }
+    try:
+        # запись в файл — в отдельном потоке, чтобы не блокировать event loop
+        await asyncio.to_thread(_append_jsonl, current_tenant().answers_file, record)
+    except OSError:
+        logger.exception("Не удалось сохранить ответ %s пользователя %s", question, user.id)
+    if question in QUESTION_PROMPTS:
+        # вопрос — на языке стажёра, иначе копипаст английского вопроса не совпадёт с русским текстом
+        answer = (user.id, question, record["answer"], record["ts"], t(QUESTION_PROMPTS[question]))
+        pending = answers_to_screen.get()
+        if pending is None:  # вне апдейта — сразу
+            current_tenant().screener.submit(*answer)
+        else:
+            pending.append(answer)
+
+# --- Скрининг ответов (screening.py) ---
+# save_answer только откладывает ответ в список апдейта; в пул процессов он уходит из post_process —
+# когда хендлер уже ответил стажёру, так что на задержку ответа скрининг не влияет.
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.6"))
+
+answers_to_screen: ContextVar[list | None] = ContextVar("answers_to_screen", default=None)
+
+class ScreeningMiddleware(BaseMiddleware):
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        answers_to_screen.set([])
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        for answer in answers_to_screen.get() or ():
+            current_tenant().screener.submit(*answer)
+
+class AnswerScreener:
+    def __init__(self, path: Path):
+        import screening
+
+        self.path = path
+        self.analyze = screening.analyze
+        self.indexes: dict[str, screening.LSHIndex] = defaultdict(screening.LSHIndex)  # по вопросам
+        self.tasks = set()
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+
+    def submit(self, user_id: int, question: str, answer: str, ts: str, prompt: str):
+        task = asyncio.create_task(self._screen(user_id, question, answer, ts, prompt))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _load_history(self):
+        """Сигнатуры прошлых ответов — чтобы дубликаты ловились и после рестарта."""
+        if not self.path.exists():
+            return
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self.indexes[record["question"]].add(record["user_id"], record["signature"])
+                except (ValueError, KeyError):
+                    continue
+
+    async def _screen(self, user_id: int, question: str, answer: str, ts: str, prompt: str):
+        try:
+            async with self._load_lock:
+                if not self._loaded:
+                    await asyncio.to_thread(self._load_history)
+                    self._loaded = True
+            loop = asyncio.get_running_loop()
+            pool = start_screening_pool()
+            result = await loop.run_in_executor(pool, self.analyze, answer, prompt)
+
+            index = self.indexes[question]
+            duplicate, duplicate_of = index.query(result["signature"], exclude=user_id)
+            index.add(user_id, result["signature"])
+            flags = result["flags"] + (["near_duplicate"] if duplicate >= DUPLICATE_THRESHOLD else [])
+            record = {
+                "ts": ts, "user_id": user_id, "question": question,
+                "effort": result["effort"], "generated": result["generated"],
+                "duplicate": round(duplicate, 3), "duplicate_of": duplicate_of,
+                "flags": flags, "signature": result["signature"],
+            }
+            await asyncio.to_thread(_append_jsonl, self.path, record)
+            if "near_duplicate" in flags or result["generated"] >= 0.5:
+                logger.info("🔎 Ответ %s пользователя %s под подозрением: %s", question, user_id, flags,
+                            extra={"event": "screening"})
+        except Exception:
+            logger.exception("Скрининг ответа %s пользователя %s не удался", question, user_id)
+
+    @staticmethod
+    def shutdown():
+        if screening_pool is not None:
+            screening_pool.shutdown(wait=False, cancel_futures=True)
+
+dp.middleware.setup(ScreeningMiddleware())
+
+# --- Прогресс: чекпоинты шагов курса ---
+# Чекпоинт хранится в bucket FSM (state.finish() его не трогает):
+#   {"state": "QuizStates:q4"} — ждём ответ на вопрос, при возврате задаём его заново;
+#   {"step": "objection_money"} — последний пройденный шаг, при возврате показываем его ещё раз.
+NOT_RESUMABLE = {"onlyfans_yes", "onlyfans_no", "resume", "restart"}
+
+async def get_checkpoint(storage, chat: int, user: int) -> dict | None:
+    bucket = await storage.get_bucket(chat=chat, user=user)
+    return bucket.get("checkpoint")
+
+async def clear_checkpoint(storage, chat: int, user: int):
+    bucket = await storage.get_bucket(chat=chat, user=user)
+    if bucket.pop("checkpoint", None) is not None:
+        await storage.set_bucket(chat=chat, user=user, bucket=bucket)
+
+async def save_checkpoint(storage, chat: int, user: int, step: str | None = None, state_before: str | None = None):
+    state = await storage.get_state(chat=chat, user=user)
+    if state in STATE_PROMPTS:
+        checkpoint = {"state": state}
+    elif step and step not in NOT_RESUMABLE:
+        checkpoint = {"step": step}
+    elif state_before in FINISHING_STATES:
+        # ответ на последний вопрос блока — дальше идёт кнопка следующего раздела
+        checkpoint = {"step": FINISHING_STATES[state_before]}
+    else:
+        return
+    checkpoint["ts"] = int(datetime.now(timezone.utc).timestamp())
+    if locale_var.get() != DEFAULT_LOCALE:
+        checkpoint["locale"] = locale_var.get()  # напоминание уходит вне апдейта — язык берём отсюда
+    bucket = await storage.get_bucket(chat=chat, user=user)
+    bucket["checkpoint"] = checkpoint
+    reminder, queue = bucket.get("reminder"), current_tenant().reminders
+    # живой таймер сам перенесётся на этот чекпоинт, когда сработает. Новый ставим, если живого нет, если он
+    # просрочен (потерян: reminders.v2.bin не успел сохраниться) или сработает позже нужного (после первого
+    # напоминания ждёт второго). Заменённый таймер, всплыв, не совпадёт по сроку с bucket и будет выброшен
+    if checkpoint.get("step") != COURSE_DONE and REMINDER_AFTER and (
+            not reminder or not checkpoint["ts"] // 60 < reminder["due"] <= queue.due(checkpoint["ts"])):
+        bucket["reminder"] = queue.schedule(user, checkpoint["ts"])
+    await storage.set_bucket(chat=chat, user=user, bucket=bucket)
+
+class ProgressMiddleware(BaseMiddleware):
+    """Записывает чекпоинт после каждого обработанного шага курса."""
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        data["_state_before"] = await self.manager.storage.get_state(chat=message.chat.id, user=message.from_user.id)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        data["_progress"] = True
+
+    async def on_process_callback_query(self, cq: types.CallbackQuery, data: dict):
+        # process_* вызывается только если фильтры хендлера прошли — мусорные callback_data не пишем
+        data["_progress"] = True
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        if data.get("_progress"):
+            await save_checkpoint(self.manager.storage, message.chat.id, message.from_user.id,
+                                  state_before=data.get("_state_before"))
+            if data.get("_state_before") in FINISHING_STATES:
+                await record_goal(message.from_user.id, FINISHING_STATES[data["_state_before"]])
+
+    async def on_post_process_callback_query(self, cq: types.CallbackQuery, results, data: dict):
+        if data.get("_progress"):
+            await save_checkpoint(self.manager.storage, cq.from_user.id, cq.from_user.id, step=cq.data)
+            await record_goal(cq.from_user.id, cq.data)
+
+dp.middleware.setup(ProgressMiddleware())
+
+# --- Команды владельца ---
+def is_owner(message: types.Message) -> bool:
+    return message.from_user.id == current_tenant().owner_chat_id
+
+def owner_command(*commands: str):
+    """Регистрирует команду владельца впереди всех хендлеров: хендлеры QuizStates и вопросов курса
+    принимают любой текст, и посреди опроса /export иначе ушёл бы ответом на вопрос."""
+    def decorator(callback):
+        filters = dp.filters_factory.resolve(dp.message_handlers, is_owner, commands=list(commands), state="*")
+        dp.message_handlers.register(callback, filters, index=0)
+        return callback
+    return decorator
+
 # ---------------- HANDLERS / FLOWS ----------------
 
-@dp.message_handler(commands=['start'])
-async def cmd_start(message: types.Message):
-    welcome_img = IMAGES_DIR / "welcome.jpg"
-    caption = (
+@dp.message_handler(commands=['start'], state='*')
+async def cmd_start(message: types.Message, state: FSMContext):
+    checkpoint = await get_checkpoint(dp.storage, message.chat.id, message.from_user.id)
+    if checkpoint and checkpoint.get("step") != COURSE_DONE:
+        # вернувшемуся стажёру не гоняем весь курс заново — предлагаем продолжить
+        kb = InlineKeyboardMarkup(row_width=1).add(
+            InlineKeyboardButton(t("▶️ Продолжить"), callback_data=cb("resume")),
+            InlineKeyboardButton(t("🔄 Начать заново"), callback_data=cb("restart")),
+        )
+        await bot.send_message(
+            message.chat.id,
+            t("С возвращением! 👋\n\nПродолжим с того места, где ты остановился(-ась)?"),
+            reply_markup=kb
+        )
+        return
+
+    await state.finish()
+    await send_welcome(message.chat.id)
+
+async def send_welcome(chat_id: int):
+    welcome_img = media_path("welcome.jpg")
+    caption = t(
         "<b>Добро пожаловать на обучение Eclipse Agency!</b> 🌑\n\n"
         "Я буду твоим личным гидом в освоении роли <b>оператора</b> — сотрудника, "
         "который умеет выстраивать связь, удерживать внимание и превращать диалог в результат.\n\n"
@@ -115,7 +1457,7 @@ async def cmd_start(message: types.Message):
         "⚠️ Комиссия за конвертацию (~5%) не покрывается агентством"
     )
 
-    intro_text = (
+    intro_text = t(
         "Почему именно такие стартовые условия?\n\n"
         "📈 Повышение процента — до 23% при выполнении KPI\n"
         "👥 Роль Team Lead — +1% от заработка команды (3 человека)\n"
@@ -124,26 +1466,40 @@ async def cmd_start(message: types.Message):
         "Нажми кнопку ниже, если тебе подходят условия 👇"
     )
     kb = InlineKeyboardMarkup(row_width=2).add(
-        InlineKeyboardButton("⭐Мне подходят условия⭐", callback_data="agree_conditions")
+        InlineKeyboardButton(t("⭐Мне подходят условия⭐"), callback_data=cb("agree_conditions"))
     )
 
-    await send_photo_with_fallback(message.chat.id, welcome_img, caption + "\n\n" + intro_text, reply_markup=kb, parse_mode=ParseMode.HTML)
+    if await expose(WELCOME_EXPERIMENT, chat_id) == "short":
+        await send_photo_with_fallback(chat_id, welcome_img, caption, reply_markup=kb, parse_mode=ParseMode.HTML)
+        return
+    await send_photo_with_fallback(chat_id, welcome_img, caption + "\n\n" + intro_text, reply_markup=kb, parse_mode=ParseMode.HTML)
 
 # --- agree_conditions ---
+NAME_PROMPT = N_("Теперь давай начнём с простого — как тебя зовут?")
+
 @dp.callback_query_handler(lambda c: c.data == "agree_conditions")
 async def cb_agree_conditions(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    warning_text = (
+    warning_text = t(
         "❗️Обрати внимание: Условие ниже не распространяется на стажировочный период (7 дней)!\n\n"
         "Если ты решишь завершить сотрудничество, потребуется отработать не более 7 дней "
         "с момента уведомления администратора."
     )
     await bot.send_message(cq.from_user.id, warning_text)
-    await bot.send_message(cq.from_user.id, "Теперь давай начнём с простого — как тебя зовут?")
+    await bot.send_message(cq.from_user.id, t(NAME_PROMPT))
     await Form.waiting_for_name.set()
 
 # --- Receive name ---
+def onlyfans_question(name: str) -> str:
+    return t("{name}, ты знаком(-а) с работой на OnlyFans?", name=name)
+
+def onlyfans_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(row_width=2).add(
+        InlineKeyboardButton(t("✅ Да"), callback_data=cb("onlyfans_yes")),
+        InlineKeyboardButton(t("❌ Нет"), callback_data=cb("onlyfans_no"))
+    )
+
 @dp.message_handler(state=Form.waiting_for_name, content_types=types.ContentTypes.TEXT)
 async def process_name(message: types.Message, state: FSMContext):
     name = message.text.strip()
@@ -155,14 +1511,10 @@ async def process_name(message: types.Message, state: FSMContext):
     async with state.proxy() as data:
         data["name"] = name
 
-    kb = InlineKeyboardMarkup(row_width=2).add(
-        InlineKeyboardButton("✅ Да", callback_data="onlyfans_yes"),
-        InlineKeyboardButton("❌ Нет", callback_data="onlyfans_no")
-    )
     await bot.send_message(
         message.chat.id,
-        f"Красивое имя, {name}! 🌟\n\n{name}, ты знаком(-а) с работой на OnlyFans?",
-        reply_markup=kb
+        t("Красивое имя, {name}! 🌟\n\n{question}", name=name, question=onlyfans_question(name)),
+        reply_markup=onlyfans_kb()
     )
 
     await Form.waiting_for_onlyfans.set()
@@ -172,18 +1524,18 @@ async def process_name(message: types.Message, state: FSMContext):
 async def cb_onlyfans_answer(cq: types.CallbackQuery, state: FSMContext):
     await safe_answer(cq)
     data = await state.get_data()
-    name = data.get("name", "друг")
+    name = data.get("name", t("друг"))
 
     if cq.data == "onlyfans_yes":
-        await bot.send_message(cq.from_user.id, f"Отлично, {name}! Тогда двигаться дальше будет проще ✅")
+        await bot.send_message(cq.from_user.id, t("Отлично, {name}! Тогда двигаться дальше будет проще ✅", name=name))
     else:
-        await bot.send_message(cq.from_user.id, f"Ничего страшного, {name}, я всё объясню с нуля 😉")
+        await bot.send_message(cq.from_user.id, t("Ничего страшного, {name}, я всё объясню с нуля 😉", name=name))
 
     await state.finish()
 
     # 1️⃣ Локальная картинка + текст (OnlyFans intro)
-    photo = IMAGES_DIR / "onlyfans_intro.jpg"
-    caption1 = (
+    photo = media_path("onlyfans_intro.jpg")
+    caption1 = t(
         "*OnlyFans* — это пространство, куда приходят люди за чувственным и эмоциональным контактом.\n\n"
         "В большинстве случаев речь идёт о «сексе по переписке», дополненном атмосферой тёплого диалога — "
         "о жизни, мыслях, желаниях.\n\n"
@@ -196,14 +1548,14 @@ async def cb_onlyfans_answer(cq: types.CallbackQuery, state: FSMContext):
     await send_photo_with_fallback(cq.from_user.id, photo, caption=caption1, parse_mode=ParseMode.MARKDOWN)
 
     # 2️⃣ Отправляем второй блок с кнопкой «Дальше»
-    text2 = (
+    text2 = t(
         "Прежде чем начать обучение — запомни главное: ты не просто продаёшь контент, ты даришь людям ощущение счастья 📌\n\n"
         "С таким подходом ты не только обойдёшь конкурентов, но и почувствуешь настоящую ценность своей работы 🤙\n\n"
         "В мире полно одиноких и потерянных людей, ищущих тепло и внимание 💔\n\n"
         "Мы не можем дать им физическую любовь, но можем подарить им близость, страсть… ну и, конечно, нюдсы 😏\n\n"
         "Ладно, хватит лирики — поехали дальше! 💥"
     )
-    kb_next = InlineKeyboardMarkup().add(InlineKeyboardButton("➡️ Дальше", callback_data="of_next_1"))
+    kb_next = InlineKeyboardMarkup().add(InlineKeyboardButton(t("➡️ Дальше"), callback_data=cb("of_next_1")))
     await bot.send_message(cq.from_user.id, text2, reply_markup=kb_next)
 
 # --- of_next_1 ---
@@ -211,8 +1563,8 @@ async def cb_onlyfans_answer(cq: types.CallbackQuery, state: FSMContext):
 async def of_next_1(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    photo_path = IMAGES_DIR / "of_people.jpg"
-    caption2 = (
+    photo_path = media_path("of_people.jpg")
+    caption2 = t(
         "🖼 Многие приходят в Adult-индустрию ради заработка, но забывают о главном — о людях по ту сторону экрана 🥲\n\n"
         "В интернете побеждает тот, кто отдаёт больше: не контента, а внимания и понимания.\n\n"
         "Пользователи платят не за «WOW», а за тёплое, живое общение.\n\n"
@@ -221,7 +1573,7 @@ async def of_next_1(cq: types.CallbackQuery):
         "Понимание потребностей и индивидуальный подход — вот что приносит настоящие деньги 💸\n\n"
         "Сделай жизнь клиента чуть ярче, и он точно это оценит 😉"
     )
-    kb_next2 = InlineKeyboardMarkup().add(InlineKeyboardButton("➡️ Дальше", callback_data="of_next_2"))
+    kb_next2 = InlineKeyboardMarkup().add(InlineKeyboardButton(t("➡️ Дальше"), callback_data=cb("of_next_2")))
     await send_photo_with_fallback(cq.from_user.id, photo_path, caption=caption2, reply_markup=kb_next2, parse_mode=ParseMode.MARKDOWN)
 
 # --- of_next_2 ---
@@ -229,26 +1581,26 @@ async def of_next_1(cq: types.CallbackQuery):
 async def of_next_2(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text4 = (
+    text4 = t(
         "Если хочешь зарабатывать стабильно, а не сжечь аудиторию ради быстрого профита — "
         "делай так, чтобы фанам нравилось общаться с тобой.\n\n"
         "Кто-то ищет страсть, кто-то — тепло.\n\n"
         "Понимание потребностей и индивидуальный подход — вот путь к большим деньгам 💸\n\n"
         "Сделай жизнь клиента чуточку лучше — и он точно это оценит 😉"
     )
-    kb_earn = InlineKeyboardMarkup().add(InlineKeyboardButton("⭐ А как заработать? ⭐", callback_data="how_to_earn"))
+    kb_earn = InlineKeyboardMarkup().add(InlineKeyboardButton(t("⭐ А как заработать? ⭐"), callback_data=cb("how_to_earn")))
     await bot.send_message(cq.from_user.id, text4, reply_markup=kb_earn)
 
 # --- how_to_earn ---
 @dp.callback_query_handler(lambda c: c.data == "how_to_earn")
 async def how_to_earn_info(cq: types.CallbackQuery):
     await safe_answer(cq)
-    await asyncio.sleep(0.2)
-    logger.info(f"➡️ Callback how_to_earn от {cq.from_user.id}")
+    await pause(0.2)
+    logger.info("➡️ Callback how_to_earn от %s", cq.from_user.id, extra={"event": "callback"})
 
 
     # 1️⃣ Первый блок
-    text1 = (
+    text1 = t(
         "Ещё со времён брачных агентств я научился мгновенно находить контакт "
         "и превращать любую деталь в точку опоры для продажи. Ты спросишь как? Всё просто:\n\n"
         "🔹 Узнал имя? — загуглил интересные факты.\n"
@@ -259,10 +1611,10 @@ async def how_to_earn_info(cq: types.CallbackQuery):
         "Ведь, как и в любви, по-настоящему вовлекает тот, кто цепляет чем-то личным 💘"
     )
     await bot.send_message(cq.from_user.id, text1)
-    await asyncio.sleep(0.5)
+    await pause(0.5)
 
     # 2️⃣ Второй блок
-    text2 = (
+    text2 = t(
         "Ты будешь создавать сотни историй отношений между моделью и клиентом 🙌\n\n"
         "У каждого клиента свой интерес — твоя задача предложить то, от чего он не сможет отказаться.\n\n"
         "Из этого формула продажи очень проста:\n\n"
@@ -270,16 +1622,16 @@ async def how_to_earn_info(cq: types.CallbackQuery):
         "давишь на это во время продажи = прибыль 📈"
     )
     await bot.send_message(cq.from_user.id, text2)
-    await asyncio.sleep(0.5)
+    await pause(0.5)
 
 
     # 3️⃣ Третий блок с кнопкой
-    text3 = (
+    text3 = t(
         "Пиши клиентам каждый день, даже если они в данный момент не готовы тратить денежки 💬\n\n"
         "Деньги у них рано или поздно появятся, а потратят они их на ту модель, "
         "что не забила на них в период, когда у них не было кэша ❤️‍🩹"
     )
-    kb_next = InlineKeyboardMarkup().add(InlineKeyboardButton("⭐ Где и как искать клиентов? ⭐", callback_data="find_clients"))
+    kb_next = InlineKeyboardMarkup().add(InlineKeyboardButton(t("⭐ Где и как искать клиентов? ⭐"), callback_data=cb("find_clients")))
     await bot.send_message(cq.from_user.id, text3, reply_markup=kb_next)
 
 # --- find_clients ---
@@ -287,8 +1639,8 @@ async def how_to_earn_info(cq: types.CallbackQuery):
 async def find_clients_info(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    photo_path = IMAGES_DIR / "find_clients.jpg"
-    caption1 = (
+    photo_path = media_path("find_clients.jpg")
+    caption1 = t(
         "🖼 Представь, что ты на рыбалке: улов зависит от наживки. В нашем случае — это рассылка фанам.\n\n"
         "Фан уже видел сотни сообщений, сделай так, чтобы клюнул на твоё 🎣\n\n"
         "Добавляй сленг, сокращай, меняй формулировки — главное, чтобы выглядело живо и по-своему. Например:\n\n"
@@ -297,7 +1649,7 @@ async def find_clients_info(cq: types.CallbackQuery):
         "👉 Are you here for fun or are you looking for something more? → U here 4 fun or lookin’ 4 sumthin’ more? 😄\n"
         "(Ты здесь для развлечения или ищешь что-то большее?)"
     )
-    kb_next = InlineKeyboardMarkup().add(InlineKeyboardButton("➡️ Дальше", callback_data="find_clients_done"))
+    kb_next = InlineKeyboardMarkup().add(InlineKeyboardButton(t("➡️ Дальше"), callback_data=cb("find_clients_done")))
     await send_photo_with_fallback(cq.from_user.id, photo_path, caption=caption1, reply_markup=kb_next)
 
 # --- find_clients_done -> show mailing intro and button to full diff ---
@@ -305,7 +1657,7 @@ async def find_clients_info(cq: types.CallbackQuery):
 async def show_diff_intro(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text2 = (
+    text2 = t(
         "Да, OnlyFans — платформа для откровенного контента, но рассылки не должны быть слишком прямыми или порнографичными 🔞\n\n"
         "Почему?\n\n"
         "Откровенный спам быстро убивает интерес. Клиенты заносят вас в список «ещё одной шлюхи» — "
@@ -314,7 +1666,7 @@ async def show_diff_intro(cq: types.CallbackQuery):
     )
     await bot.send_message(cq.from_user.id, text2)
 
-    text3 = (
+    text3 = t(
         "Мы используем 3 типа рассылок, каждый из которых ориентирован на разную аудиторию. "
         "Во время смены тебе нужно будет работать по следующей схеме:\n\n"
         "✔️ VIP — персональные сообщения постоянным клиентам, которые уже покупали контент.\n\n"
@@ -322,7 +1674,7 @@ async def show_diff_intro(cq: types.CallbackQuery):
         "✔️ Массовая — охват всех клиентов страницы, кроме VIP, чтобы не перегружать их.\n\n"
         "Каждый тип рассылки — это свой подход и шанс на продажу. Работай с умом 💬💸"
     )
-    kb_diff = InlineKeyboardMarkup().add(InlineKeyboardButton("💡 Зачем нужны разные рассылки?", callback_data="diff_mailings"))
+    kb_diff = InlineKeyboardMarkup().add(InlineKeyboardButton(t("💡 Зачем нужны разные рассылки?"), callback_data=cb("diff_mailings")))
     await bot.send_message(cq.from_user.id, text3, reply_markup=kb_diff)
 
 # --- diff_mailings (VIP -> ONLINE -> MASS, only MASS has buttons) ---
@@ -331,8 +1683,8 @@ async def diff_mailings_info(cq: types.CallbackQuery):
     await safe_answer(cq)
 
     # VIP
-    photo_vip = IMAGES_DIR / "vip.jpg"
-    caption_vip = (
+    photo_vip = media_path("vip.jpg")
+    caption_vip = t(
         "Рассылка подбирается под тип клиента 💬\n\n"
         "VIP-клиентам — только индивидуальные рассылки.\n\n"
         "Они платят за внимание, а не за шаблон. Проявляй интерес, вспоминай прошлые темы, держи связь 👀\n\n"
@@ -343,8 +1695,8 @@ async def diff_mailings_info(cq: types.CallbackQuery):
     await send_photo_with_fallback(cq.from_user.id, photo_vip, caption=caption_vip, parse_mode=ParseMode.MARKDOWN)
 
     # ONLINE
-    photo_online = IMAGES_DIR / "online.jpg"
-    caption_online = (
+    photo_online = media_path("online.jpg")
+    caption_online = t(
         "Если клиент сейчас онлайн — это лучший момент для рассылки 💬\n\n"
         "Шанс получить ответ выше, поэтому цепляйся за его ник или аватар — это уже элемент персонализации.\n\n"
         "Пример:\n\n"
@@ -358,8 +1710,8 @@ async def diff_mailings_info(cq: types.CallbackQuery):
     await send_photo_with_fallback(cq.from_user.id, photo_online, caption=caption_online, parse_mode=ParseMode.MARKDOWN)
 
     # MASS + buttons
-    photo_mass = IMAGES_DIR / "mass.jpg"
-    caption_mass = (
+    photo_mass = media_path("mass.jpg")
+    caption_mass = t(
         "Массовая рассылка летит всем, поэтому её нужно строить так, чтобы зацепить любого, "
         "но не отпугнуть тех, с кем ты уже общался(-ась) 📝\n\n"
         "Темы могут быть любые — от бытового до лёгкой эротики, но без перебора, чтобы не скатиться "
@@ -372,8 +1724,8 @@ async def diff_mailings_info(cq: types.CallbackQuery):
         "Фан сможет увидеть до 25 символов в листе чатов, поэтому старайся в эти 25 символов ставить самую «байтовую» часть своего сообщения 💥"
     )
     kb_mass = InlineKeyboardMarkup(row_width=1)
-    kb_mass.add(InlineKeyboardButton("🌟 Я всё понял! 🌟", callback_data="mailing_done"))
-    kb_mass.add(InlineKeyboardButton("🌟 Можно ещё информации? 🌟", callback_data="mailing_done"))
+    kb_mass.add(InlineKeyboardButton(t("🌟 Я всё понял! 🌟"), callback_data=cb("mailing_done")))
+    kb_mass.add(InlineKeyboardButton(t("🌟 Можно ещё информации? 🌟"), callback_data=cb("mailing_done")))
 
     await send_photo_with_fallback(cq.from_user.id, photo_mass, caption=caption_mass, reply_markup=kb_mass, parse_mode=ParseMode.MARKDOWN)
 
@@ -382,7 +1734,7 @@ async def diff_mailings_info(cq: types.CallbackQuery):
 async def mailing_done(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text4 = (
+    text4 = t(
         "🎯 Наша цель — дать тебе максимум полезной информации. Сегодня — о банальности в диалоге.\n\n"
         "Как большинство моделей начинают общение в чате?\n\n"
         "\"Hi. How are u?\" — классика. Но теперь представь, что ты уже 25-я, кто это спросил, "
@@ -392,7 +1744,7 @@ async def mailing_done(cq: types.CallbackQuery):
     )
     await bot.send_message(cq.from_user.id, text4)
 
-    text5 = (
+    text5 = t(
         "✅ Как быть? Нарушай правила. Будь запоминающейся.\n\n"
         "Клиенты платят за уникальность — не за дежурное \"привет\".\n\n"
         "📌 Примеры нестандартного старта:\n\n"
@@ -402,7 +1754,7 @@ async def mailing_done(cq: types.CallbackQuery):
     )
     await bot.send_message(cq.from_user.id, text5)
 
-    text6 = (
+    text6 = t(
         "🧠 Совет:\n\n"
         "Не жди вдохновения — заготавливай приветствия заранее. Это сэкономит время и придаст уверенности.\n\n"
         "💡 Что это тебе даст?\n\n"
@@ -412,17 +1764,25 @@ async def mailing_done(cq: types.CallbackQuery):
         "\"I'm OK.\" И всё. А дальше? Ничего. 💀"
     )
     kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("➡️ Двигаемся дальше?", callback_data="start_questions")
+        InlineKeyboardButton(t("➡️ Двигаемся дальше?"), callback_data=cb("start_questions"))
     )
     await bot.send_message(cq.from_user.id, text6, reply_markup=kb_next)
 
 
 # --- Переход к вопросам ---
+QUESTION_1 = N_("🙋 На что в первую очередь нужно опираться при общении с клиентами?")
+QUESTION_2 = N_("🙋 Можно ли в рассылках использовать сообщения со слишком откровенным посылом и почему, если Да/Нет?")
+QUESTION_3 = N_(
+    "✍️ Напиши персонализированное сообщение-рассылку клиенту.\n\n"
+    "Для примера: Его зовут Саймон, у него есть 3-летняя дочь, и он увлекается баскетболом. "
+    "Можешь использовать эту информацию для написания рассылки."
+)
+
 @dp.callback_query_handler(lambda c: c.data == "start_questions")
 async def start_questions_intro(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    intro_text = (
+    intro_text = t(
         "Сейчас нам важно закрепить ту часть информации, которую ты уже успел усвоить. "
         "После каждого блока я буду задавать тебе несколько вопросов — это поможет тебе лучше всё запомнить и уверенно двигаться дальше.\n\n"
         "⚠️ Но сразу хочу предупредить:\n\n"
@@ -435,14 +1795,13 @@ async def start_questions_intro(cq: types.CallbackQuery):
     await bot.send_message(cq.from_user.id, intro_text)
 
     # --- Первый вопрос ---
-    await asyncio.sleep(2)
+    await pause(2)
     await bot.send_message(
         cq.from_user.id,
-        "Теперь давай проверим, насколько хорошо ты усвоил материал 💬"
+        t("Теперь давай проверим, насколько хорошо ты усвоил материал 💬")
     )
 
-    question1 = "🙋 На что в первую очередь нужно опираться при общении с клиентами?"
-    await bot.send_message(cq.from_user.id, question1)
+    await bot.send_message(cq.from_user.id, t(QUESTION_1))
     await Form.waiting_for_question_1.set()
 
 
@@ -450,9 +1809,9 @@ async def start_questions_intro(cq: types.CallbackQuery):
 @dp.message_handler(state=Form.waiting_for_question_1, content_types=types.ContentTypes.TEXT)
 async def handle_question_1(message: types.Message, state: FSMContext):
     await state.update_data(q1=message.text.strip())
+    await save_answer(message.from_user, "question_1", message.text)
 
-    question2 = "🙋 Можно ли в рассылках использовать сообщения со слишком откровенным посылом и почему, если Да/Нет?"
-    await bot.send_message(message.chat.id, question2)
+    await bot.send_message(message.chat.id, t(QUESTION_2))
     await Form.waiting_for_question_2.set()
 
 
@@ -460,13 +1819,9 @@ async def handle_question_1(message: types.Message, state: FSMContext):
 @dp.message_handler(state=Form.waiting_for_question_2, content_types=types.ContentTypes.TEXT)
 async def question_2(message: types.Message, state: FSMContext):
     await state.update_data(question_2=message.text.strip())
+    await save_answer(message.from_user, "question_2", message.text)
 
-    question3 = (
-        "✍️ Напиши персонализированное сообщение-рассылку клиенту.\n\n"
-        "Для примера: Его зовут Саймон, у него есть 3-летняя дочь, и он увлекается баскетболом. "
-        "Можешь использовать эту информацию для написания рассылки."
-    )
-    await bot.send_message(message.chat.id, question3)
+    await bot.send_message(message.chat.id, t(QUESTION_3))
     await Form.waiting_for_question_3.set()
 
 
@@ -475,63 +1830,68 @@ async def question_2(message: types.Message, state: FSMContext):
 async def question_3(message: types.Message, state: FSMContext):
     # ✅ Сохраняем ответ пользователя
     await state.update_data(question_3=message.text.strip())
+    await save_answer(message.from_user, "question_3", message.text)
 
     # 💬 Сообщаем, что все ответы получены
     await bot.send_message(
         message.chat.id,
-        "✅ Отлично! Все ответы получены.\n"
-        "Ты справился с первой частью обучения и можешь переходить дальше 🚀"
+        t("✅ Отлично! Все ответы получены.\n"
+          "Ты справился с первой частью обучения и можешь переходить дальше 🚀")
     )
 
     # 🧹 Завершаем состояние FSM
     await state.finish()
 
-    # --- 💻 Кнопка для перехода к следующему разделу ---
+    await send_soft_tools_offer(message.chat.id)
+
+# --- 💻 Кнопка для перехода к следующему разделу ---
+async def send_soft_tools_offer(chat_id: int):
     next_step_kb = InlineKeyboardMarkup(row_width=1).add(
-        InlineKeyboardButton("💻 Перейти к ПО", callback_data="soft_tools")
+        InlineKeyboardButton(t("💻 Перейти к ПО"), callback_data=cb("soft_tools"))
     )
 
     # 📩 Отправляем сообщение с кнопкой
     await bot.send_message(
-        message.chat.id,
-        "Теперь давай обсудим ПО, которое ты будешь использовать 🤖\n\n"
-        "Это поможет тебе понять, как всё устроено и почему работа у нас идёт так слаженно 💪",
+        chat_id,
+        t("Теперь давай обсудим ПО, которое ты будешь использовать 🤖\n\n"
+          "Это поможет тебе понять, как всё устроено и почему работа у нас идёт так слаженно 💪"),
         reply_markup=next_step_kb
     )
+
 # --- Обработка кнопки "💻 Перейти к ПО" ---
 @dp.callback_query_handler(lambda c: c.data == "soft_tools")
 async def soft_tools(cq: types.CallbackQuery):
+    await safe_answer(cq)  # чтобы Telegram не показывал "загрузка..."
     try:
-        await cq.answer()  # чтобы Telegram не показывал "загрузка..."
         await send_soft_block(cq.from_user.id, next_callback="teamwork_info_final")
-    except Exception as e:
-        await bot.send_message(cq.from_user.id, f"⚠️ Ошибка при загрузке блока ПО: {e}")
+    except Exception:
+        logger.exception("Ошибка при загрузке блока ПО")
+        await bot.send_message(cq.from_user.id, t("⚠️ Не удалось загрузить блок ПО. Нажми кнопку ещё раз чуть позже."))
 
 # --- Универсальная функция: блок "ПО (Onlymonster)" ---
 async def send_soft_block(chat_id: int, next_callback: str = "teamwork_info_final"):
     # 1️⃣ Текст + картинка
-    image_path = IMAGES_DIR / "onlymonster_image.jpg"
-    text1 = (
+    image_path = media_path("onlymonster_image.jpg")
+    text1 = t(
         "🟩 Для работы непосредственно на странице мы используем Onlymonster.\n\n"
         "💻 Благодаря Onlymonster наши сотрудники работают в максимально удобной и функциональной среде.\n\n"
         "👉 https://onlymonster.ai/downloads\n\n"
         "⚠️ Не регистрируйся — после обучения мы отправим пригласительную ссылку."
     )
-    await bot.send_photo(chat_id, photo=open(image_path, "rb"), caption=text1)
+    await bot.send_photo(chat_id, photo=media_file(image_path), caption=text1)
 
     # 2️⃣ Видео (OnlyMonster Intro)
-    video_path = IMAGES_DIR / "onlymonster_intro.mp4"  # исправлено!
-    await bot.send_video(chat_id, video=open(video_path, "rb"))
+    await send_course_video(chat_id, "onlymonster_intro.mp4")
 
     # 3️⃣ Финальный текст + кнопка
-    text2 = (
+    text2 = t(
         "💸 Учёт баланса — вторая ключевая задача оператора.\n\n"
         "В начале и в конце смены ты фиксируешь свой баланс в Google Таблицах.\n\n"
         "Для этого понадобится аккаунт Google — это обязательное условие."
     )
 
     kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("🤝 Теперь перейдём к работе в команде", callback_data=next_callback)
+        InlineKeyboardButton(t("🤝 Теперь перейдём к работе в команде"), callback_data=cb(next_callback))
     )
 
     await bot.send_message(chat_id, text2, reply_markup=kb_next)
@@ -541,8 +1901,8 @@ async def send_soft_block(chat_id: int, next_callback: str = "teamwork_info_fina
 async def teamwork_info_final(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    teamwork_photo = IMAGES_DIR / "teamwork_image.jpg"
-    teamwork_text = (
+    teamwork_photo = media_path("teamwork_image.jpg")
+    teamwork_text = t(
         "🤝 Командная работа — основа успеха, особенно в нашей сфере.\n\n"
         "🔹 Доверие — выполняй обещания, будь честен и открыт.\n"
         "🔹 Общение — решай вопросы сразу.\n"
@@ -554,30 +1914,30 @@ async def teamwork_info_final(cq: types.CallbackQuery):
     )
 
     kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("➡️ Что дальше?", callback_data="after_teamwork_question")
+        InlineKeyboardButton(t("➡️ Что дальше?"), callback_data=cb("after_teamwork_question"))
     )
 
-    teamwork_photo_path = IMAGES_DIR / "teamwork_image.jpg"
+    teamwork_photo_path = media_path("teamwork_image.jpg")
     if teamwork_photo_path.exists():
         await bot.send_photo(
             cq.from_user.id,
-            photo=open(teamwork_photo_path, "rb"),
+            photo=media_file(teamwork_photo_path),
             caption=teamwork_text,
             reply_markup=kb_next
         )
     else:
         await bot.send_message(cq.from_user.id, teamwork_text, reply_markup=kb_next)
 # --- Завершающий вопрос ---
+BALANCE_QUESTION = N_(
+    "А теперь быстрый вопрос, чтобы проверить, как ты усвоил материал 💬\n\n"
+    "🙋 Куда нужно записывать балансы за начало и конец смены?"
+)
+
 @dp.callback_query_handler(lambda c: c.data == "after_teamwork_question")
 async def after_teamwork_question(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    question_text = (
-        "А теперь быстрый вопрос, чтобы проверить, как ты усвоил материал 💬\n\n"
-        "🙋 Куда нужно записывать балансы за начало и конец смены?"
-    )
-
-    await bot.send_message(cq.from_user.id, question_text)
+    await bot.send_message(cq.from_user.id, t(BALANCE_QUESTION))
     await Form.waiting_for_balance_answer.set()
 
 
@@ -585,33 +1945,57 @@ async def after_teamwork_question(cq: types.CallbackQuery):
 @dp.message_handler(state=Form.waiting_for_balance_answer, content_types=types.ContentTypes.TEXT)
 async def handle_balance_answer(message: types.Message, state: FSMContext):
     await state.update_data(balance_answer=message.text.strip())
+    await save_answer(message.from_user, "balance_answer", message.text)
 
     await bot.send_message(
         message.chat.id,
-        "✅ Отлично! Ответ принят.\n\nТы прошёл этот блок обучения — двигаемся дальше 🚀"
+        t("✅ Отлично! Ответ принят.\n\nТы прошёл этот блок обучения — двигаемся дальше 🚀")
     )
 
     # Завершаем FSM, но перед этим ловим ошибки на всякий случай
     try:
         await state.finish()
-    except Exception as e:
-        print(f"⚠️ Ошибка при завершении FSM: {e}")
+    except Exception:
+        logger.exception("⚠️ Ошибка при завершении FSM")
 
     # ⚡ Запускаем следующий блок
     try:
         await send_objections_block(message.chat.id)
-    except Exception as e:
-        print(f"❌ Ошибка при запуске блока 'Возражения': {e}")
+    except Exception:
+        logger.exception("❌ Ошибка при запуске блока 'Возражения'")
         await bot.send_message(
             message.chat.id,
-            "⚠️ Произошла ошибка при загрузке следующего раздела. Попробуй ещё раз /start или сообщи администратору."
+            t("⚠️ Произошла ошибка при загрузке следующего раздела. Попробуй ещё раз /start или сообщи администратору.")
         )
 
 
 # --- ФУНКЦИЯ: Блок "Возражения" ---
+# порядок разбора возражений — вариант эксперимента OBJECTIONS_EXPERIMENT
+OBJECTION_ORDERS = {
+    "control": ("objection_expensive", "objection_trust", "objection_deceive", "objection_money", "objection_love"),
+    "money_first": ("objection_money", "objection_expensive", "objection_trust", "objection_deceive", "objection_love"),
+}
+OBJECTION_BUTTONS = {
+    "objection_expensive": N_("⭐ Это дорого!"),
+    "objection_trust": N_("⭐ Почему я должен верить тебе?"),
+    "objection_deceive": N_("⭐ А ты не обманешь меня ?"),
+    "objection_money": N_("⭐ У меня всего 10 $"),
+    "objection_love": N_("⭐ Я хочу найти любовь"),
+}
+
+def objection_kb(user_id: int, after: str | None = None) -> InlineKeyboardMarkup:
+    """Кнопка следующего возражения в порядке варианта пользователя; после последнего — «Далее»."""
+    order = OBJECTION_ORDERS[OBJECTIONS_EXPERIMENT.variant(user_id)]
+    position = order.index(after) + 1 if after else 0
+    if position < len(order):
+        button = InlineKeyboardButton(t(OBJECTION_BUTTONS[order[position]]), callback_data=cb(order[position]))
+    else:
+        button = InlineKeyboardButton(t("⭐ Далее"), callback_data=cb("objection_next1"))
+    return InlineKeyboardMarkup().add(button)
+
 async def send_objections_block(chat_id: int):
-    objections_img = IMAGES_DIR / "objections_intro.jpg"
-    text1 = (
+    objections_img = media_path("objections_intro.jpg")
+    text1 = t(
         "🎯 Завершаем первый блок обучения одной из ключевых тем — <b>возражения</b>.\n\n"
         "Клиенты часто не покупают сразу — и это абсолютно нормально.👌\n\n"
         "Иногда самые щедрые с первого взгляда — исчезают через день 🏃‍♂️\n\n"
@@ -622,17 +2006,16 @@ async def send_objections_block(chat_id: int):
 
     try:
         if objections_img.exists():
-            with open(objections_img, "rb") as f:
-                await bot.send_photo(chat_id, photo=f, caption=text1, parse_mode="HTML")
+            await bot.send_photo(chat_id, photo=media_file(objections_img), caption=text1, parse_mode="HTML")
         else:
             await bot.send_message(chat_id, text1, parse_mode="HTML")
-    except Exception as e:
-        print(f"⚠️ Ошибка при отправке фото 'обучения возражениям': {e}")
+    except Exception:
+        logger.exception("⚠️ Ошибка при отправке фото 'обучения возражениям'")
         await bot.send_message(chat_id, text1, parse_mode="HTML")
 
     # --- Второе сообщение ---
-    await asyncio.sleep(2)
-    text2 = (
+    await pause(2)
+    text2 = t(
         "🔥 <b>Топ-5 возражений:</b>\n\n"
         "1. Это дорого!\n\n"
         "2. Почему я должен верить тебе?\n\n"
@@ -643,21 +2026,19 @@ async def send_objections_block(chat_id: int):
     await bot.send_message(chat_id, text2, parse_mode="HTML")
 
     # --- Заключительное сообщение + кнопка ---
-    await asyncio.sleep(2)
-    text3 = (
+    await pause(2)
+    text3 = t(
         "🕵️‍♂️ Теперь я покажу тебе примеры ответов на возражения.\n\n"
         "Всего будет около 18–20 инструментов — и все они реально работают 💪"
     )
-    kb = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ Это дорого!", callback_data="objection_expensive")
-    )
-    await bot.send_message(chat_id, text3, reply_markup=kb, parse_mode="HTML")
+    await expose(OBJECTIONS_EXPERIMENT, chat_id)
+    await bot.send_message(chat_id, text3, reply_markup=objection_kb(chat_id), parse_mode="HTML")
 # --- Обработка: "Это дорого!" ---
 @dp.callback_query_handler(lambda c: c.data == "objection_expensive")
 async def objection_expensive(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text = (
+    text = t(
         "Если клиент так пишет, чаще всего — нет <b>раппорта</b>, то есть доверия и эмоциональной связи.\n\n"
         "Клиент просто не понимает, почему он должен отдать $30 за пару фото именно тебе, а не любой другой модели.\n\n"
         "📌 <b>Как исправить?</b>\n\n"
@@ -682,8 +2063,8 @@ async def objection_expensive(cq: types.CallbackQuery):
     await bot.send_message(cq.from_user.id, text, parse_mode="HTML")
 
     # 5️⃣ Следующее сообщение
-    await asyncio.sleep(3)
-    text2 = (
+    await pause(3)
+    text2 = t(
         "✍🏻 <b>Как делать продажи эффективнее?</b>\n\n"
         "Делай развёрнутое описание — это ключ к доверию.\n\n"
         "Сухое «2 фото — 30$» не вызывает эмоций.\n\n"
@@ -700,8 +2081,8 @@ async def objection_expensive(cq: types.CallbackQuery):
     await bot.send_message(cq.from_user.id, text2, parse_mode="HTML")
 
     # 6️⃣ Следующее сообщение
-    await asyncio.sleep(3)
-    text3 = (
+    await pause(3)
+    text3 = t(
         "💰 <b>Как предложить варианты?</b>\n\n"
         "Мне нравится с тобой общаться, поэтому дам выбор:\n\n"
         "👉 2 фото + видео-дразнилка за $25\n\n"
@@ -712,16 +2093,14 @@ async def objection_expensive(cq: types.CallbackQuery):
     await bot.send_message(cq.from_user.id, text3, parse_mode="HTML")
 
     # 7️⃣ Финал — кнопка на следующее возражение
-    await asyncio.sleep(3)
-    text4 = (
+    await pause(3)
+    text4 = t(
         "🤗 Главное — эмоции.\n\n"
         "Клиенты приходят не за конфликтом, а за вниманием и лёгкостью.\n\n"
         "Усталость, раздражение, давление — они и так получают это в реальной жизни.\n\n"
         "Будь умнее: спокойствие + игривость = продажи и лояльность 😌"
     )
-    kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ Почему я должен верить тебе?", callback_data="objection_trust")
-    )
+    kb_next = objection_kb(cq.from_user.id, after="objection_expensive")
     await bot.send_message(cq.from_user.id, text4, reply_markup=kb_next, parse_mode="HTML")
 
 
@@ -730,7 +2109,7 @@ async def objection_expensive(cq: types.CallbackQuery):
 async def objection_trust(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text = (
+    text = t(
         "<b>🧠 Когда клиент пишет подобное...</b>\n\n"
         "🔹 <i>ты либо общаешься слишком навязчиво</i>\n"
         "🔹 <i>либо он провоцирует, чтобы сбить цену или набить себе значимость</i>\n\n"
@@ -750,9 +2129,7 @@ async def objection_trust(cq: types.CallbackQuery):
         "<i>Клиент раскрывается, а ты выстраиваешь доверие и собираешь его психологический портрет ❤️</i>"
     )
 
-    kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ А ты не обманешь меня ?", callback_data="objection_deceive")
-    )
+    kb_next = objection_kb(cq.from_user.id, after="objection_trust")
     await bot.send_message(cq.from_user.id, text, reply_markup=kb_next, parse_mode="HTML")
 
 # --- Ответ на кнопку "А ты не обманешь меня ?" ---
@@ -760,7 +2137,7 @@ async def objection_trust(cq: types.CallbackQuery):
 async def objection_deceive(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text = (
+    text = t(
         "💬 <b>«Мне часто показывают не то, что обещают…»</b>\n\n"
         "Если клиент так говорит — задай себе вопрос:\n\n"
         "почему он так думает? 🧐\n\n"
@@ -783,9 +2160,7 @@ async def objection_deceive(cq: types.CallbackQuery):
         "Если ты ими владеешь или быстро учишься — поздравляю, ты в правильной команде 🚀💋"
     )
 
-    kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ У меня всего 10 $", callback_data="objection_money")
-    )
+    kb_next = objection_kb(cq.from_user.id, after="objection_deceive")
     await bot.send_message(cq.from_user.id, text, reply_markup=kb_next, parse_mode="HTML")
 
 
@@ -794,7 +2169,7 @@ async def objection_deceive(cq: types.CallbackQuery):
 async def objection_money(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text = (
+    text = t(
         "❗️<b>Никогда не злись и не унижай клиента, называя его 'нищим' или 'бомжом' ❗️</b>\n\n"
         "Многие 💳 действительно обеспеченные люди прекрасно знают цену деньгам — "
         "и далеко не всегда начинают с больших трат. 💵\n\n"
@@ -818,9 +2193,7 @@ async def objection_money(cq: types.CallbackQuery):
         "И большинство клиентов остаются — с уважением, интересом и желанием увидеть больше… 🙌</i>"
     )
 
-    kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ Я хочу найти любовь", callback_data="objection_love")
-    )
+    kb_next = objection_kb(cq.from_user.id, after="objection_money")
     await bot.send_message(cq.from_user.id, text, reply_markup=kb_next, parse_mode="HTML")
 
 
@@ -829,7 +2202,7 @@ async def objection_money(cq: types.CallbackQuery):
 async def objection_love(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text = (
+    text = t(
         "<i>“Правильно ли я тебя понимаю, что на сайте, где мужчины покупают сексуальный контент, "
         "ты хочешь найти любовь? Почему тут? Неужели в реальной жизни у тебя трудности "
         "с тем, чтобы найти достойную девушку?”</i>\n\n"
@@ -843,9 +2216,7 @@ async def objection_love(cq: types.CallbackQuery):
         "ведь это — <b>твоя работа 🧑‍💼</b>"
     )
 
-    kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ Далее", callback_data="objection_next1")
-    )
+    kb_next = objection_kb(cq.from_user.id, after="objection_love")
     await bot.send_message(cq.from_user.id, text, reply_markup=kb_next, parse_mode="HTML")
 
 
@@ -854,7 +2225,7 @@ async def objection_love(cq: types.CallbackQuery):
 async def objection_next1(cq: types.CallbackQuery):
     await safe_answer(cq)
 
-    text = (
+    text = t(
         "🏁 <b>Финишная прямая!</b>\n\n"
         "Ты уже освоил основы, теперь давай конкретно — что именно ты можешь предложить клиенту.\n\n"
         "Ниже список услуг, с которыми ты будешь работать.\n\n"
@@ -870,7 +2241,7 @@ async def objection_next1(cq: types.CallbackQuery):
     )
 
     kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ Далее", callback_data="objection_next2")
+        InlineKeyboardButton(t("⭐ Далее"), callback_data=cb("objection_next2"))
     )
     await bot.send_message(cq.from_user.id, text, reply_markup=kb_next, parse_mode="HTML")
 
@@ -879,9 +2250,9 @@ async def objection_next1(cq: types.CallbackQuery):
 # --- Обработка кнопки "Далее 2" ---
 @dp.callback_query_handler(lambda c: c.data == "objection_next2")
 async def objection_next2(cq: types.CallbackQuery):
-    await cq.answer()  # мгновенно отвечаем, чтобы Telegram не завис
+    await safe_answer(cq)  # мгновенно отвечаем, чтобы Telegram не завис
 
-    text = (
+    text = t(
         "💸 <b>Клиенты могут не только покупать — но и помогать.</b>\n\n"
         "Когда с клиентом установлены тёплые отношения, у него может появиться желание сделать что-то приятное: "
         "подарок, поддержка на лечение, переезд и т.д.\n\n"
@@ -897,7 +2268,7 @@ async def objection_next2(cq: types.CallbackQuery):
 
     # 👉 Кнопка "⭐ Правила платформы"
     kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ Правила платформы", callback_data="rules")
+        InlineKeyboardButton(t("⭐ Правила платформы"), callback_data=cb("rules"))
     )
 
     await bot.send_message(
@@ -911,9 +2282,10 @@ async def objection_next2(cq: types.CallbackQuery):
 # --- Обработка кнопки "⭐ Правила платформы" ---
 @dp.callback_query_handler(lambda c: c.data == "rules")
 async def rules(cq: types.CallbackQuery):
-    
+    await safe_answer(cq)
+
     # 🖼️ Отправляем картинку + текст
-    text1 = (
+    text1 = t(
         "<b>📋 Ниже будет список запретов непосредственно от OnlyFans:</b>\n\n"
         "🚫 Выставлять контент с третьими лицами (подругами, парнем, случайным прохожим), если на него не подписан модельный релиз или он не зарегистрирован на ОФ\n"
         "🚫 Любые лица моложе 18 лет или ссылки на несовершеннолетних (ролевые игры, разговоры о детстве, детские фото)\n"
@@ -927,10 +2299,10 @@ async def rules(cq: types.CallbackQuery):
     await bot.send_message(cq.from_user.id, text1, parse_mode="HTML")
 
     # ⏳ Ещё одна пауза
-    await asyncio.sleep(1.5)
+    await pause(1.5)
 
     # 🧾 Второй блок текста + кнопка
-    text2 = (
+    text2 = t(
         "🚫 Насилие, изнасилование, отсутствие согласия, гипноз, опьянение, сексуальное нападение, пытки, садомазохистское насилие или жесткий бондаж, экстремальный фистинг или калечащие операции на половых органах. Тут для себя понимаем, что с БДСМ контентом и играми в жестких доминаторов лучше быть аккуратнее\n\n"
         "🚫 Некрофилия\n\n"
         "🚫 Материалы, связанные с мочой, рвотой или экскрементами\n\n"
@@ -948,7 +2320,7 @@ async def rules(cq: types.CallbackQuery):
     )
 
     kb_next = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("⭐ А что насчёт запретов агентства?", callback_data="rules_agency")
+        InlineKeyboardButton(t("⭐ А что насчёт запретов агентства?"), callback_data=cb("rules_agency"))
     )
 
     await bot.send_message(
@@ -960,11 +2332,11 @@ async def rules(cq: types.CallbackQuery):
 # --- 2️⃣ Кнопка: "⭐ А что насчёт запретов агентства?" ---
 @dp.callback_query_handler(lambda c: c.data == "rules_agency")
 async def rules_agency(cq: types.CallbackQuery):
-    asyncio.create_task(cq.answer())  # мгновенный ответ Telegram
+    asyncio.create_task(safe_answer(cq))  # мгновенный ответ Telegram
 
     try:
         # --- Текст №1 ---
-        text1 = (
+        text1 = t(
             "Агентство очень ценит усердных и дисциплинированных сотрудников 💼\n\n"
             "Если ты один из них — смело переходи к следующему разделу ⏭️\n\n"
             "Но помни: за нарушение порядка и несоблюдение правил могут применяться штрафные санкции.\n\n"
@@ -973,21 +2345,21 @@ async def rules_agency(cq: types.CallbackQuery):
         await bot.send_message(cq.from_user.id, text1, parse_mode="HTML")
 
         # --- Картинка "Штрафные санкции" ---
-        await asyncio.sleep(1.5)
-        photo2 = IMAGES_DIR / "fines.png"
+        await pause(1.5)
+        photo2 = media_path("fines.png")
 
         if not photo2.exists():
             # если файла нет — показываем предупреждение один раз
             await bot.send_message(
                 cq.from_user.id,
-                "⚠️ Изображение 'fines.png' не найдено, пропускаем этот шаг.",
+                t("⚠️ Изображение 'fines.png' не найдено, пропускаем этот шаг."),
             )
         else:
-            await bot.send_photo(cq.from_user.id, open(photo2, "rb"))
+            await bot.send_photo(cq.from_user.id, media_file(photo2))
 
         # --- Текст №2 ---
-        await asyncio.sleep(1.5)
-        text2 = (
+        await pause(1.5)
+        text2 = t(
             "Важно понимать: штрафы — не наказание, а способ скорректировать работу ⚖️\n\n"
             "Мы не заинтересованы в их частом применении.\n\n"
             "Если человек не проявляет мотивации и не хочет работать — мы спокойно прощаемся 👋\n\n"
@@ -997,29 +2369,29 @@ async def rules_agency(cq: types.CallbackQuery):
         )
 
         kb_next = InlineKeyboardMarkup().add(
-            InlineKeyboardButton("⏭️ Далее", callback_data="rules_next")
+            InlineKeyboardButton(t("⏭️ Далее"), callback_data=cb("rules_next"))
         )
         await bot.send_message(cq.from_user.id, text2, reply_markup=kb_next, parse_mode="HTML")
 
-    except Exception as e:
-        print(f"[rules_agency] Ошибка: {e}")
-        await bot.send_message(cq.from_user.id, f"⚠️ Ошибка: {e}")
+    except Exception:
+        logger.exception("[rules_agency] Ошибка")
+        await bot.send_message(cq.from_user.id, t("⚠️ Не удалось загрузить раздел. Нажми кнопку ещё раз чуть позже."))
 
 
 # --- 3️⃣ Кнопка: "⏭️ Далее" ---
 @dp.callback_query_handler(lambda c: c.data == "rules_next")
 async def rules_next(cq: types.CallbackQuery):
-    await cq.answer()
+    await safe_answer(cq)
 
     # 🖼️ Картинка "Причины"
-    await asyncio.sleep(1.5)
-    photo3 = IMAGES_DIR / "reasons.png"
+    await pause(1.5)
+    photo3 = media_path("reasons.png")
     if photo3.exists():
-        await bot.send_photo(cq.from_user.id, open(photo3, "rb"))
+        await bot.send_photo(cq.from_user.id, media_file(photo3))
 
     # Финальный блок
-    await asyncio.sleep(1.5)
-    text3 = (
+    await pause(1.5)
+    text3 = t(
         "🎉 <b>Хорошая новость!</b>\n\n"
         "Вводная часть завершена — ты почти у финиша 🏁\n\n"
         "Осталось только одно: ознакомиться с чек-листом для работы на смене 📄\n\n"
@@ -1028,7 +2400,7 @@ async def rules_next(cq: types.CallbackQuery):
     )
 
     kb_checklist = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("📋 Чек-лист", callback_data="checklist")
+        InlineKeyboardButton(t("📋 Чек-лист"), callback_data=cb("checklist"))
     )
     await bot.send_message(cq.from_user.id, text3, reply_markup=kb_checklist, parse_mode="HTML")
 
@@ -1041,39 +2413,79 @@ class QuizStates(StatesGroup):
     q6 = State()
     q7 = State()
 
+QUIZ_QUESTIONS = {
+    "q1": N_(
+        "1️⃣ После длительного общения с мужчиной ты качественно подвел его к видео и отправил его заблокированным, "
+        "поставив на него цену, но мужчина не открыл видео и пишет:\n\n"
+        "«Я думал ты покажешь мне это видео бесплатно, ведь мы так мило говорили, почему я должен платить за это видео?»\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+    "q2": N_(
+        "2️⃣ Представь ситуацию, постоянный VIP-клиент из категории 100$-500$ не открыл платное видео, "
+        "которое ты ему отправил и пишет:\n\n"
+        "«Прости, детка, у меня нет денег и я не могу открыть твоё видео»\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+    "q3": N_(
+        "3️⃣ VIP-клиент из категории 500$-1000$ только что купил у тебя видео за 80$ и пишет:\n\n"
+        "«Милая, мне нравится это видео, сделаешь для меня следующее видео бесплатно? Я думаю я заслужил это!»\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+    "q4": N_(
+        "4️⃣ Мужчина, с которым ты уже общаешься два дня и он ни разу не покупал контент, пишет:\n\n"
+        "«Я получу деньги через несколько дней и смогу тебе заплатить! Покажешь мне твою сладкую киску сейчас, и я отдам тебе деньги позже?»\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+    "q5": N_(
+        "5️⃣ Клиент спрашивает у тебя — «Как дела?». Каким будет твой ответ, чтоб диалог не перешел в тупиковую форму?\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+    "q6": N_(
+        "6️⃣ Новый клиент открыл заблокированное видео, но оказался недовольным: "
+        "«Я получил не то, о чем тебя просил. Я хочу вернуть свои деньги».\n\n"
+        "Каким будет твой ответ, чтобы сохранить лояльность клиента?\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+    "q7": N_(
+        "7️⃣ Новый клиент только написал тебе, и уже хочет самый откровенный контент:\n\n"
+        "«Хочу фотографию/видео, где будет видно всё, и чтобы ты делала это и то»\n\n"
+        "✍️ Напиши то, что ответил бы ты:"
+    ),
+}
+
 
 # --- Обработка кнопки "📋 Чек-лист" ---
 @dp.callback_query_handler(lambda c: c.data == "checklist")
 async def checklist_handler(cq: types.CallbackQuery):
-    await cq.answer()
+    await safe_answer(cq)
 
     # 1️⃣ Отправляем картинку чек-листа + текст
-    image_path = IMAGES_DIR / "checklist.jpg"  # убедись, что название совпадает
-    caption_text = (
+    image_path = media_path("checklist.jpg")  # убедись, что название совпадает
+    caption_text = t(
         "Сохрани себе этот лист, потому что у нас в “я забыл(-а)” не верят 🧡\n\n"
         "А следом пойдет табличка с минимальными ценниками на контент."
     )
 
     try:
-        with open(image_path, "rb") as photo:
-            await bot.send_photo(cq.from_user.id, photo=photo, caption=caption_text)
-    except Exception as e:
-        await bot.send_message(cq.from_user.id, f"⚠️ Ошибка при отправке чек-листа: {e}")
+        await bot.send_photo(cq.from_user.id, photo=media_file(image_path), caption=caption_text)
+    except Exception:
+        logger.exception("Ошибка при отправке чек-листа")
+        await bot.send_message(cq.from_user.id, t("⚠️ Не удалось отправить чек-лист — попроси его у администратора."))
 
-    await asyncio.sleep(1.2)
+    await pause(1.2)
 
     # 2️⃣ Отправляем картинку "ценности контента"
-    image_path2 = IMAGES_DIR / "content.jpg"  # проверь, правильное имя файла
+    image_path2 = media_path("content.jpg")  # проверь, правильное имя файла
     try:
-        with open(image_path2, "rb") as photo2:
-            await bot.send_photo(cq.from_user.id, photo=photo2)
-    except Exception as e:
-        await bot.send_message(cq.from_user.id, f"⚠️ Ошибка при отправке изображения ценностей: {e}")
+        await bot.send_photo(cq.from_user.id, photo=media_file(image_path2))
+    except Exception:
+        logger.exception("Ошибка при отправке изображения ценностей")
+        await bot.send_message(cq.from_user.id, t("⚠️ Не удалось отправить таблицу цен — попроси её у администратора."))
 
-    await asyncio.sleep(1.2)
+    await pause(1.2)
 
     # 3️⃣ Сообщение с кнопкой "Старт"
-    start_text = (
+    start_text = t(
         "Теперь, когда ты прошёл весь материал, самое время проверить, насколько хорошо ты всё усвоил.\n\n"
         "Сейчас будет небольшой опрос по пройденному курсу — и, поверь, он покажет, как именно ты провёл это время 😉\n\n"
         "Совет: постарайся ответить на все вопросы правильно. Если не получится — увы, придётся начинать сначала 🥸 (особенно при использовании ИИ)\n\n"
@@ -1081,7 +2493,7 @@ async def checklist_handler(cq: types.CallbackQuery):
     )
 
     kb = types.InlineKeyboardMarkup()
-    kb.add(types.InlineKeyboardButton("🚀 Старт", callback_data="start_quiz"))
+    kb.add(types.InlineKeyboardButton(t("🚀 Старт"), callback_data=cb("start_quiz")))
 
     await bot.send_message(cq.from_user.id, start_text, reply_markup=kb)
 
@@ -1089,14 +2501,8 @@ async def checklist_handler(cq: types.CallbackQuery):
 # --- Начало опроса ---
 @dp.callback_query_handler(lambda c: c.data == "start_quiz")
 async def start_quiz(cq: types.CallbackQuery, state: FSMContext):
-    await cq.answer()
-    await bot.send_message(
-        cq.from_user.id,
-        "1️⃣ После длительного общения с мужчиной ты качественно подвел его к видео и отправил его заблокированным, "
-        "поставив на него цену, но мужчина не открыл видео и пишет:\n\n"
-        "«Я думал ты покажешь мне это видео бесплатно, ведь мы так мило говорили, почему я должен платить за это видео?»\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await safe_answer(cq)
+    await bot.send_message(cq.from_user.id, t(QUIZ_QUESTIONS["q1"]))
     await QuizStates.q1.set()
 
 
@@ -1104,119 +2510,1169 @@ async def start_quiz(cq: types.CallbackQuery, state: FSMContext):
 @dp.message_handler(state=QuizStates.q1)
 async def quiz_q1(message: types.Message, state: FSMContext):
     await state.update_data(q1=message.text)
-    await bot.send_message(
-        message.chat.id,
-        "2️⃣ Представь ситуацию, постоянный VIP-клиент из категории 100$-500$ не открыл платное видео, "
-        "которое ты ему отправил и пишет:\n\n"
-        "«Прости, детка, у меня нет денег и я не могу открыть твоё видео»\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await save_answer(message.from_user, "quiz_q1", message.text)
+    await bot.send_message(message.chat.id, t(QUIZ_QUESTIONS["q2"]))
     await QuizStates.q2.set()
 
 
 @dp.message_handler(state=QuizStates.q2)
 async def quiz_q2(message: types.Message, state: FSMContext):
     await state.update_data(q2=message.text)
-    await bot.send_message(
-        message.chat.id,
-        "3️⃣ VIP-клиент из категории 500$-1000$ только что купил у тебя видео за 80$ и пишет:\n\n"
-        "«Милая, мне нравится это видео, сделаешь для меня следующее видео бесплатно? Я думаю я заслужил это!»\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await save_answer(message.from_user, "quiz_q2", message.text)
+    await bot.send_message(message.chat.id, t(QUIZ_QUESTIONS["q3"]))
     await QuizStates.q3.set()
 
 
 @dp.message_handler(state=QuizStates.q3)
 async def quiz_q3(message: types.Message, state: FSMContext):
     await state.update_data(q3=message.text)
-    await bot.send_message(
-        message.chat.id,
-        "4️⃣ Мужчина, с которым ты уже общаешься два дня и он ни разу не покупал контент, пишет:\n\n"
-        "«Я получу деньги через несколько дней и смогу тебе заплатить! Покажешь мне твою сладкую киску сейчас, и я отдам тебе деньги позже?»\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await save_answer(message.from_user, "quiz_q3", message.text)
+    await bot.send_message(message.chat.id, t(QUIZ_QUESTIONS["q4"]))
     await QuizStates.q4.set()
 
 
 @dp.message_handler(state=QuizStates.q4)
 async def quiz_q4(message: types.Message, state: FSMContext):
     await state.update_data(q4=message.text)
-    await bot.send_message(
-        message.chat.id,
-        "5️⃣ Клиент спрашивает у тебя — «Как дела?». Каким будет твой ответ, чтоб диалог не перешел в тупиковую форму?\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await save_answer(message.from_user, "quiz_q4", message.text)
+    await bot.send_message(message.chat.id, t(QUIZ_QUESTIONS["q5"]))
     await QuizStates.q5.set()
 
 
 @dp.message_handler(state=QuizStates.q5)
 async def quiz_q5(message: types.Message, state: FSMContext):
     await state.update_data(q5=message.text)
-    await bot.send_message(
-        message.chat.id,
-        "6️⃣ Новый клиент открыл заблокированное видео, но оказался недовольным: "
-        "«Я получил не то, о чем тебя просил. Я хочу вернуть свои деньги».\n\n"
-        "Каким будет твой ответ, чтобы сохранить лояльность клиента?\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await save_answer(message.from_user, "quiz_q5", message.text)
+    await bot.send_message(message.chat.id, t(QUIZ_QUESTIONS["q6"]))
     await QuizStates.q6.set()
 
 
 @dp.message_handler(state=QuizStates.q6)
 async def quiz_q6(message: types.Message, state: FSMContext):
     await state.update_data(q6=message.text)
-    await bot.send_message(
-        message.chat.id,
-        "7️⃣ Новый клиент только написал тебе, и уже хочет самый откровенный контент:\n\n"
-        "«Хочу фотографию/видео, где будет видно всё, и чтобы ты делала это и то»\n\n"
-        "✍️ Напиши то, что ответил бы ты:"
-    )
+    await save_answer(message.from_user, "quiz_q6", message.text)
+    await bot.send_message(message.chat.id, t(QUIZ_QUESTIONS["q7"]))
     await QuizStates.q7.set()
 
 
 @dp.message_handler(state=QuizStates.q7)
 async def quiz_q7(message: types.Message, state: FSMContext):
+    await save_answer(message.from_user, "quiz_q7", message.text)
     data = await state.get_data()
-    user_name = data.get("name") or "Друг"  # ← достаём имя из FSM, если есть
+    user_name = data.get("name") or t("Друг")  # ← достаём имя из FSM, если есть
     await state.finish()
 
-    final_text = (
-        f"Ну что ж, {user_name}, открывай бутылку Moet Chandon 🍾 — тебя можно поздравить с окончанием вводного обучения 🔥\n\n"
+    final_text = t(
+        "Ну что ж, {name}, открывай бутылку Moet Chandon 🍾 — тебя можно поздравить с окончанием вводного обучения 🔥\n\n"
         "Мы с тобой отлично провели время, и думаю, тебе пора начинать делать бабки 💸\n\n"
         "Напиши рекрутеру, который передал тебе ссылку на бот (либо @eclipseagencyy, если ты нашёл бот самостоятельно), "
         "и он направит тебя к твоему администратору, с которым ты в дальнейшем будешь работать.\n\n"
         "Не скажу, что ты мне сильно понравился... Но кажется, я буду скучать 🥺\n\n"
         "Топи вперёд и порви эту сферу 🚀\n\n"
         "А главное — не забывай отправлять мне 50% своей зарплаты!\n\n"
-        "Шутка 😄"
+        "Шутка 😄",
+        name=user_name,
     )
 
     await bot.send_message(message.chat.id, final_text)
 
 
+# ======================== Возобновление курса ========================
+COURSE_DONE = "course_done"
+
+# ответ на последний вопрос блока -> шаг, с которого продолжаем
+FINISHING_STATES = {
+    Form.waiting_for_question_3.state: "questions_done",
+    Form.waiting_for_balance_answer.state: "balance_done",
+    QuizStates.q7.state: COURSE_DONE,
+}
+
+# состояния, в которых бот ждёт ответ, -> текст вопроса
+STATE_PROMPTS = {
+    Form.waiting_for_name.state: NAME_PROMPT,
+    Form.waiting_for_onlyfans.state: None,  # вопрос с именем и кнопками, см. send_state_prompt
+    Form.waiting_for_question_1.state: QUESTION_1,
+    Form.waiting_for_question_2.state: QUESTION_2,
+    Form.waiting_for_question_3.state: QUESTION_3,
+    Form.waiting_for_balance_answer.state: BALANCE_QUESTION,
+    **{getattr(QuizStates, key).state: text for key, text in QUIZ_QUESTIONS.items()},
+}
+
+# ключ ответа в answers.jsonl -> текст вопроса (для скрининга открытых ответов)
+QUESTION_PROMPTS = {
+    "question_1": QUESTION_1,
+    "question_2": QUESTION_2,
+    "question_3": QUESTION_3,
+    **{f"quiz_{key}": text for key, text in QUIZ_QUESTIONS.items()},
+}
+
+# шаги без собственной callback-кнопки
+RESUME_ACTIONS = {
+    "questions_done": send_soft_tools_offer,
+    "balance_done": send_objections_block,
+}
+
+async def send_state_prompt(chat_id: int, state_name: str, data: dict):
+    if state_name == Form.waiting_for_onlyfans.state:
+        await bot.send_message(chat_id, onlyfans_question(data.get("name", t("друг"))), reply_markup=onlyfans_kb())
+    else:
+        await bot.send_message(chat_id, t(STATE_PROMPTS[state_name]))
+
+@dp.callback_query_handler(lambda c: c.data == "resume", state='*')
+async def cb_resume(cq: types.CallbackQuery, state: FSMContext):
+    checkpoint = await get_checkpoint(dp.storage, cq.from_user.id, cq.from_user.id)
+    if not checkpoint or checkpoint.get("step") == COURSE_DONE:
+        await safe_answer(cq)
+        await send_welcome(cq.from_user.id)
+        return
+
+    if "state" in checkpoint:
+        await safe_answer(cq)
+        await state.set_state(checkpoint["state"])
+        await send_state_prompt(cq.from_user.id, checkpoint["state"], await state.get_data())
+        return
+
+    step = checkpoint["step"]
+    await state.reset_state(with_data=False)
+    if step in RESUME_ACTIONS:
+        await safe_answer(cq)
+        await RESUME_ACTIONS[step](cq.from_user.id)
+        return
+
+    # повторяем шаг обычным хендлером — на callback он ответит сам
+    resumed = types.CallbackQuery(**{**cq.to_python(), "data": cb(step)})
+    await dp.callback_query_handlers.notify(resumed)
+
+@dp.callback_query_handler(lambda c: c.data == "restart", state='*')
+async def cb_restart(cq: types.CallbackQuery, state: FSMContext):
+    await safe_answer(cq)
+    await state.finish()
+    await clear_checkpoint(dp.storage, cq.from_user.id, cq.from_user.id)
+    await send_welcome(cq.from_user.id)
+
+
+# ======================== A/B-эксперименты ========================
+# Вариант — детерминированный хеш (эксперимент, user_id): без хранения и запросов к FSM, стажёр всегда видит
+# один и тот же вариант. Показы (exposure) и достижения целей (goal:<шаг>) копятся счётчиками в памяти,
+# раз в AB_FLUSH_INTERVAL секунд суммируются в experiments.json тенанта. Считаются стажёры, а не события:
+# повторный /start или возврат к шагу не засчитываются — отметки лежат в bucket FSM рядом с чекпоинтом.
+# Цена подсчёта — чтение bucket на каждый показ и цель и запись при первом; сам выбор варианта FSM не трогает.
+AB_FLUSH_INTERVAL = float(os.getenv("AB_FLUSH_INTERVAL", "60"))
+AB_DISABLED = {name for name in os.getenv("AB_DISABLED", "").split(",") if name}  # выключенные — всем control
+
+class Experiment:
+    def __init__(self, name: str, variants: tuple, goals: tuple):
+        self.name = name
+        self.variants = variants  # первый — контрольный
+        self.goals = goals
+
+    def variant(self, user_id: int) -> str:
+        if self.name in AB_DISABLED:
+            return self.variants[0]
+        digest = hashlib.blake2b(b"%d" % user_id, digest_size=8, key=self.name.encode()).digest()
+        return self.variants[int.from_bytes(digest, "big") % len(self.variants)]
+
+WELCOME_EXPERIMENT = Experiment("welcome_caption", ("control", "short"), goals=("agree_conditions", COURSE_DONE))
+OBJECTIONS_EXPERIMENT = Experiment("objections_order", ("control", "money_first"), goals=("rules", COURSE_DONE))
+EXPERIMENTS = (WELCOME_EXPERIMENT, OBJECTIONS_EXPERIMENT)
+
+ab_counts: defaultdict = defaultdict(int)  # (тенант, эксперимент, вариант, событие) -> сколько стажёров
+ab_flush_lock = asyncio.Lock()  # /experiments и периодический сброс не пишут experiments.json одновременно
+ab_flush_task: asyncio.Task | None = None
+
+async def _count_once(user_id: int, experiment: Experiment, event: str):
+    bucket = await storage.get_bucket(chat=user_id, user=user_id)
+    marks = bucket.get("ab", [])
+    mark = f"{experiment.name}:{event}"
+    if mark in marks:
+        return
+    await storage.update_bucket(chat=user_id, user=user_id, ab=marks + [mark])
+    ab_counts[(current_tenant().name, experiment.name, experiment.variant(user_id), event)] += 1
+
+async def expose(experiment: Experiment, user_id: int) -> str:
+    """Вариант для показа шага; первый показ стажёру засчитывается."""
+    await _count_once(user_id, experiment, "exposure")
+    return experiment.variant(user_id)
+
+async def record_goal(user_id: int, step: str | None):
+    for experiment in EXPERIMENTS:
+        if step in experiment.goals:
+            await _count_once(user_id, experiment, f"goal:{step}")
+
+def _merge_experiments(path: Path, counts: dict):
+    totals = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    for (name, variant, event), n in counts.items():
+        events = totals.setdefault(name, {}).setdefault(variant, {})
+        events[event] = events.get(event, 0) + n
+    _write_json(path, totals)
+
+async def flush_experiments():
+    # пока файл пишется в потоке, хендлеры дописывают ab_counts; вычитаем только то, что уже на диске,
+    # а при ошибке записи счётчики остаются в памяти до следующего сброса
+    async with ab_flush_lock:
+        by_tenant = defaultdict(dict)
+        for (tenant_name, *key), n in list(ab_counts.items()):
+            by_tenant[tenant_name][tuple(key)] = n
+        for tenant in TENANTS:
+            if tenant.name not in by_tenant:
+                continue
+            counts = by_tenant[tenant.name]
+            try:
+                await asyncio.to_thread(_merge_experiments, tenant.experiments_file, counts)
+            except OSError:
+                logger.exception("Не удалось сохранить счётчики экспериментов %s", tenant.name)
+                continue
+            for key, n in counts.items():
+                key = (tenant.name, *key)
+                ab_counts[key] -= n
+                if not ab_counts[key]:
+                    del ab_counts[key]
+
+async def flush_experiments_periodically():
+    while True:
+        await asyncio.sleep(AB_FLUSH_INTERVAL)
+        await flush_experiments()
+
+@owner_command("experiments")
+async def cmd_experiments(message: types.Message):
+    """/experiments — сколько стажёров увидели каждый вариант и дошли до целей (только владелец)."""
+    tenant = current_tenant()
+    await flush_experiments()
+    totals = json.loads(tenant.experiments_file.read_text(encoding="utf-8")) if tenant.experiments_file.exists() else {}
+    lines = []
+    for experiment in EXPERIMENTS:
+        off = " (выключен)" if experiment.name in AB_DISABLED else ""
+        lines.append(f"🧪 {experiment.name}{off}")
+        for variant in experiment.variants:
+            events = totals.get(experiment.name, {}).get(variant, {})
+            shown = events.get("exposure", 0)
+            goals = ", ".join(
+                f"{goal} {events.get(f'goal:{goal}', 0)}"
+                + (f" ({events.get(f'goal:{goal}', 0) / shown:.0%})" if shown else "")
+                for goal in experiment.goals
+            )
+            lines.append(f"  {variant}: увидели {shown}; {goals}")
+    await bot.send_message(message.chat.id, "\n".join(lines))
+
+# ======================== Экспорт ответов (только владелец) ========================
+EXPORT_COLUMNS = ("ts", "user_id", "username", "full_name", "question", "answer")
+
+def iter_answers(date_from: date | None = None, date_to: date | None = None):
+    """Построчно читаем answers.jsonl тенанта — в памяти всегда одна запись."""
+    answers_file = current_tenant().answers_file
+    if not answers_file.exists():
+        return
+    with answers_file.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                day = datetime.fromisoformat(record["ts"]).date()
+            except (ValueError, KeyError):
+                continue
+            if date_from and day < date_from:
+                continue
+            if date_to and day > date_to:
+                continue
+            yield record
+
+def iter_rows(records):
+    yield EXPORT_COLUMNS
+    for record in records:
+        yield tuple(str(record.get(col, "")) for col in EXPORT_COLUMNS)
+
+def write_csv(rows, out):
+    import csv
+
+    # utf-8-sig — чтобы Excel сразу открыл кириллицу
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    for row in rows:
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="answers" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+# управляющие символы запрещены в XML — выкидываем их из ответов
+_XML_ILLEGAL = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+def write_xlsx(rows, out):
+    """Минимальный XLSX: лист пишется потоком прямо в zip, без загрузки всей таблицы в память."""
+    import zipfile
+    from xml.sax.saxutils import escape as xml_escape
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC.items():
+            zf.writestr(name, content)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for row in rows:
+                cells = "".join(
+                    f'<c t="inlineStr"><is><t xml:space="preserve">{xml_escape(value.translate(_XML_ILLEGAL))}</t></is></c>'
+                    for value in row
+                )
+                sheet.write(f"<row>{cells}</row>".encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+
+EXPORT_WRITERS = {"csv": write_csv, "xlsx": write_xlsx}
+
+def build_export(fmt: str, date_from: date | None, date_to: date | None):
+    """Собираем выгрузку во временный файл на диске и возвращаем его (позиция — начало)."""
+    import tempfile
+
+    out = tempfile.TemporaryFile()
+    EXPORT_WRITERS[fmt](iter_rows(iter_answers(date_from, date_to)), out)
+    out.seek(0)
+    return out
+
+@owner_command("export")
+async def cmd_export(message: types.Message):
+    """/export [csv|xlsx] [YYYY-MM-DD] [YYYY-MM-DD] — выгрузка ответов стажёров."""
+    args = message.get_args().split()
+    fmt = "csv"
+    if args and args[0].lower() in EXPORT_WRITERS:
+        fmt = args.pop(0).lower()
+    try:
+        date_from = date.fromisoformat(args[0]) if len(args) > 0 else None
+        date_to = date.fromisoformat(args[1]) if len(args) > 1 else None
+    except ValueError:
+        await bot.send_message(message.chat.id, "Формат: /export [csv|xlsx] [YYYY-MM-DD] [YYYY-MM-DD]")
+        return
+
+    out = await asyncio.to_thread(build_export, fmt, date_from, date_to)
+    try:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M")
+        await bot.send_document(message.chat.id, InputFile(out, filename=f"answers_{stamp}.{fmt}"))
+    finally:
+        out.close()
+
+
+# ======================== Рассылка по всем стажёрам (только владелец) ========================
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # сообщений/с; глобальный потолок Telegram — 30
+BROADCAST_BATCH = int(os.getenv("BROADCAST_BATCH", "100"))  # чатов между сохранениями чекпоинта
+BROADCAST_ATTEMPTS = 3  # попыток на чат, пока breaker разомкнут; 429 повторяет сам CourseBot
+# стажёр заблокировал бота или удалил аккаунт — повтор бесполезен
+UNREACHABLE_ERRORS = (BotBlocked, CantInitiateConversation, ChatNotFound, UserDeactivated)
+
+class RateLimiter:
+    """Token bucket: в среднем rate отправок в секунду, всплеск не больше burst."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Флуд-контроль: ждут все отправители, а не только получивший RetryAfter."""
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def sorted_chats(keys: list) -> array:
+    """id личных чатов из ключей storage.data по возрастанию — 8 байт на чат; считается в потоке."""
+    return array("q", sorted(chat for chat in map(int, keys) if chat > 0))
+
+def _write_json(path: Path, obj: dict):
+    _write_text(path, json.dumps(obj, ensure_ascii=False))
+
+class Broadcast:
+    """Одна рассылка: курсор, статистика и статус живут в broadcast.json тенанта.
+
+    Получатели — снимок id чатов на момент старта (после рестарта — снимок заново), отсортированный один раз;
+    курсор — последний обработанный id, продолжение ищется в снимке бинарным поиском. Стажёры, пришедшие
+    во время рассылки, в неё не попадают.
+    """
+
+    def __init__(self, state: dict):
+        self.state = state
+        self.limiter = RateLimiter(BROADCAST_RATE, burst=5)
+        self.task: asyncio.Task | None = None
+        self.started = time.monotonic()
+        self.processed_before = self.processed
+
+    @classmethod
+    def new(cls, content: dict) -> "Broadcast":
+        return cls({
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "content": content,  # {"text": ...} или {"from_chat_id": ..., "message_id": ...}
+            "cursor": 0,
+            "status": "running",
+            "stats": {"sent": 0, "unreachable": 0, "failed": 0, "retried": 0},
+        })
+
+    @property
+    def processed(self) -> int:
+        stats = self.state["stats"]
+        return stats["sent"] + stats["unreachable"] + stats["failed"]
+
+    @property
+    def rate(self) -> float:
+        return (self.processed - self.processed_before) / max(time.monotonic() - self.started, 1e-9)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def summary(self) -> str:
+        stats = self.state["stats"]
+        return (f"доставлено {stats['sent']}, недоступны {stats['unreachable']}, ошибок {stats['failed']}, "
+                f"повторов {stats['retried']} · {self.rate:.1f} сообщ/с")
+
+    async def run(self):
+        # задача создаётся из хендлера и наследует его контекст — отвязываемся от апдейта
+        trace_var.set(None)
+        update_id_var.set(None)
+        try:
+            # копия ключей — в loop (list(dict) — один вызов C), разбор и сортировка — в потоке
+            snapshot = await asyncio.to_thread(sorted_chats, list(current_tenant().storage.data))
+            position = bisect.bisect_right(snapshot, self.state["cursor"])
+            while self.state["status"] == "running":
+                chats = snapshot[position:position + BROADCAST_BATCH]
+                if not chats:
+                    self.state["status"] = "done"
+                    break
+                await asyncio.gather(*(self._deliver(chat) for chat in chats))
+                # курсор двигается только после всей пачки: при падении пачка уйдёт повторно, но никто не пропущен
+                position += len(chats)
+                self.state["cursor"] = chats[-1]
+                await asyncio.to_thread(_write_json, current_tenant().broadcast_file, self.state)
+                logger.info("📣 Рассылка: курсор %s, %s", chats[-1], self.summary(), extra={"event": "broadcast"})
+        except asyncio.CancelledError:
+            raise  # остановка бота: статус остаётся running, продолжим после рестарта
+        except Exception:
+            logger.exception("Рассылка прервана ошибкой")
+            self.state["status"] = "failed"
+        await asyncio.to_thread(_write_json, current_tenant().broadcast_file, self.state)
+        logger.info("📣 Рассылка %s: %s", self.state["status"], self.summary(), extra={"event": "broadcast"})
+        try:
+            await bot.send_message(current_tenant().owner_chat_id, f"📣 Рассылка: {self.state['status']}\n{self.summary()}")
+        except TelegramAPIError:
+            logger.exception("Не удалось отправить отчёт о рассылке")
+
+    async def _deliver(self, chat: int):
+        stats = self.state["stats"]
+        for _ in range(BROADCAST_ATTEMPTS):
+            await self.limiter.acquire()
+            try:
+                # рассылка второстепенна: при деградации Bot API уступаем место живым диалогам
+                with nonessential():
+                    await self._send(chat)  # флуд-контроль (429) выжидает и повторяет CourseBot — здесь только итог
+            except CircuitOpen:
+                self.limiter.pause(BREAKER_COOLDOWN)  # запрос не уходил — ждём восстановления и пробуем чат снова
+            except UNREACHABLE_ERRORS:
+                stats["unreachable"] += 1
+                return
+            except TelegramAPIError as e:
+                logger.warning("Рассылка: чат %s — %s", chat, e, extra={"event": "broadcast"})
+                stats["failed"] += 1
+                return
+            else:
+                stats["sent"] += 1
+                return
+            stats["retried"] += 1
+        stats["failed"] += 1
+
+    async def _send(self, chat: int):
+        content = self.state["content"]
+        if "text" in content:
+            await bot.send_message(chat, content["text"])
+        else:
+            await bot.copy_message(chat, content["from_chat_id"], content["message_id"])
+
+def resume_broadcast(tenant: Tenant):
+    """Вызывается на старте: незавершённая рассылка продолжается с сохранённого курсора."""
+    try:
+        state = json.loads(tenant.broadcast_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    if state.get("status") == "running":
+        tenant.broadcast = Broadcast(state)
+        tenant.broadcast.start()
+        logger.warning("📣 %s: продолжаем рассылку с курсора %s", tenant.name, state["cursor"])
+
+@owner_command("broadcast")
+async def cmd_broadcast(message: types.Message):
+    """/broadcast <текст> или ответом на сообщение — разослать всем стажёрам."""
+    tenant = current_tenant()
+    broadcast = tenant.broadcast
+    if broadcast and broadcast.state["status"] == "running":
+        await bot.send_message(message.chat.id, "Рассылка уже идёт: " + broadcast.summary())
+        return
+
+    if message.reply_to_message:
+        content = {"from_chat_id": message.chat.id, "message_id": message.reply_to_message.message_id}
+    elif message.get_args():
+        content = {"text": message.get_args()}
+    else:
+        await bot.send_message(message.chat.id, "Формат: /broadcast <текст> или ответом на сообщение для рассылки")
+        return
+
+    broadcast = tenant.broadcast = Broadcast.new(content)
+    await asyncio.to_thread(_write_json, tenant.broadcast_file, broadcast.state)
+    broadcast.start()
+    await bot.send_message(message.chat.id, f"📣 Рассылка запущена ({len(tenant.storage.data)} чатов в хранилище)")
+
+@owner_command("broadcast_status", "broadcast_cancel")
+async def cmd_broadcast_control(message: types.Message):
+    tenant = current_tenant()
+    broadcast = tenant.broadcast
+    if not broadcast:
+        await bot.send_message(message.chat.id, "Рассылок не было")
+        return
+    if message.get_command(pure=True) == "broadcast_cancel" and broadcast.state["status"] == "running":
+        broadcast.state["status"] = "cancelled"  # текущая пачка дойдёт, следующая не начнётся
+    await bot.send_message(message.chat.id, f"📣 {broadcast.state['status']}, курсор {broadcast.state['cursor']}\n"
+                                            f"{broadcast.summary()}")
+
+
+# ======================== Напоминания застрявшим стажёрам ========================
+# У стажёра не больше одного живого таймера; его срок лежит в bucket FSM рядом с чекпоинтом:
+#   {"reminder": {"ts": 1700000000, "due": 28333420}} — ts чекпоинта, от которого считали, и минута срабатывания.
+# Чекпоинт ставит таймер, только если живого нет (или живой сработает позже нужного — см. save_checkpoint).
+# Двигался ли стажёр, проверяем при срабатывании: ts чекпоинта новее — тот же таймер переносится на
+# REMINDER_AFTER[0] от нового чекпоинта. Из кучи таймеры не удаляются: срабатывание, чей срок не совпал
+# с записанным в bucket, — заменённый таймер, его выбрасываем. Так куча растёт по числу стажёров,
+# а не шагов, и дубль напоминания невозможен.
+REMINDER_AFTER = [float(h) for h in os.getenv("REMINDER_AFTER_HOURS", "24,72").split(",") if h.strip()]
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "5"))  # сообщений/с; делим лимит Telegram с рассылкой
+REMINDER_FLUSH_INTERVAL = 60  # с; как часто сбрасывать очередь на диск
+REMINDER_IDLE_SLEEP = 60  # с; максимум сна цикла, чтобы подхватить таймеры, поставленные после засыпания
+
+# таймер — пара 64-битных чисел подряд в одном array('Q'): ключ (минута срабатывания | номер напоминания)
+# и id стажёра. Куча упорядочена по ключу: старшие биты — время. id отдельным словом, потому что
+# у id Telegram до 52 значащих бит — вместе с минутой в одно число они не помещаются
+_REMINDER_ATTEMPT_BITS = 2
+
+class ReminderQueue:
+    """Min-heap таймеров в array('Q'): 16 байт на таймер, миллион ожидающих — 16 МБ, без объекта на запись."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.heap = array("Q")  # [ключ0, id0, ключ1, id1, …]
+        if path.exists():
+            self.heap.frombytes(path.read_bytes())
+            for pos in reversed(range(len(self) // 2)):
+                self._sift_down(pos, self.heap[2 * pos], self.heap[2 * pos + 1])
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.heap) // 2
+
+    def schedule(self, user: int, since_ts: int, attempt: int = 0) -> dict | None:
+        """Ставит таймер; возвращает запись для bucket["reminder"] (None — напоминать больше нечего)."""
+        if attempt >= len(REMINDER_AFTER):
+            return None
+        due = self.due(since_ts, attempt)
+        self.push((due << _REMINDER_ATTEMPT_BITS | attempt, user))
+        return {"ts": since_ts, "due": due}
+
+    @staticmethod
+    def due(since_ts: int, attempt: int = 0) -> int:
+        return (since_ts + int(REMINDER_AFTER[attempt] * 3600)) // 60
+
+    @staticmethod
+    def unpack(timer: tuple) -> tuple:
+        key, user = timer
+        return key >> _REMINDER_ATTEMPT_BITS, key & (1 << _REMINDER_ATTEMPT_BITS) - 1, user
+
+    def timers(self):
+        """Таймеры (ключ, id) в порядке кучи."""
+        heap = self.heap
+        return ((heap[i], heap[i + 1]) for i in range(0, len(heap), 2))
+
+    def next_due(self) -> int | None:
+        """Минута ближайшего таймера."""
+        return self.heap[0] >> _REMINDER_ATTEMPT_BITS if self.heap else None
+
+    def push(self, timer: tuple):
+        key, user = timer
+        heap = self.heap
+        heap.extend(timer)
+        pos = len(self) - 1
+        while pos:
+            parent = (pos - 1) >> 1
+            if heap[2 * parent] <= key:
+                break
+            heap[2 * pos], heap[2 * pos + 1] = heap[2 * parent], heap[2 * parent + 1]
+            pos = parent
+        heap[2 * pos], heap[2 * pos + 1] = key, user
+        self.dirty = True
+
+    def pop(self) -> tuple:
+        heap = self.heap
+        user, key = heap.pop(), heap.pop()
+        self.dirty = True
+        if not heap:
+            return key, user
+        top = heap[0], heap[1]
+        self._sift_down(0, key, user)
+        return top
+
+    def _sift_down(self, pos: int, key: int, user: int):
+        heap, size = self.heap, len(self)
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[2 * child + 2] < heap[2 * child]:
+                child += 1
+            if key <= heap[2 * child]:
+                break
+            heap[2 * pos], heap[2 * pos + 1] = heap[2 * child], heap[2 * child + 1]
+            pos = child
+        heap[2 * pos], heap[2 * pos + 1] = key, user
+
+    async def save(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = self.heap.tobytes()  # снимок в loop, пишем в потоке
+        await asyncio.to_thread(_write_bytes, self.path, data)
+
+def _write_bytes(path: Path, data: bytes):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+async def _set_reminder(tenant: Tenant, user: int, reminder: dict | None):
+    bucket = await tenant.storage.get_bucket(chat=user, user=user)
+    bucket["reminder"] = reminder
+    await tenant.storage.set_bucket(chat=user, user=user, bucket=bucket)
+
+async def send_reminder(tenant: Tenant, user: int, due: int, attempt: int, limiter: RateLimiter) -> bool:
+    """Отправляет напоминание, если стажёр так и стоит на месте. False — повторить позже."""
+    bucket = await tenant.storage.get_bucket(chat=user, user=user)
+    reminder, checkpoint = bucket.get("reminder"), bucket.get("checkpoint")
+    if not reminder or reminder["due"] != due:
+        return True  # таймер заменён — живой у стажёра другой
+    if not checkpoint or checkpoint.get("step") == COURSE_DONE:
+        await _set_reminder(tenant, user, None)
+        return True
+    if checkpoint["ts"] != reminder["ts"]:
+        # стажёр двигался после постановки таймера — отсчёт заново от нового чекпоинта
+        await _set_reminder(tenant, user, tenant.reminders.schedule(user, checkpoint["ts"]))
+        return True
+    locale_var.set(checkpoint.get("locale", DEFAULT_LOCALE))
+    kb = InlineKeyboardMarkup().add(InlineKeyboardButton(t("▶️ Продолжить"), callback_data=cb("resume")))
+    await limiter.acquire()
+    try:
+        with nonessential():
+            await tenant.bot.send_message(
+                user, t("👋 Ты остановился(-ась) на середине обучения. Продолжим с того же места?"), reply_markup=kb)
+    except RetryAfter as e:
+        limiter.pause(e.timeout)
+        return False
+    except CircuitOpen:
+        limiter.pause(BREAKER_COOLDOWN)
+        return False
+    except UNREACHABLE_ERRORS:
+        await _set_reminder(tenant, user, None)
+        return True
+    except TelegramAPIError as e:
+        logger.warning("Напоминание: чат %s — %s", user, e, extra={"event": "reminder"})
+        await _set_reminder(tenant, user, None)
+        return True
+    await _set_reminder(tenant, user, tenant.reminders.schedule(user, checkpoint["ts"], attempt + 1))
+    return True
+
+async def fire_reminders(tenant: Tenant, limiter: RateLimiter, now: int):
+    """Срабатывают таймеры со сроком до минуты now включительно."""
+    queue = tenant.reminders
+    while queue.heap and queue.next_due() <= now:
+        timer = queue.pop()
+        due, attempt, user = queue.unpack(timer)
+        try:
+            delivered = await send_reminder(tenant, user, due, attempt, limiter)
+        except Exception:
+            logger.exception("Напоминание: чат %s", user, extra={"event": "reminder"})
+            delivered = True
+        if not delivered:
+            queue.push(timer)  # срок уже наступил — следующий проход возьмёт его после паузы лимитера
+            break
+
+async def run_reminders(tenant: Tenant):
+    """Цикл тенанта: спит до ближайшего таймера, срабатывания шлёт через RateLimiter."""
+    use_tenant(tenant)
+    queue, limiter = tenant.reminders, RateLimiter(REMINDER_RATE, burst=1)
+    flushed = time.monotonic()
+    try:
+        while True:
+            await fire_reminders(tenant, limiter, int(time.time() // 60))
+            if time.monotonic() - flushed >= REMINDER_FLUSH_INTERVAL:
+                await queue.save()
+                flushed = time.monotonic()
+            next_due = queue.next_due()
+            delay = REMINDER_IDLE_SLEEP if next_due is None else (next_due * 60 - time.time())
+            await asyncio.sleep(min(max(delay, 1), REMINDER_IDLE_SLEEP))
+    finally:
+        await queue.save()
+
+
+# ======================== Здоровье процесса: /healthz и /readyz ========================
+HEALTH_LAG_INTERVAL = 1.0  # с; как часто меряем задержку event loop
+HEALTH_MAX_LAG = float(os.getenv("HEALTH_MAX_LAG", "5"))  # с; больше — loop считаем зависшим
+HEALTH_MAX_UNSAVED = float(os.getenv("HEALTH_MAX_UNSAVED", "60"))  # с; дольше FSM-правки не на диске — не готовы
+
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))  # дольше без возврата в loop — блокирующий вызов
+SLOW_REPORT_INTERVAL = float(os.getenv("SLOW_REPORT_INTERVAL", "600"))  # с; топ блокировок в лог
+SLOW_REPORT_TOP = 10
+LOOP_DEBUG = os.getenv("LOOP_DEBUG") == "1"  # asyncio debug: заметно медленнее, включать только для разбора
+
+started = False  # on_startup завершён — вебхуки выставлены, можно принимать трафик
+loop_lag = 0.0  # последняя измеренная задержка event loop, с
+lag_monitor_task: asyncio.Task | None = None
+shutdown_task: asyncio.Task | None = None
+
+class LoopWatchdog:
+    """Поток-сторож: каждые threshold секунд пингует loop; не ответил — снимает стек потока loop.
+
+    Стек снимается, пока блокировка ещё идёт, поэтому виден сам виновник (хендлер и строка),
+    а не то, что выполнялось после. Длительность дописывается, когда loop наконец ответит на пинг.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.stalls: dict = {}  # место в коде -> {"count", "total", "max", "stack"}
+        self.count = 0
+        self.worst = 0.0
+        self._lock = threading.Lock()  # общие поля сторожа и loop: stalls/count/worst и пинг с образцом
+        self._stop = threading.Event()
+        self._ping_sent: float | None = None  # время пинга, на который loop ещё не ответил
+        self._sample: tuple | None = None  # (время пинга, место, стек) — образец принадлежит своему пингу
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        threading.Thread(target=self._run, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.threshold):
+            try:
+                self._check()
+            except Exception:  # поток-сторож не должен тихо умереть — мониторинг блокировок пропал бы
+                logger.exception("Сторож loop: ошибка проверки", extra={"event": "slow_callback"})
+
+    def _check(self):
+        with self._lock:
+            ping, sampled = self._ping_sent, self._sample is not None
+            if ping is None:
+                ping = self._ping_sent = time.monotonic()
+                self.loop.call_soon_threadsafe(self._pong, ping)
+                return
+        if sampled or time.monotonic() - ping < self.threshold:
+            return
+        frame = sys._current_frames().get(self.loop_thread)
+        if frame is None:
+            return
+        where, stack = self._locate(frame)
+        with self._lock:
+            if self._ping_sent == ping:  # loop мог ответить, пока снимали стек, — тогда образец не его
+                self._sample = (ping, where, stack)
+
+    @staticmethod
+    def _locate(frame) -> tuple:
+        """Самый глубокий кадр нашего кода — он и виноват; стек — для отчёта."""
+        stack = traceback.extract_stack(frame)
+        ours = [entry for entry in stack if entry.filename.endswith(("telegram_bot.py", "screening.py"))]
+        culprit = (ours or stack)[-1]
+        return f"{culprit.name} ({Path(culprit.filename).name}:{culprit.lineno})", "".join(stack.format()[-8:])
+
+    def _pong(self, ping: float):
+        duration = time.monotonic() - ping
+        with self._lock:
+            if self._ping_sent != ping:
+                return
+            sample, self._sample, self._ping_sent = self._sample, None, None
+            if sample is None or sample[0] != ping or duration < self.threshold:
+                return
+            _, where, stack = sample
+            self.count += 1
+            self.worst = max(self.worst, duration)
+            stall = self.stalls.setdefault(where, {"count": 0, "total": 0.0, "max": 0.0, "stack": stack})
+            stall["count"] += 1
+            stall["total"] += duration
+            if duration > stall["max"]:
+                stall["max"], stall["stack"] = duration, stack
+        logger.debug("🐢 Loop заблокирован на %.0f мс: %s", duration * 1000, where, extra={"event": "slow_callback"})
+
+    def top(self, n: int = SLOW_REPORT_TOP) -> list:
+        with self._lock:
+            return sorted(self.stalls.items(), key=lambda item: item[1]["total"], reverse=True)[:n]
+
+    def report(self, n: int = SLOW_REPORT_TOP, stacks: bool = False) -> str:
+        lines = [f"Блокировок loop > {self.threshold * 1000:.0f} мс: {self.count}, худшая {self.worst * 1000:.0f} мс"]
+        for where, stall in self.top(n):
+            lines.append(f"  {stall['total'] * 1000:8.0f} мс всего, {stall['count']}×, макс {stall['max'] * 1000:.0f} мс — "
+                         f"{where}")
+            if stacks:
+                lines.append(stall["stack"].rstrip())
+        return "\n".join(lines)
+
+watchdog = LoopWatchdog(SLOW_CALLBACK_MS / 1000)
+
+async def monitor_loop_lag():
+    """Просыпаемся каждые HEALTH_LAG_INTERVAL; насколько позже положенного — настолько loop занят."""
+    global loop_lag
+    loop = asyncio.get_running_loop()
+    reported, reported_count = loop.time(), 0
+    while True:
+        expected = loop.time() + HEALTH_LAG_INTERVAL
+        await asyncio.sleep(HEALTH_LAG_INTERVAL)
+        loop_lag = max(0.0, loop.time() - expected)
+        if loop_lag > HEALTH_MAX_LAG:
+            logger.warning("🐢 Event loop отстаёт на %.1f с", loop_lag, extra={"event": "health"})
+        if loop.time() - reported >= SLOW_REPORT_INTERVAL:
+            if watchdog.count > reported_count:  # новых блокировок не было — не шумим
+                logger.warning("🐢 %s", watchdog.report(), extra={"event": "slow_callback"})
+            reported, reported_count = loop.time(), watchdog.count
+
+async def healthz(request: web.Request):
+    """Liveness: процесс жив и event loop не завис. Если loop встал — этот ответ не придёт вовсе."""
+    alive = loop_lag <= HEALTH_MAX_LAG
+    return web.json_response({"status": "ok" if alive else "stuck", "loop_lag_ms": round(loop_lag * 1000, 1),
+                              "inflight_updates": len(inflight_updates), **runtime_metrics()},
+                             status=200 if alive else 503)
+
+def runtime_metrics() -> dict:
+    return {
+        "mailboxes": mailboxes.metrics(),
+        "slow_callbacks": watchdog.count,
+        "slow_callback_max_ms": round(watchdog.worst * 1000, 1),
+        "slow_callback_top": {where: {"count": stall["count"], "total_ms": round(stall["total"] * 1000, 1)}
+                              for where, stall in watchdog.top(3)},
+    }
+
+async def readyz(request: web.Request):
+    """Readiness: принимаем ли апдейты. Нет — пока стартуем, останавливаемся или Bot API недоступен."""
+    now = time.time()
+    tenants = {}
+    ready = started and not draining and loop_lag <= HEALTH_MAX_LAG
+    for tenant in TENANTS:
+        # хранилище — в памяти, чтение ничего не проверяет; проверяем, доходят ли правки до диска
+        storage, breaker = tenant.storage, tenant.bot.breaker
+        unsaved = time.monotonic() - storage.dirty_since if storage.dirty else 0.0
+        tenants[tenant.name] = {
+            "breaker_open": breaker.is_open,
+            "breaker_state": breaker.state,
+            "api_last_success_s": round(now - breaker.last_success, 1) if breaker.last_success else None,
+            "storage_unsaved_s": round(unsaved, 1),
+            "storage_flushed_s": round(now - storage.flushed_at, 1) if storage.flushed_at else None,
+            "storage_flush_error": storage.flush_error,
+            "assets": tenant.asset_problems,  # недостающие медиа курс не ломают — только видны здесь
+        }
+        ready = ready and not breaker.is_open and storage.flush_error is None and unsaved <= HEALTH_MAX_UNSAVED
+    return web.json_response({
+        "status": "ready" if ready else "not_ready",
+        "started": started, "draining": draining,
+        "loop_lag_ms": round(loop_lag * 1000, 1),
+        "inflight_updates": len(inflight_updates),
+        **runtime_metrics(),
+        "tenants": tenants,
+    }, status=200 if ready else 503)
+
+@owner_command("slow")
+async def cmd_slow(message: types.Message):
+    """/slow — топ блокировок event loop со стеками (только владелец)."""
+    text = watchdog.report(n=5, stacks=True)
+    await bot.send_message(message.chat.id, text[-4000:])  # лимит сообщения — 4096 символов
+
+
 # ======================== Webhook startup/shutdown ========================
+async def start_tenant(tenant: Tenant):
+    use_tenant(tenant)  # gather запускает каждую корутину в своей задаче — контексты тенантов не смешиваются
+    audit_assets(tenant)
+    info = await tenant.bot.get_webhook_info()
+    # secret_token getWebhookInfo не возвращает, но он выводится из токена и между деплоями не меняется
+    if info.url != tenant.webhook_url:
+        # drop_pending_updates — как skip_updates у executor, но для каждого бота
+        await tenant.bot.set_webhook(tenant.webhook_url, drop_pending_updates=True, secret_token=tenant.webhook_secret,
+                                     allowed_updates=ALLOWED_UPDATES)
+        logger.info("✅ Webhook установлен: %s", tenant.name)
+    elif set(info.allowed_updates or ()) != set(ALLOWED_UPDATES):
+        # вебхук наш, но на другие типы апдейтов: переставляем, ожидающие апдейты сохраняем
+        await tenant.bot.set_webhook(tenant.webhook_url, secret_token=tenant.webhook_secret,
+                                     allowed_updates=ALLOWED_UPDATES)
+        logger.info("✅ Webhook обновлён: %s (allowed_updates %s)", tenant.name, ", ".join(ALLOWED_UPDATES))
+    else:
+        # рестарт/пробуждение после простоя: вебхук уже наш, а ожидающие апдейты (включая разбудивший нас) не сбрасываем
+        logger.info("✅ Webhook уже установлен: %s (ожидают %s апдейтов)", tenant.name, info.pending_update_count)
+    tenant.storage_task = asyncio.create_task(tenant.storage.flush_periodically())
+    resume_broadcast(tenant)
+    if REMINDER_AFTER:
+        tenant.reminders_task = asyncio.create_task(run_reminders(tenant))
+
+async def drain_updates():
+    """Перестаём брать апдейты и до DRAIN_TIMEOUT ждём начатые хендлеры и скрининг ответов."""
+    global draining
+    draining = True
+    screeners = [tenant.__dict__["screener"] for tenant in TENANTS if "screener" in tenant.__dict__]
+    pending = {task for task in inflight_updates if not task.done()}
+    pending.update(task for screener in screeners for task in screener.tasks)
+    if not pending:
+        return
+    logger.warning("⏳ Дожидаемся %s начатых задач (до %.0f с)...", len(pending), DRAIN_TIMEOUT,
+                   extra={"event": "shutdown"})
+    _, pending = await asyncio.wait(pending, timeout=DRAIN_TIMEOUT)
+    if pending:
+        # чекпоинт пишется только после шага целиком — стажёр продолжит с последнего законченного шага,
+        # а сами апдейты без ответа 2xx Telegram доставит новому процессу
+        logger.warning("⏹️ Не успели за %.0f с: %s задач прерваны", DRAIN_TIMEOUT, len(pending),
+                       extra={"event": "shutdown"})
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def stop_tenant(tenant: Tenant):
+    use_tenant(tenant)
+    # вебхук не снимаем: апдейты, пришедшие во время редеплоя, Telegram придержит и отдаст новому процессу
+    broadcast = tenant.broadcast
+    if broadcast and broadcast.task and not broadcast.task.done():
+        broadcast.task.cancel()  # чекпоинт уже на диске — после рестарта продолжим с него
+        await asyncio.gather(broadcast.task, return_exceptions=True)
+    if tenant.reminders_task:
+        tenant.reminders_task.cancel()  # finally цикла сохранит очередь
+        await asyncio.gather(tenant.reminders_task, return_exceptions=True)
+    if tenant.storage_task:
+        tenant.storage_task.cancel()  # finally допишет последние изменения; close() executor'а — ещё раз
+        await asyncio.gather(tenant.storage_task, return_exceptions=True)
+
 async def on_startup(dp):
-    await bot.delete_webhook()
-    await bot.set_webhook(WEBHOOK_URL)
-    logger.info(f"✅ Webhook установлен: {WEBHOOK_URL}")
+    start_screening_pool()  # до первого потока, кроме логов, — см. «Пул скрининга ответов»
+    await asyncio.gather(*(start_tenant(tenant) for tenant in TENANTS))
+    global ab_flush_task, lag_monitor_task, started
+    ab_flush_task = asyncio.create_task(flush_experiments_periodically())
+    lag_monitor_task = asyncio.create_task(monitor_loop_lag())
+    loop = asyncio.get_running_loop()
+    with contextlib.suppress(NotImplementedError):  # на Windows сигналов в loop нет — останется обработчик aiohttp
+        loop.add_signal_handler(signal.SIGTERM, begin_shutdown)  # заменяет обработчик, поставленный run_app
+    watchdog.start(loop)
+    if LOOP_DEBUG:
+        # asyncio сам залогирует каждый колбэк дольше порога вместе с задачей, которая его запустила
+        loop.set_debug(True)
+        loop.slow_callback_duration = SLOW_CALLBACK_MS / 1000
+    started = True
+    logger.info("🚀 Готов к приёму апдейтов через %.2f с после старта процесса", time.perf_counter() - STARTUP_T0,
+                extra={"event": "startup"})
+
+def begin_shutdown():
+    """SIGTERM: дренаж, пока сокет ещё открыт, — новые апдейты получают 503, начатые успевают ответить 2xx.
+
+    Штатный обработчик aiohttp сразу закрыл бы listener (site.stop раньше on_shutdown), и ответы
+    прерванных апдейтов уходили бы в закрытые соединения. После дренажа — обычная остановка aiohttp.
+    """
+    global shutdown_task
+    if shutdown_task is None:
+        logger.warning("⏹️ SIGTERM: новые апдейты — 503, дожидаемся начатых", extra={"event": "shutdown"})
+        shutdown_task = asyncio.create_task(_drain_and_exit())
+
+async def _drain_and_exit():
+    await drain_updates()
+    asyncio.get_running_loop().call_soon(_graceful_exit)
+
+def _graceful_exit():
+    raise web.GracefulExit()  # как у aiohttp: run_app поймает и выполнит runner.cleanup → on_shutdown
 
 async def on_shutdown(dp):
     logger.warning("⏹️ Остановка бота...")
-    try:
-        await bot.delete_webhook()
-    except Exception as e:
-        logger.error(f"Ошибка при удалении вебхука: {e}")
-    await bot.close()
-    logger.info("🛑 Webhook удалён и бот остановлен.")
+    await drain_updates()
+    await asyncio.gather(*(stop_tenant(tenant) for tenant in TENANTS))
+    if ab_flush_task:
+        ab_flush_task.cancel()
+    if lag_monitor_task:
+        lag_monitor_task.cancel()
+    watchdog.stop()
+    await flush_experiments()
+    AnswerScreener.shutdown()
+    await dp.bot.close()  # сессия общая — закрываем один раз
+    logger.info("🛑 Бот остановлен, состояние сохранено.")
+
+def make_web_app() -> web.Application:
+    """Своё приложение aiohttp — ради webhook_guard и лимита тела; один маршрут вебхука на всех тенантов."""
+    app = web.Application(middlewares=[webhook_guard], client_max_size=WEBHOOK_MAX_BODY)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_route("*", WEBHOOK_PATH, TenantWebhookHandler)
+    app[BOT_DISPATCHER_KEY] = dp
+    return app
+
+class CourseExecutor(Executor):
+    async def _welcome(self):
+        pass  # getMe на старте не нужен: id бота есть в токене — минус один запрос до первого апдейта
+
+def profile_startup():
+    """--profile-startup: из чего складывается холодный старт (без запуска сервера и запросов к API)."""
+    import subprocess
+
+    # время импорта — из python -X importtime в чистом процессе
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import telegram_bot"],
+                          capture_output=True, text=True, env={**os.environ, "LOG_LEVEL": "WARNING"})
+    imports, children = [], []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name, depth = parts[2].strip(), len(parts[2]) - len(parts[2].lstrip())
+        if depth == 1:  # модуль верхнего уровня; его прямые импорты напечатаны перед ним
+            if name == "telegram_bot":
+                imports = children
+                break
+            children = []
+        elif depth == 3:
+            children.append((int(parts[1]) / 1000, name))
+    print("Импорт (суммарно с зависимостями):")
+    for ms, name in sorted(imports, reverse=True)[:15]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    print("Инициализация модуля:")
+    previous = STARTUP_T0
+    for phase, at in STARTUP_MARKS:
+        print(f"  {(at - previous) * 1000:8.1f} ms  {phase}")
+        previous = at
+    print(f"  {(previous - STARTUP_T0) * 1000:8.1f} ms  итого до on_startup")
+    print(f"Тенантов: {len(TENANTS)}, на старте каждого — getWebhookInfo (+ setWebhook, если URL или allowed_updates не те)")
+
+def update_locales():
+    """--update-locales: дописывает в каталоги новые тексты из кода (пустыми) и убирает устаревшие."""
+    import ast
+
+    tree = ast.parse(Path(__file__).read_text(encoding="utf-8"))
+    calls = sorted((node for node in ast.walk(tree)
+                    if isinstance(node, ast.Call) and getattr(node.func, "id", None) in ("t", "N_")
+                    and node.args and isinstance(node.args[0], ast.Constant)),
+                   key=lambda node: (node.lineno, node.col_offset))
+    msgids = list(dict.fromkeys(node.args[0].value for node in calls))  # в порядке появления в коде
+    LOCALES_DIR.mkdir(exist_ok=True)
+    for path in sorted(LOCALES_DIR.glob("*.json")):
+        messages = json.loads(path.read_text(encoding="utf-8"))
+        updated = {msgid: messages.get(msgid, "") for msgid in msgids}
+        path.write_text(json.dumps(updated, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        done = sum(1 for text in updated.values() if text)
+        print(f"{path.stem}: переведено {done}/{len(msgids)}, удалено устаревших {len(messages.keys() - updated.keys())}")
+    load_catalogs()  # перевод с чужими {полями} валит и эту команду, а не только старт бота
+
+def bench_callbacks(rounds: int = 200_000):
+    """--bench-callbacks: пропускная способность cb()/decode_callback() на всех шагах курса."""
+    samples = [(step, ()) for step in CALLBACK_STEPS] + [(step, (3, 1_000_000)) for step in CALLBACK_STEPS[:4]]
+    encoded = [cb(step, *args) for step, args in samples]
+    assert [decode_callback(data) for data in encoded] == samples
+    print(f"Шагов: {len(CALLBACK_STEPS)}, длина callback_data: {min(map(len, encoded))}–{max(map(len, encoded))} "
+          f"из {CALLBACK_MAX_LEN} байт")
+    for name, func, items in (("encode", lambda item: cb(item[0], *item[1]), samples),
+                              ("decode", decode_callback, encoded)):
+        n = len(items)
+        started = time.perf_counter()
+        for i in range(rounds):
+            func(items[i % n])
+        elapsed = time.perf_counter() - started
+        print(f"  {name}: {rounds / elapsed:,.0f} оп/с ({elapsed / rounds * 1e6:.2f} мкс на операцию)")
+
+def prepare_video(source: Path, name: str):
+    """--prepare-video SRC [имя]: пережимает видео под Telegram (H.264/AAC, faststart), делает превью и метаданные."""
+    import shutil
+    import subprocess
+
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        raise SystemExit("Нужны ffmpeg и ffprobe в PATH")
+
+    def probe(path: Path) -> tuple:
+        out = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-of", "json",
+                              "-show_entries", "stream=width,height:format=duration", str(path)],
+                             capture_output=True, text=True, check=True).stdout
+        info = json.loads(out)
+        return float(info["format"]["duration"]), info["streams"][0]["width"], info["streams"][0]["height"]
+
+    duration, _, _ = probe(source)
+    target = IMAGES_DIR / name
+    tmp = target.with_suffix(".tmp.mp4")  # исходник может лежать по тому же пути
+    # битрейт под VIDEO_TARGET_BYTES: 5% на контейнер, 96 кбит/с — звук
+    video_kbps = max(200, int(VIDEO_TARGET_BYTES * 8 * 0.95 / duration / 1000) - 96)
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", str(source),
+                    "-vf", "scale='min(1280,iw)':-2", "-c:v", "libx264", "-preset", "slow", "-profile:v", "main",
+                    "-pix_fmt", "yuv420p", "-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps * 2}k",
+                    "-bufsize", f"{video_kbps * 2}k", "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart",
+                    str(tmp)], check=True)
+    os.replace(tmp, target)
+
+    duration, width, height = probe(target)
+    thumb = target.with_suffix(".thumb.jpg")  # Telegram: JPEG до 320 px по большей стороне
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-ss", str(min(1.0, duration / 2)), "-i", str(target),
+                    "-frames:v", "1", "-vf", "scale=320:320:force_original_aspect_ratio=decrease", "-q:v", "5",
+                    str(thumb)], check=True)
+    meta = {"duration": round(duration), "width": width, "height": height, "thumb": thumb.name}
+    target.with_suffix(".json").write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+    print(f"{target}: {target.stat().st_size / 1024 / 1024:.1f} МБ, {meta['duration']} с, {width}x{height}, "
+          f"превью {thumb.name}")
+
+startup_mark("handlers")
 
 if __name__ == "__main__":
-    logger.info("🚀 Запуск бота...")
-    start_webhook(
-        dispatcher=dp,
-        webhook_path=WEBHOOK_PATH,
-        on_startup=on_startup,
-        on_shutdown=on_shutdown,
-        skip_updates=True,
-        host="0.0.0.0",
-        port=PORT,
-    )
\ No newline at end of file
+    if "--profile-startup" in sys.argv:
+        profile_startup()
+        sys.exit()
+    if "--update-locales" in sys.argv:
+        update_locales()
+        sys.exit()
+    if "--bench-callbacks" in sys.argv:
+        bench_callbacks()
+        sys.exit()
+    if "--prepare-video" in sys.argv:
+        args = sys.argv[sys.argv.index("--prepare-video") + 1:]
+        prepare_video(Path(args[0]), args[1] if len(args) > 1 else COURSE_VIDEOS[0])
+        sys.exit()
+    logger.info("🚀 Запуск бота (%s)...", ", ".join(tenant.name for tenant in TENANTS))
+    executor = CourseExecutor(dp)
+    executor.on_startup(on_startup)
+    executor.on_shutdown(on_shutdown)
+    executor.set_webhook(web_app=make_web_app())  # маршрут вебхука уже в приложении; дальше как start_webhook
+    executor.run_app(host="0.0.0.0", port=PORT)